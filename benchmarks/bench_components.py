@@ -0,0 +1,151 @@
+'''
+個別元件的效能量測，不需要 event loop 也不需要網路
+
+	python -m benchmarks.bench_components --questions 20000
+
+- 題庫格式檢查 (validateQuestionFormat / loadQuestionSet)，並與收集所有錯誤之前的檢查 (baseline_format_checker) 比較
+- 題庫載入 (load_question_pack，包含建立搜尋索引)
+- 編譯過的題庫 (.sgpk) 的編譯與載入，並確認載入結果與 JSON 題庫完全相同
+- 選項搜尋與自動完成 (CandidateIndex)
+- YoutubeDL 物件的建立與從物件池借用
+'''
+import argparse, json, random, shutil
+
+from benchmarks.check_pack_format import compare_packs, make_queries
+from benchmarks.common import Timer, add_output_arguments, encode_question_set, finish, make_question_set, peak_rss, prepare_workdir
+
+def baseline_load_question_set(data):
+	# 原本開始遊戲時的流程：直接解析 JSON 後檢查格式，只回報第一個錯誤
+	from benchmarks import baseline_format_checker
+
+	question_set = json.loads(data)
+	return question_set, baseline_format_checker.validateQuestionFormat(question_set)
+
+def bench_format(timer, data, repeat):
+	from benchmarks import baseline_format_checker
+	from cogs.format_checker import loadQuestionSet, validateQuestionFormat
+
+	question_set = json.loads(data)
+	timer.measure("json_decode", json.loads, data, repeat=repeat)
+	timer.measure("baseline_validate_question_format", baseline_format_checker.validateQuestionFormat, question_set, repeat=repeat)
+	timer.measure("validate_question_format", validateQuestionFormat, question_set, repeat=repeat)
+	timer.measure("baseline_load_question_set", baseline_load_question_set, data, repeat=repeat)
+	timer.measure("load_question_set", loadQuestionSet, data, repeat=repeat)
+
+	# 錯誤很多的題庫也要能快速回報，不會因為錯誤數量拖慢
+	broken = json.loads(data)
+	for question in broken["questions"]:
+		question["vid"] = "invalid"
+	broken_data = encode_question_set(broken)
+	timer.measure("baseline_load_question_set_broken", baseline_load_question_set, broken_data, repeat=repeat)
+	timer.measure("load_question_set_broken", loadQuestionSet, broken_data, repeat=repeat)
+
+	# 新的檢查要回報與原本相同的第一個錯誤
+	for checked in (question_set, broken):
+		assert validateQuestionFormat(checked) == baseline_format_checker.validateQuestionFormat(checked)
+
+def bench_pack(timer, data, repeat):
+	from cogs import question_pack
+
+	for _ in range(repeat):
+		question_pack.loaded_packs.clear()
+		pack, errors = timer.measure("load_question_pack_cold", question_pack.load_question_pack, data)
+		assert not errors
+	timer.measure("load_question_pack_shared", question_pack.load_question_pack, data, repeat=repeat)
+	return pack
+
+def bench_compiled(timer, pack, repeat, seed):
+	from cogs import question_pack
+
+	compiled = timer.measure("compile_pack", pack.compile, repeat=repeat)
+	for _ in range(repeat):
+		question_pack.loaded_packs.clear()
+		loaded, errors = timer.measure("load_compiled_pack_cold", question_pack.load_question_pack, compiled)
+		assert not errors
+
+	# 確認量測的題庫載入結果相同，包含損毀檔案的完整檢查在 benchmarks/check_pack_format.py
+	differences = compare_packs(pack, loaded, make_queries(pack, 200, seed))
+	if loaded.compile() != compiled:
+		differences.append("recompiled pack differs")
+	assert not differences, differences
+	return len(compiled)
+
+def bench_search(timer, pack, query_count, seed):
+	from cogs.candidate_index import CandidateIndex
+
+	rng = random.Random(seed)
+	names = list(pack.candidates.values())
+	timer.measure("build_candidate_index", CandidateIndex, names)
+
+	index = pack.candidate_index
+	queries = []
+	for _ in range(query_count):
+		name = rng.choice(names)
+		tokens = name.split(" ")
+		kind = rng.random()
+		if kind < 0.4:
+			queries.append(tokens[0][:rng.randint(1, max(1, len(tokens[0])))])	# 單一關鍵字
+		elif kind < 0.8:
+			queries.append(" ".join(token[:3] for token in tokens[:2]))				# 多個關鍵字
+		else:
+			queries.append(name[:-1] + "x")											# 打錯字
+	for query in queries:
+		timer.measure("search", index.search, query, 10)
+
+	index.completions.clear()
+	for query in queries:
+		timer.measure("complete_cold", index.complete, query[:2])
+	for query in queries:
+		timer.measure("complete_cached", index.complete, query[:2])
+
+def bench_ytdlp(timer, repeat):
+	from yt_dlp import YoutubeDL
+	from cogs.song_guesser import YoutubeDLPool, ytdlp_format_options
+
+	for _ in range(repeat):
+		ytdl = timer.measure("youtube_dl_create", YoutubeDL, ytdlp_format_options)
+		ytdl.close()
+
+	pool = YoutubeDLPool(ytdlp_format_options, 1)
+	def acquire_and_release():
+		with pool.acquire("temp/downloads/bench.%(ext)s"):
+			pass
+	acquire_and_release()
+	timer.measure("youtube_dl_pool_acquire", acquire_and_release, repeat=repeat * 100)
+	pool.close()
+
+def main():
+	parser = argparse.ArgumentParser(description="SongGuesser component benchmarks")
+	parser.add_argument("--questions", type=int, default=5000, help="測試題庫的題目數量")
+	parser.add_argument("--parts", type=int, default=3, help="每題的片段數量")
+	parser.add_argument("--misleadings", type=int, default=1000, help="誤導用選項的數量")
+	parser.add_argument("--repeat", type=int, default=5, help="每個項目重複量測的次數")
+	parser.add_argument("--queries", type=int, default=2000, help="搜尋測試的查詢數量")
+	parser.add_argument("--skip-ytdlp", action="store_true", help="略過 YoutubeDL 相關的量測")
+	parser.add_argument("--seed", type=int, default=0)
+	add_output_arguments(parser)
+	args = parser.parse_args()
+
+	workdir = prepare_workdir()
+	timer = Timer()
+	data = encode_question_set(make_question_set(args.questions, args.parts, args.misleadings, seed=args.seed))
+	try:
+		bench_format(timer, data, args.repeat)
+		pack = bench_pack(timer, data, args.repeat)
+		compiled_bytes = bench_compiled(timer, pack, args.repeat, args.seed)
+		bench_search(timer, pack, args.queries, args.seed)
+		if not args.skip_ytdlp:
+			bench_ytdlp(timer, args.repeat)
+	finally:
+		shutil.rmtree(workdir, ignore_errors=True)
+
+	extra = {
+		"questions": args.questions,
+		"pack_bytes": len(data),
+		"compiled_pack_bytes": compiled_bytes,
+		"peak_rss": peak_rss(),
+	}
+	return finish(args, "SongGuesser components", timer.report(), extra)
+
+if __name__ == "__main__":
+	raise SystemExit(main())
@@ -0,0 +1,183 @@
+'''
+模擬大量伺服器同時進行猜歌遊戲的壓力測試，完全離線執行
+
+	python -m benchmarks.bench_game --guilds 200 --questions 5
+
+每個伺服器會依序執行 /開始遊戲、/猜 (關鍵字搜尋與正確答案)、/下一題、/結算、/結束遊戲
+輸出換題延遲、猜測延遲、event loop 延遲與記憶體用量的 p50/p99
+'''
+import argparse, asyncio, random, shutil, time
+
+from benchmarks.common import Timer, add_output_arguments, encode_question_set, finish, make_question_set, peak_rss, prepare_workdir
+from benchmarks.fakes import FakeAttachment, FakeBot, FakeExtractor, FakeGuild, FakeInteraction, FakeMember, write_fixtures
+
+async def sample_loop_lag(timer, interval, stop_event):
+	# 每次 sleep 實際多花的時間就是 event loop 被其他工作佔用的時間
+	loop = asyncio.get_running_loop()
+	while not stop_event.is_set():
+		begin = loop.time()
+		await asyncio.sleep(interval)
+		timer.record("loop_lag", max(0.0, loop.time() - begin - interval))
+
+def pick_keyword(rng, game):
+	# 取選項開頭的一部分當關鍵字，會走搜尋的流程
+	candidate = rng.choice(list(game.pack.candidates.values()))
+	keyword = candidate.split(" ")[0][:4]
+	if keyword.lower() in game.pack.candidates:
+		keyword += " 0"
+	return keyword
+
+async def play_guild(cog, guild, players, data, args, timer, failures, rng):
+	from cogs.song_guesser import GameStep, SongGuesser
+
+	await asyncio.sleep(rng.uniform(0, args.stagger))
+	host = players[0]
+	begin = time.perf_counter()
+	await SongGuesser.start.callback(cog, FakeInteraction(guild, host), FakeAttachment("pack.json", data), args.strict, args.warmup)
+	game = cog.games.get(guild.id)
+	if game is None or game.step != GameStep.PLAYING or not guild.voice_client.play_times:
+		failures.append(f"{guild.id}: game did not start")
+		return
+	timer.record("start_to_first_play", guild.voice_client.play_times[0] - begin)
+
+	question_count = min(args.questions, game.get_question_count())
+	for i in range(question_count):
+		for player in players:
+			keyword = pick_keyword(rng, game)
+			interaction = FakeInteraction(guild, player)
+			start = time.perf_counter()
+			await cog.guess_autocomplete(interaction, keyword[:2])
+			timer.record("autocomplete", time.perf_counter() - start)
+
+			start = time.perf_counter()
+			await SongGuesser.guess.callback(cog, interaction, keyword)
+			timer.record("guess_search", time.perf_counter() - start)
+
+		question = game.get_question(game.current_question_idx)
+		answer = game.pack.candidates[next(iter(question.candidates))]
+		start = time.perf_counter()
+		await SongGuesser.guess.callback(cog, FakeInteraction(guild, rng.choice(players)), answer)
+		timer.record("guess_correct", time.perf_counter() - start)
+		if not game.answer_guessed:
+			failures.append(f"{guild.id}: correct answer was rejected")
+
+		if i + 1 >= question_count:
+			break
+		play_count = len(guild.voice_client.play_times)
+		start = time.perf_counter()
+		await SongGuesser.question.callback(cog, FakeInteraction(guild, host))
+		if len(guild.voice_client.play_times) > play_count:
+			timer.record("question_transition", guild.voice_client.play_times[-1] - start)
+		elif game.step == GameStep.PLAYING:
+			failures.append(f"{guild.id}: question {i + 2} did not play")
+
+	await SongGuesser.settle.callback(cog, FakeInteraction(guild, host))
+	await SongGuesser.stop.callback(cog, FakeInteraction(guild, host))
+
+async def run(args, workdir):
+	from cogs import song_guesser
+	from cogs.audio_worker import audio_worker_pool
+	from cogs.metrics import metrics_options
+	from cogs.song_guesser import SongGuesser, ytdlp_pool
+
+	song_guesser.clip_extract_options["mode"] = args.mode
+	metrics_options["port"] = 0
+	source_path, clip_data = write_fixtures(workdir, with_wav=args.real_ffmpeg or args.mode == "full")
+	extractor = FakeExtractor(source_path, clip_data, args.info_latency, args.clip_latency, args.download_latency)
+	extractor.install(ytdlp_pool, None if args.real_ffmpeg else audio_worker_pool)
+
+	loop = asyncio.get_running_loop()
+	bot = FakeBot(loop)
+	cog = SongGuesser(bot)
+	# 和正式執行時一樣啟動 event loop 的監視，卡住時會印出呼叫堆疊
+	await cog.cog_load()
+	rng = random.Random(args.seed)
+
+	shared_data = encode_question_set(make_question_set(args.pack_size, args.parts, seed=args.seed))
+	tasks = []
+	timer = Timer()
+	failures = []
+	for i in range(args.guilds):
+		guild = FakeGuild()
+		bot.add_guild(guild)
+		players = []
+		for j in range(args.players):
+			player = FakeMember(guild, f"player{j}")
+			player.join(guild.voice_channel)
+			bot.users[player.id] = player
+			players.append(player)
+		data = shared_data if args.shared_pack else encode_question_set(make_question_set(args.pack_size, args.parts, vid_prefix=f"g{i}-", seed=args.seed + i))
+		tasks.append(play_guild(cog, guild, players, data, args, timer, failures, random.Random(rng.random())))
+
+	stop_event = asyncio.Event()
+	sampler = asyncio.ensure_future(sample_loop_lag(timer, args.lag_interval, stop_event))
+	begin = time.perf_counter()
+	results = await asyncio.gather(*tasks, return_exceptions=True)
+	elapsed = time.perf_counter() - begin
+	stop_event.set()
+	await sampler
+
+	# 等待被取消的下載與轉檔工作收尾，被中止的 ffmpeg 程序也需要時間回收
+	pending = [ task for task in asyncio.all_tasks() if task is not asyncio.current_task() ]
+	for task in pending:
+		task.cancel()
+	await asyncio.gather(*pending, return_exceptions=True)
+	await asyncio.sleep(0.5)
+	await cog.cog_unload()
+
+	for result in results:
+		if isinstance(result, BaseException):
+			failures.append(repr(result))
+
+	extra = {
+		"guilds": args.guilds,
+		"elapsed_s": round(elapsed, 2),
+		"peak_rss": peak_rss(),
+		"extractor_calls": extractor.calls,
+		"scheduler": song_guesser.download_scheduler.get_metrics(),
+		"failures": len(failures),
+	}
+	for failure in failures[:10]:
+		print(f"failure: {failure}")
+	return timer.report(), extra
+
+def main():
+	parser = argparse.ArgumentParser(description="SongGuesser offline load test")
+	parser.add_argument("--guilds", type=int, default=200, help="同時進行遊戲的伺服器數量")
+	parser.add_argument("--players", type=int, default=4, help="每個伺服器的玩家數量")
+	parser.add_argument("--questions", type=int, default=5, help="每場遊戲進行的題數")
+	parser.add_argument("--pack-size", type=int, default=200, help="題庫的題目數量")
+	parser.add_argument("--parts", type=int, default=3, help="每題的片段數量")
+	parser.add_argument("--distinct-packs", dest="shared_pack", action="store_false", help="每個伺服器使用不同的題庫與影片，預設所有伺服器共用同一個題庫")
+	parser.add_argument("--warmup", action="store_true", help="開始遊戲時先檢查所有影片")
+	parser.add_argument("--strict", action="store_true", help="使用嚴格模式")
+	parser.add_argument("--mode", choices=[ "range", "full" ], default="range", help="片段擷取方式，full 需要搭配 --real-ffmpeg")
+	parser.add_argument("--real-ffmpeg", action="store_true", help="以本機產生的 WAV 檔作為音源，實際執行 ffmpeg 轉檔")
+	parser.add_argument("--info-latency", type=float, default=0.2, help="模擬查詢影片資訊的秒數")
+	parser.add_argument("--clip-latency", type=float, default=0.3, help="模擬擷取一個片段的秒數 (沒有 --real-ffmpeg 時)")
+	parser.add_argument("--download-latency", type=float, default=1.0, help="模擬下載整首歌曲的秒數")
+	parser.add_argument("--stagger", type=float, default=2.0, help="各伺服器開始遊戲的時間隨機分散在幾秒內")
+	parser.add_argument("--lag-interval", type=float, default=0.01, help="量測 event loop 延遲的取樣間隔 (秒)")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--workdir", help="暫存資料夾，預設使用新的暫存資料夾並在結束後刪除")
+	add_output_arguments(parser)
+	args = parser.parse_args()
+
+	if args.mode == "full" and not args.real_ffmpeg:
+		parser.error("--mode full requires --real-ffmpeg")
+	if args.real_ffmpeg and shutil.which("ffmpeg") is None:
+		parser.error("ffmpeg not found")
+
+	workdir = prepare_workdir(args.workdir)
+	try:
+		report, extra = asyncio.run(run(args, workdir))
+	finally:
+		if not args.workdir:
+			shutil.rmtree(workdir, ignore_errors=True)
+	code = finish(args, "SongGuesser load test", report, extra)
+	if extra["failures"]:
+		code = code or 2
+	return code
+
+if __name__ == "__main__":
+	raise SystemExit(main())
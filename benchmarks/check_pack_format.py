@@ -0,0 +1,147 @@
+'''
+確認編譯過的題庫 (.sgpk) 與原本的 JSON 題庫完全相同，不需要網路
+
+	python -m benchmarks.check_pack_format --questions 2000 --seeds 5
+
+每個測試題庫都會經過 QuestionPack.from_question_set → encode_pack → decode_pack (QuestionPack.from_compiled)，並確認
+- 標題、作者與所有選項相同
+- 每一題的 vid、標題、片段時間與正確答案相同
+- 搜尋與自動完成的結果相同
+- 再次編譯的結果與第一次完全相同
+- 截斷或損毀的檔案只會回報格式錯誤，不會拋出例外
+- 不經過 JSON 格式檢查直接編譯、字串長度不符的題庫會被拒絕
+有任何不同時回傳非 0 的結束代碼
+'''
+import argparse, random, shutil
+
+from benchmarks.common import encode_question_set, make_question_set, prepare_workdir
+
+def compare_packs(expected, actual, queries):
+	'''回傳兩個題庫的差異說明，完全相同時回傳空的 list'''
+	if (expected.title, expected.author) != (actual.title, actual.author):
+		return [ f"title/author: {expected.title!r}, {expected.author!r} != {actual.title!r}, {actual.author!r}" ]
+	if expected.candidates != actual.candidates:
+		return [ "candidates differ" ]
+	if len(expected.questions) != len(actual.questions):
+		return [ f"question count: {len(expected.questions)} != {len(actual.questions)}" ]
+
+	differences = []
+	for idx, (a, b) in enumerate(zip(expected.questions, actual.questions)):
+		if (a.vid, a.title, a.get_parts(), a.candidates) != (b.vid, b.title, b.get_parts(), b.candidates):
+			differences.append(f"question {idx} ({a.vid}) differs")
+	for query in queries:
+		if expected.candidate_index.search(query, 10) != actual.candidate_index.search(query, 10):
+			differences.append(f"search {query!r} differs")
+		if expected.candidate_index.complete(query[:2]) != actual.candidate_index.complete(query[:2]):
+			differences.append(f"complete {query[:2]!r} differs")
+	return differences
+
+def make_queries(pack, count, seed):
+	rng = random.Random(seed)
+	names = list(pack.candidates.values())
+	return [ rng.choice(names)[:rng.randint(1, 6)] for _ in range(count) ]
+
+def make_edge_question_set():
+	'''大小寫不同的相同選項、中日文與英文混合、emoji 與只有一個片段的題目'''
+	return {
+		"title": "邊界測試 🎵",
+		"author": "benchmarks",
+		"questions": [
+			{ "vid": "aaaaaaaaaaa", "title": "夜に駆ける YOASOBI", "candidates": [ "夜に駆ける", "YOASOBI 夜に駆ける" ], "parts": [ [ 0, 1 ] ] },
+			{ "vid": "bbbbbbbbbbb", "title": "Love Song", "candidates": [ "Love Song", "love song" ], "parts": [ [ 1000, 2000 ], [ 3000, 4000 ] ] },
+			{ "vid": "ccccccccccc", "title": "🎵 紅蓮華 LiSA", "candidates": [ "紅蓮華", "LiSA紅蓮華", "🎵" ], "parts": [ [ 0, 600000 ] ] },
+		],
+		"misleadings": [ "LOVE SONG", "群青", "アイドル idol", "長" * 100 ],
+	}
+
+def check_round_trip(data, query_count, seed):
+	from cogs import question_pack
+
+	question_pack.loaded_packs.clear()
+	pack, errors = question_pack.load_question_pack(data)
+	if errors:
+		return [ f"source pack is invalid: {errors}" ]
+
+	compiled = pack.compile()
+	question_pack.loaded_packs.clear()
+	loaded, errors = question_pack.load_question_pack(compiled)
+	if errors:
+		return [ f"compiled pack failed to load: {errors}" ]
+
+	differences = compare_packs(pack, loaded, make_queries(pack, query_count, seed))
+	if loaded.compile() != compiled:
+		differences.append("recompiled pack differs")
+	return differences
+
+def check_corruption(data, seed, count=200):
+	'''截斷或隨機修改位元組的檔案只能回傳錯誤代碼，不能拋出例外'''
+	from cogs import question_pack
+
+	question_pack.loaded_packs.clear()
+	compiled = question_pack.load_question_pack(data)[0].compile()
+	rng = random.Random(seed)
+	samples = [ compiled[:rng.randrange(len(compiled))] for _ in range(count) ]
+	for _ in range(count):
+		broken = bytearray(compiled)
+		broken[rng.randrange(4, len(broken))] ^= 1 << rng.randrange(8)
+		samples.append(bytes(broken))
+
+	differences = []
+	for sample in samples:
+		question_pack.loaded_packs.clear()
+		try:
+			question_pack.load_question_pack(sample)
+		except Exception as e:
+			differences.append(f"corrupted pack ({len(sample)} bytes) raised {type(e).__name__}: {e}")
+	return differences
+
+def check_unchecked_strings(question_set):
+	'''手動建立的題庫沒有經過 format_checker，過長或空白的選項也要以 INVALID_PACK_FILE 拒絕'''
+	from cogs import question_pack
+	from cogs.format_checker import FormatErrorCode
+
+	differences = []
+	for option in ("x" * 101, ""):
+		broken = dict(question_set, misleadings=question_set["misleadings"] + [ option ])
+		question_pack.loaded_packs.clear()
+		compiled = question_pack.QuestionPack.from_question_set("", broken).compile()
+		pack, errors = question_pack.load_question_pack(compiled)
+		if pack is not None or errors != [ ("", FormatErrorCode.INVALID_PACK_FILE) ]:
+			differences.append(f"pack with misleading option {option[:10]!r} ({len(option)} chars) was not rejected: {errors}")
+	return differences
+
+def main():
+	parser = argparse.ArgumentParser(description="SongGuesser compiled pack round-trip check")
+	parser.add_argument("--questions", type=int, default=2000, help="測試題庫的題目數量")
+	parser.add_argument("--parts", type=int, default=3, help="每題的片段數量")
+	parser.add_argument("--misleadings", type=int, default=500, help="誤導用選項的數量")
+	parser.add_argument("--seeds", type=int, default=3, help="以不同亂數產生的測試題庫數量")
+	parser.add_argument("--queries", type=int, default=500, help="每個題庫比較的搜尋數量")
+	args = parser.parse_args()
+
+	workdir = prepare_workdir()
+	try:
+		edge_cases = make_edge_question_set()
+		cases = [ ("edge cases", encode_question_set(edge_cases)) ]
+		for seed in range(args.seeds):
+			cases.append((f"seed {seed}", encode_question_set(make_question_set(args.questions, args.parts, args.misleadings, seed=seed))))
+
+		failed = 0
+		for seed, (name, data) in enumerate(cases):
+			differences = check_round_trip(data, args.queries, seed) + check_corruption(data, seed)
+			print(f"{name}: {'OK' if not differences else f'{len(differences)} differences'}")
+			for difference in differences[:20]:
+				print(f"\t{difference}")
+			failed += bool(differences)
+
+		differences = check_unchecked_strings(edge_cases)
+		print(f"unchecked strings: {'OK' if not differences else f'{len(differences)} differences'}")
+		for difference in differences:
+			print(f"\t{difference}")
+		failed += bool(differences)
+	finally:
+		shutil.rmtree(workdir, ignore_errors=True)
+	return 1 if failed else 0
+
+if __name__ == "__main__":
+	raise SystemExit(main())
@@ -0,0 +1,130 @@
+import json, os, random, resource, sys, tempfile, time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def prepare_workdir(keep=None):
+	'''
+	切換到獨立的暫存資料夾後才能 import cogs，機器人的 temp/ 暫存與資料庫都會建立在這裡
+	回傳使用的資料夾路徑
+	'''
+	if REPO_ROOT not in sys.path:
+		sys.path.insert(0, REPO_ROOT)
+	directory = keep or tempfile.mkdtemp(prefix="songguesser_bench_")
+	os.makedirs(directory, exist_ok=True)
+	os.chdir(directory)
+	return directory
+
+WORDS = [ "love", "song", "night", "blue", "star", "dream", "summer", "memories", "idol", "hero",
+	"夜に駆ける", "群青", "アイドル", "紅蓮華", "残酷な天使のテーゼ", "千本桜", "少女", "世界", "晴天を穿つ", "怪物" ]
+
+def make_question_set(question_count, parts_per_question=3, misleading_count=100, vid_prefix="", seed=0):
+	'''產生符合題庫格式的測試資料，vid 以 vid_prefix 開頭，後面以題號補滿 11 個字元'''
+	rng = random.Random(seed)
+	def make_title():
+		return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))) + f" {rng.randrange(100000)}"
+
+	questions = []
+	for i in range(question_count):
+		title = make_title()
+		parts = [ [ k * 20000, k * 20000 + 10000 ] for k in range(parts_per_question) ]
+		questions.append({
+			"vid": vid_prefix + str(i).zfill(11 - len(vid_prefix)),
+			"title": title,
+			"candidates": [ title, title.split(" ")[0] + f" ({i})" ],
+			"parts": parts,
+		})
+	return {
+		"title": "Benchmark pack",
+		"author": "benchmarks",
+		"questions": questions,
+		"misleadings": [ make_title() for _ in range(misleading_count) ],
+	}
+
+def encode_question_set(question_set):
+	return json.dumps(question_set, ensure_ascii=False).encode("utf8")
+
+def percentile(values, ratio):
+	if not values:
+		return 0.0
+	ordered = sorted(values)
+	idx = min(len(ordered) - 1, max(0, int(round(ratio * (len(ordered) - 1)))))
+	return ordered[idx]
+
+def summarize(values):
+	# 時間一律以毫秒輸出
+	return {
+		"count": len(values),
+		"p50": percentile(values, 0.5) * 1000,
+		"p99": percentile(values, 0.99) * 1000,
+		"max": max(values) * 1000 if values else 0.0,
+		"mean": sum(values) / len(values) * 1000 if values else 0.0,
+	}
+
+def peak_rss():
+	# Linux 上 ru_maxrss 的單位是 KB，回傳 MB
+	own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+	children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+	return { "self_mb": round(own, 1), "children_mb": round(children, 1) }
+
+class Timer:
+	def __init__(self):
+		self.samples = dict()	# <名稱, [ 秒 ]>
+
+	def record(self, name, seconds):
+		self.samples.setdefault(name, []).append(seconds)
+
+	def measure(self, name, func, *args, repeat=1):
+		result = None
+		for _ in range(repeat):
+			begin = time.perf_counter()
+			result = func(*args)
+			self.record(name, time.perf_counter() - begin)
+		return result
+
+	def report(self):
+		return { name: summarize(values) for name, values in self.samples.items() }
+
+def print_report(title, report, extra=None):
+	print(f"== {title} ==")
+	width = max((len(name) for name in report), default=0)
+	print(f"{'':{width}}  {'count':>7} {'p50 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+	for name, stats in report.items():
+		print(f"{name:{width}}  {stats['count']:>7} {stats['p50']:>10.3f} {stats['p99']:>10.3f} {stats['max']:>10.3f}")
+	for key, value in (extra or {}).items():
+		print(f"{key}: {value}")
+
+def compare_with_baseline(report, path, tolerance, min_delta):
+	'''與先前存下的結果比較 p99，變慢超過 tolerance 比例的項目視為退步，回傳退步項目的說明'''
+	with open(path, "r", encoding="utf8") as f:
+		baseline = json.load(f)["timings"]
+
+	regressions = []
+	for name, stats in report.items():
+		if name not in baseline:
+			continue
+		before = baseline[name]["p99"]
+		after = stats["p99"]
+		# 很短的項目誤差比例大，差距要超過 min_delta 毫秒才算
+		if after > before * (1 + tolerance) and after - before > min_delta:
+			regressions.append(f"{name}: p99 {before:.3f} ms -> {after:.3f} ms")
+	return regressions
+
+def add_output_arguments(parser):
+	parser.add_argument("--json", metavar="PATH", type=os.path.abspath, help="將結果以 JSON 格式寫入檔案，可作為之後比較的基準")
+	parser.add_argument("--baseline", metavar="PATH", type=os.path.abspath, help="與先前輸出的 JSON 結果比較，有項目退步時回傳非 0 的結束代碼")
+	parser.add_argument("--tolerance", type=float, default=0.2, help="允許的 p99 退步比例，預設 0.2")
+	parser.add_argument("--min-delta", type=float, default=0.05, help="p99 至少要慢多少毫秒才算退步，預設 0.05")
+
+def finish(args, title, report, extra=None):
+	print_report(title, report, extra)
+	if args.json:
+		with open(args.json, "w", encoding="utf8") as f:
+			json.dump({ "timings": report, "extra": extra or {} }, f, indent=1)
+	if args.baseline:
+		regressions = compare_with_baseline(report, args.baseline, args.tolerance, args.min_delta)
+		if regressions:
+			print("Performance regressions:")
+			for line in regressions:
+				print(f"  {line}")
+			return 1
+	return 0
@@ -0,0 +1,316 @@
+'''
+模擬 discord 與 Youtube 的物件，讓 SongGuesser 可以在完全離線的環境下執行
+只實作 cogs/song_guesser.py 實際用到的屬性與方法
+'''
+import asyncio, itertools, math, os, shutil, struct, threading, time, wave
+
+# =========================================================================================
+# 音訊測試檔
+
+OPUS_SILENCE = b"\xf8\xff\xfe"	# 20 ms 的 Opus 靜音封包
+OPUS_FRAME_MS = 20
+
+def make_crc_table():
+	table = []
+	for i in range(256):
+		crc = i << 24
+		for _ in range(8):
+			crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else (crc << 1)
+		table.append(crc & 0xFFFFFFFF)
+	return table
+
+CRC_TABLE = make_crc_table()
+
+def ogg_crc(data):
+	crc = 0
+	for byte in data:
+		crc = ((crc << 8) & 0xFFFFFFFF) ^ CRC_TABLE[(crc >> 24) ^ byte]
+	return crc
+
+def ogg_page(serial, page_idx, granule, flag, packets):
+	segments = bytearray()
+	for packet in packets:
+		segments.extend([ 255 ] * (len(packet) // 255))
+		segments.append(len(packet) % 255)
+	header = struct.pack("<4sBBqIIIB", b"OggS", 0, flag, granule, serial, page_idx, 0, len(segments))
+	page = header + bytes(segments) + b"".join(packets)
+	crc = ogg_crc(page)
+	return page[:22] + struct.pack("<I", crc) + page[26:]
+
+def make_ogg_opus(duration_ms, packets_per_page=50):
+	'''產生內容為靜音的 Ogg/Opus 檔案，格式與機器人轉檔後的片段相同'''
+	serial = 0x5347
+	head = b"OpusHead" + struct.pack("<BBHIhB", 1, 2, 312, 48000, 0, 0)
+	vendor = b"songguesser-bench"
+	tags = b"OpusTags" + struct.pack("<I", len(vendor)) + vendor + struct.pack("<I", 0)
+
+	pages = [ ogg_page(serial, 0, 0, 0x02, [ head ]), ogg_page(serial, 1, 0, 0, [ tags ]) ]
+	frame_count = max(1, duration_ms // OPUS_FRAME_MS)
+	for page_idx, begin in enumerate(range(0, frame_count, packets_per_page), 2):
+		count = min(packets_per_page, frame_count - begin)
+		last = begin + count >= frame_count
+		granule = (begin + count) * 960
+		pages.append(ogg_page(serial, page_idx, granule, 0x04 if last else 0, [ OPUS_SILENCE ] * count))
+	return b"".join(pages)
+
+def make_wav(path, duration_ms, frequency=440):
+	'''產生正弦波的 WAV 檔，作為真的執行 ffmpeg 時的輸入'''
+	rate = 48000
+	frames = bytearray()
+	for i in range(rate * duration_ms // 1000):
+		sample = int(8000 * math.sin(2 * math.pi * frequency * i / rate))
+		frames += struct.pack("<hh", sample, sample)
+	with wave.open(path, "wb") as f:
+		f.setnchannels(2)
+		f.setsampwidth(2)
+		f.setframerate(rate)
+		f.writeframes(bytes(frames))
+
+# =========================================================================================
+# 取代 Youtube 的查詢與下載
+
+class FakeExtractor:
+	'''
+	取代 YoutubeDLPool 的查詢與 ffmpeg 的片段擷取
+	latency 以秒為單位，查詢與下載會在 executor 的執行緒中 sleep，模擬實際的阻塞時間
+	'''
+	def __init__(self, source_path, clip_data, info_latency=0.2, clip_latency=0.3, download_latency=1.0, failure_vids=()):
+		self.source_path = source_path
+		self.clip_data = clip_data
+		self.info_latency = info_latency
+		self.clip_latency = clip_latency
+		self.download_latency = download_latency
+		self.failure_vids = set(failure_vids)
+		self.calls = { "extract_info": 0, "download": 0, "clip": 0 }
+
+	def get_vid(self, url):
+		return url.rsplit("v=", 1)[-1]
+
+	def check_available(self, url):
+		vid = self.get_vid(url)
+		if vid in self.failure_vids:
+			# 與 yt-dlp 相同，無法觀看的影片以 DownloadError 包住 expected 的 ExtractorError
+			from yt_dlp.utils import DownloadError, ExtractorError
+			raise DownloadError(f"ERROR: [youtube] {vid}: Video unavailable", (ExtractorError, ExtractorError(f"{vid}: Video unavailable", expected=True), None))
+
+	def extract_info(self, url):
+		self.calls["extract_info"] += 1
+		time.sleep(self.info_latency)
+		self.check_available(url)
+		return { "url": self.source_path, "http_headers": {}, "duration": 60, "title": self.get_vid(url) }
+
+	def download(self, url, outtmpl):
+		self.calls["download"] += 1
+		time.sleep(self.download_latency)
+		self.check_available(url)
+		filename = outtmpl.replace("%(ext)s", "wav")
+		shutil.copyfile(self.source_path, filename)
+		return filename
+
+	async def run_process(self, program, *args):
+		# 不執行 ffmpeg，直接把測試用的片段寫到輸出位置
+		self.calls["clip"] += 1
+		await asyncio.sleep(self.clip_latency)
+		with open(args[-1], "wb") as f:
+			f.write(self.clip_data)
+
+	def install(self, ytdlp_pool, audio_worker_pool=None):
+		ytdlp_pool.extract_info = self.extract_info
+		ytdlp_pool.download = self.download
+		if audio_worker_pool is not None:
+			audio_worker_pool.run_process = self.run_process
+
+# =========================================================================================
+# discord 物件
+
+id_counter = itertools.count(1 << 40)
+
+class FakeMessage:
+	def __init__(self, channel, content, view=None):
+		self.id = next(id_counter)
+		self.channel = channel
+		self.content = content
+		self.view = view
+
+	async def edit(self, content=None, view=None):
+		if content is not None:
+			self.content = content
+		if view is not None:
+			self.view = view
+		return self
+
+class FakeTextChannel:
+	def __init__(self, guild):
+		self.id = next(id_counter)
+		self.guild = guild
+		self.messages = []
+
+	async def send(self, content=None, view=None):
+		message = FakeMessage(self, content, view)
+		self.messages.append(message)
+		return message
+
+class FakeVoiceChannel:
+	def __init__(self, guild):
+		self.id = next(id_counter)
+		self.guild = guild
+		self.members = []
+
+	async def connect(self):
+		self.guild.voice_client = FakeVoiceClient(self.guild, self)
+		return self.guild.voice_client
+
+class FakeVoiceClient:
+	'''
+	模擬 discord 的 AudioPlayer：在獨立的執行緒中讀取封包，播放完畢後呼叫 after
+	realtime 為 True 時每個封包間隔 20 ms，否則會盡快讀完
+	'''
+	def __init__(self, guild, channel, realtime=False):
+		self.guild = guild
+		self.channel = channel
+		self.realtime = realtime
+		self.thread = None
+		self.stopped = threading.Event()
+		self.play_times = []		# 每次呼叫 play 的時間 (time.perf_counter)
+
+	def is_connected(self):
+		return self.guild.voice_client is self
+
+	def is_playing(self):
+		return self.thread is not None and self.thread.is_alive()
+
+	def stop(self):
+		# 和 discord 一樣只通知播放執行緒停止，不等待它結束
+		self.stopped.set()
+		self.thread = None
+
+	def play(self, source, after=None):
+		if self.is_playing():
+			raise RuntimeError("Already playing audio.")
+		self.play_times.append(time.perf_counter())
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target=self.run, args=(source, after, self.stopped), daemon=True)
+		self.thread.start()
+
+	def run(self, source, after, stopped):
+		error = None
+		try:
+			while not stopped.is_set():
+				if not source.read():
+					break
+				if self.realtime:
+					time.sleep(OPUS_FRAME_MS / 1000)
+		except Exception as e:
+			error = e
+		finally:
+			source.cleanup()
+		if after is not None:
+			after(error)
+
+	async def move_to(self, channel):
+		self.channel = channel
+
+	async def disconnect(self):
+		self.stop()
+		self.guild.voice_client = None
+
+class FakeGuild:
+	def __init__(self):
+		self.id = next(id_counter)
+		self.voice_client = None
+		self.voice_channel = FakeVoiceChannel(self)
+		self.text_channel = FakeTextChannel(self)
+
+	def get_channel(self, channel_id):
+		for channel in (self.voice_channel, self.text_channel):
+			if channel.id == channel_id:
+				return channel
+		return None
+
+class FakeVoiceState:
+	def __init__(self, channel):
+		self.channel = channel
+
+class FakeMember:
+	def __init__(self, guild, name, bot=False):
+		self.id = next(id_counter)
+		self.guild = guild
+		self.name = name
+		self.bot = bot
+		self.voice = None
+
+	def join(self, channel):
+		self.voice = FakeVoiceState(channel)
+		channel.members.append(self)
+
+	def __hash__(self):
+		return self.id
+
+	def __eq__(self, other):
+		return isinstance(other, FakeMember) and other.id == self.id
+
+class FakeResponse:
+	def __init__(self, interaction):
+		self.interaction = interaction
+		self.done = False
+
+	async def send_message(self, content=None, view=None, ephemeral=False):
+		self.done = True
+		self.interaction.sent.append((content, view, ephemeral))
+
+	async def edit_message(self, content=None, view=None):
+		self.done = True
+
+class FakeInteraction:
+	def __init__(self, guild, user, channel=None):
+		self.guild = guild
+		self.guild_id = guild.id
+		self.user = user
+		self.channel = channel or guild.text_channel
+		self.response = FakeResponse(self)
+		self.sent = []		# (content, view, ephemeral)
+
+class FakeAttachment:
+	def __init__(self, filename, data):
+		self.filename = filename
+		self.data = data
+		self.size = len(data)
+
+	async def read(self):
+		return self.data
+
+class FakeBot:
+	def __init__(self, loop):
+		self.loop = loop
+		self.user = FakeMember(None, "SongGuesser", bot=True)
+		self.guilds = dict()
+		self.users = dict()
+		self.shard_count = None
+		self.shard_ids = None
+
+	def add_guild(self, guild):
+		self.guilds[guild.id] = guild
+
+	def get_guild(self, guild_id):
+		return self.guilds.get(guild_id)
+
+	def get_channel(self, channel_id):
+		for guild in self.guilds.values():
+			channel = guild.get_channel(channel_id)
+			if channel is not None:
+				return channel
+		return None
+
+	def get_user(self, user_id):
+		return self.users.get(user_id)
+
+	async def fetch_user(self, user_id):
+		return self.users.get(user_id)
+
+def write_fixtures(directory, clip_ms=10000, source_ms=30000, with_wav=False):
+	'''回傳 (音源路徑, 片段內容)；只有需要真的執行 ffmpeg 時才產生 WAV 音源'''
+	clip_data = make_ogg_opus(clip_ms)
+	source_path = os.path.join(directory, "fixture_source.wav")
+	if with_wav and not os.path.exists(source_path):
+		make_wav(source_path, source_ms)
+	return source_path, clip_data
@@ -0,0 +1,126 @@
+import asyncio, functools, time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from pydub import AudioSegment
+
+from cogs.metrics import metrics
+
+audio_worker_options = {
+	'max_workers': 2,	# 同時進行解碼/轉檔的程序數量
+	'max_queue': 8,		# 超過此數量的工作會在 event loop 上等待，不會再塞進程序池
+}
+
+# 片段直接存成 discord 可以直接送出的 Ogg/Opus，播放時不需要再經過 ffmpeg 與 opus 編碼
+clip_encode_options = {
+	'codec': 'opus',		# 片段暫存索引中使用的格式名稱
+	'format': 'ogg',
+	'encoder': 'libopus',
+	'bitrate': '96k',
+	'filter': 'loudnorm=I=-20:TP=-2:LRA=11',	# 轉檔時一次做好音量標準化
+}
+
+def get_encode_parameters(options):
+	return [ "-af", options["filter"], "-ar", "48000", "-ac", "2" ]
+
+def get_encode_args(options):
+	return get_encode_parameters(options) + [ "-c:a", options["encoder"], "-b:a", options["bitrate"], "-f", options["format"] ]
+
+class ProcessError(RuntimeError):
+	'''外部程式以非 0 的結束代碼結束，stderr 保留原始輸出讓呼叫端判斷原因'''
+	def __init__(self, program, returncode, stderr):
+		super().__init__(f"{program} exited with code {returncode}: {stderr}")
+		self.program = program
+		self.returncode = returncode
+		self.stderr = stderr
+
+# 以下函式會在子程序中執行，只能使用可被 pickle 的參數
+
+def export_clips(filename, parts, outputs, options):
+	# 回傳 解碼, 轉檔 各自的耗時 (秒)，由主程序統一紀錄
+	begin = time.perf_counter()
+	song = AudioSegment.from_file(filename, filename[(filename.rfind('.') + 1):])
+	decoded = time.perf_counter()
+	for part, output in zip(parts, outputs):
+		if output is None:
+			continue
+		song[part[0]:part[1]].export(output, format=options["format"], codec=options["encoder"], bitrate=options["bitrate"], parameters=get_encode_parameters(options))
+	return { "decode": decoded - begin, "export": time.perf_counter() - decoded }
+
+
+
+class AudioWorkerPool:
+	def __init__(self, max_workers, max_queue):
+		self.max_workers = max_workers
+		self.max_queue = max_queue
+
+		self.executor = None
+		self.slots = asyncio.Semaphore(max_workers + max_queue)	# 程序池與外部程式共用的排隊上限
+		self.process_slots = asyncio.Semaphore(max_workers)		# 同時執行的外部程式數量，程序池本身已經限制同時執行的數量
+		self.pending = 0
+
+	def get_executor(self):
+		if self.executor is None:
+			self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+		return self.executor
+
+	async def run(self, func, *args):
+		# 工作數量達到上限時在這裡等待，讓呼叫端感受到背壓
+		self.pending += 1
+		try:
+			with metrics.span("worker_wait"):
+				await self.slots.acquire()
+			try:
+				loop = asyncio.get_running_loop()
+				try:
+					return await loop.run_in_executor(self.get_executor(), functools.partial(func, *args))
+				except BrokenProcessPool:
+					# 子程序意外終止時重建程序池，讓之後的工作可以繼續
+					self.executor = None
+					raise
+			finally:
+				self.slots.release()
+		finally:
+			self.pending -= 1
+
+	async def run_process(self, program, *args):
+		# 外部程式 (ffmpeg) 同樣佔用一個排隊名額，但同時執行的數量另外以 max_workers 限制
+		self.pending += 1
+		try:
+			with metrics.span("worker_wait"):
+				await self.slots.acquire()
+				try:
+					await self.process_slots.acquire()
+				except BaseException:
+					self.slots.release()
+					raise
+			try:
+				with metrics.span(f"{program}_spawn"):
+					process = await asyncio.create_subprocess_exec(program, *args, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+				try:
+					_, stderr = await process.communicate()
+				except asyncio.CancelledError:
+					# 等到程序真的結束才釋放名額，避免同時執行的 ffmpeg 超過上限，也不會留下未回收的程序
+					if process.returncode is None:
+						process.kill()
+						waiter = asyncio.ensure_future(process.wait())
+						while not waiter.done():
+							try:
+								await asyncio.shield(waiter)
+							except asyncio.CancelledError:
+								pass
+					raise
+				if process.returncode != 0:
+					raise ProcessError(program, process.returncode, stderr.decode('utf8', 'replace').strip())
+			finally:
+				self.process_slots.release()
+				self.slots.release()
+		finally:
+			self.pending -= 1
+
+	def shutdown(self):
+		if self.executor is not None:
+			self.executor.shutdown(wait=False, cancel_futures=True)
+			self.executor = None
+
+audio_worker_pool = AudioWorkerPool(audio_worker_options['max_workers'], audio_worker_options['max_queue'])
@@ -0,0 +1,231 @@
+import contextlib, json, os, sqlite3, threading, time
+
+def is_process_alive(pid):
+	if pid == os.getpid():
+		return True
+	if os.name == "nt":
+		# windows 上的 os.kill 會直接結束程序，改為查詢程序的結束代碼
+		import ctypes
+		kernel32 = ctypes.windll.kernel32
+		handle = kernel32.OpenProcess(0x1000, False, pid)	# PROCESS_QUERY_LIMITED_INFORMATION
+		if not handle:
+			return False
+		try:
+			code = ctypes.c_ulong()
+			return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(code))) and code.value == 259	# STILL_ACTIVE
+		finally:
+			kernel32.CloseHandle(handle)
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		pass
+	return True
+
+class CacheIndex:
+	'''
+	以 SQLite (WAL) 記錄暫存資料夾內容的使用順序，機器人的片段暫存與編輯器的 cache 資料夾都使用這個格式
+	每次使用、新增與刪除都會立即寫入，程式異常結束也不會遺失紀錄，多個程序也可以同時開啟同一個索引
+
+		files		資料夾內的檔案 (檔名, 大小, 最後使用時間)，超過容量上限時從最久未使用的檔案開始刪除
+		records		以 JSON 保存的小型資料 (名稱, 內容, 最後使用時間)，超過數量上限時從最久未使用的資料開始刪除
+		pins		各程序正在使用的檔案 (檔名, 程序 id)，所有程序都不會刪除，程序結束後由 reconcile 清除
+	'''
+	VERSION = 1
+	FILENAME = ".index.db"
+
+	def __init__(self, directory, filename=FILENAME):
+		self.directory = directory
+		self.path = os.path.join(directory, filename)
+		self.lock = threading.Lock()	# 同一個程序內的多個執行緒共用同一條連線
+
+		self.connection = None
+		self.pid = None		# 開啟連線的程序，fork 出的子程序不能沿用父程序的連線
+
+		if not os.path.exists(directory):
+			os.makedirs(directory)
+
+	def connect(self):
+		'''第一次使用時才開啟連線，需要在持有 self.lock 時呼叫'''
+		if self.connection is not None and self.pid == os.getpid():
+			return self.connection
+
+		# 從父程序繼承的連線不能使用也不能關閉，直接捨棄
+		# 交易全部自行控制，刪除檔案與刪除紀錄才能在同一個交易中完成
+		connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+		connection.execute("PRAGMA journal_mode=WAL")
+		connection.execute("PRAGMA synchronous=NORMAL")
+		connection.execute("BEGIN IMMEDIATE")
+		try:
+			version = connection.execute("PRAGMA user_version").fetchone()[0]
+			if version > self.VERSION:
+				raise RuntimeError(f"cache index {self.path} has unsupported version {version}")
+			# executescript 會先結束進行中的交易，逐一執行
+			for statement in (
+				"CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, size INTEGER NOT NULL, accessed REAL NOT NULL)",
+				"CREATE INDEX IF NOT EXISTS files_accessed ON files (accessed)",
+				"CREATE TABLE IF NOT EXISTS records (name TEXT PRIMARY KEY, value TEXT NOT NULL, accessed REAL NOT NULL)",
+				"CREATE INDEX IF NOT EXISTS records_accessed ON records (accessed)",
+				"CREATE TABLE IF NOT EXISTS pins (name TEXT NOT NULL, pid INTEGER NOT NULL, PRIMARY KEY (name, pid))",
+			):
+				connection.execute(statement)
+			connection.execute(f"PRAGMA user_version = {self.VERSION}")
+		except BaseException:
+			connection.execute("ROLLBACK")
+			connection.close()
+			raise
+		connection.execute("COMMIT")
+
+		self.connection = connection
+		self.pid = os.getpid()
+		return connection
+
+	@contextlib.contextmanager
+	def transaction(self):
+		# IMMEDIATE 會直接取得寫入鎖，其他程序的刪除不會穿插在查詢與寫入之間
+		with self.lock:
+			connection = self.connect()
+			connection.execute("BEGIN IMMEDIATE")
+			try:
+				yield connection
+			except BaseException:
+				connection.execute("ROLLBACK")
+				raise
+			connection.execute("COMMIT")
+
+	def close(self):
+		with self.lock:
+			if self.connection is not None and self.pid == os.getpid():
+				self.connection.close()
+			self.connection = None
+
+	# =========================================================================================
+	# 檔案
+
+	def reconcile(self, is_entry=None):
+		'''
+		以磁碟上的檔案修正索引：刪除已經不存在的紀錄、更新大小，沒有紀錄的檔案以修改時間作為最後使用時間加入
+		is_entry(檔名) 回傳 False 的檔案不列入管理，"." 開頭的檔案一律不列入
+		已經結束的程序留下的 pin 也會一併清除，目前的程序剛開始管理索引，之前同一個 pid 留下的 pin 也不再有效
+		'''
+		files = dict()
+		for entry in os.scandir(self.directory):
+			if entry.name.startswith(".") or (is_entry is not None and not is_entry(entry.name)):
+				continue
+			try:
+				if not entry.is_file():
+					continue
+				stat = entry.stat()
+			except OSError:
+				continue
+			files[entry.name] = (stat.st_size, stat.st_mtime)
+
+		with self.transaction() as connection:
+			for name, size in connection.execute("SELECT name, size FROM files").fetchall():
+				file = files.pop(name, None)
+				if file is None:
+					# 其他程序可能在掃描之後才寫入，確認檔案真的不存在才刪除紀錄
+					if not os.path.exists(os.path.join(self.directory, name)):
+						connection.execute("DELETE FROM files WHERE name = ?", (name,))
+				elif file[0] != size:
+					connection.execute("UPDATE files SET size = ? WHERE name = ?", (file[0], name))
+			connection.executemany("INSERT OR IGNORE INTO files (name, size, accessed) VALUES (?, ?, ?)", ((name, size, mtime) for name, (size, mtime) in files.items()))
+
+			pids = [ row[0] for row in connection.execute("SELECT DISTINCT pid FROM pins").fetchall() ]
+			connection.executemany("DELETE FROM pins WHERE pid = ?", [ (pid,) for pid in pids if pid == os.getpid() or not is_process_alive(pid) ])
+
+	def has_file(self, name):
+		with self.lock:
+			return self.connect().execute("SELECT 1 FROM files WHERE name = ?", (name,)).fetchone() is not None
+
+	def touch_file(self, name):
+		'''更新最後使用時間，回傳檔案大小，沒有紀錄時回傳 None'''
+		with self.transaction() as connection:
+			row = connection.execute("SELECT size FROM files WHERE name = ?", (name,)).fetchone()
+			if row is None:
+				return None
+			connection.execute("UPDATE files SET accessed = ? WHERE name = ?", (time.time(), name))
+			return row[0]
+
+	def add_file(self, name, size):
+		with self.transaction() as connection:
+			connection.execute("INSERT OR REPLACE INTO files (name, size, accessed) VALUES (?, ?, ?)", (name, size, time.time()))
+
+	def remove_file(self, name):
+		'''只刪除紀錄，檔案由呼叫端處理'''
+		with self.transaction() as connection:
+			connection.execute("DELETE FROM files WHERE name = ?", (name,))
+
+	def pin_file(self, name):
+		'''標記目前的程序正在使用檔案，所有程序的 evict_files 都不會刪除'''
+		with self.transaction() as connection:
+			connection.execute("INSERT OR IGNORE INTO pins (name, pid) VALUES (?, ?)", (name, os.getpid()))
+
+	def unpin_file(self, name):
+		with self.transaction() as connection:
+			connection.execute("DELETE FROM pins WHERE name = ? AND pid = ?", (name, os.getpid()))
+
+	def get_total_size(self):
+		with self.lock:
+			return self.connect().execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+
+	def evict_files(self, max_size, keep=()):
+		'''
+		從最久未使用的檔案開始刪除，直到總大小不超過 max_size，keep 內的檔案與任何程序 pin 住的檔案不會被刪除
+		回傳 (被刪除的檔名, 刪除後的總大小)
+		'''
+		victims = []
+		with self.transaction() as connection:
+			total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+			if total_size <= max_size:
+				return victims, total_size
+
+			for name, size, accessed in connection.execute("SELECT name, size, accessed FROM files WHERE name NOT IN (SELECT name FROM pins) ORDER BY accessed").fetchall():
+				if total_size <= max_size:
+					break
+				if name in keep:
+					continue
+				connection.execute("DELETE FROM files WHERE name = ?", (name,))
+				victims.append((name, size, accessed))
+				total_size -= size
+
+		# 刪除檔案可能很慢，不在交易中進行，避免其他程序等待寫入鎖
+		removed = []
+		for name, size, accessed in victims:
+			try:
+				os.remove(os.path.join(self.directory, name))
+			except FileNotFoundError:
+				pass
+			except OSError:
+				# windows 上其他程序還開著的檔案無法刪除，放回紀錄留待下次處理
+				with self.transaction() as connection:
+					connection.execute("INSERT OR IGNORE INTO files (name, size, accessed) VALUES (?, ?, ?)", (name, size, accessed))
+				total_size += size
+				continue
+			removed.append(name)
+		return removed, total_size
+
+	# =========================================================================================
+	# 小型資料
+
+	def get_record(self, name, touch=True):
+		with self.transaction() as connection:
+			row = connection.execute("SELECT value FROM records WHERE name = ?", (name,)).fetchone()
+			if row is None:
+				return None
+			if touch:
+				connection.execute("UPDATE records SET accessed = ? WHERE name = ?", (time.time(), name))
+		return json.loads(row[0])
+
+	def put_record(self, name, value, touch=True):
+		'''touch 為 False 時只更新內容，保留原本的使用順序'''
+		data = json.dumps(value, ensure_ascii=False)
+		with self.transaction() as connection:
+			if touch or connection.execute("UPDATE records SET value = ? WHERE name = ?", (data, name)).rowcount == 0:
+				connection.execute("INSERT OR REPLACE INTO records (name, value, accessed) VALUES (?, ?, ?)", (name, data, time.time()))
+
+	def trim_records(self, max_count):
+		'''只保留最近使用的 max_count 筆資料'''
+		with self.transaction() as connection:
+			connection.execute("DELETE FROM records WHERE name IN (SELECT name FROM records ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (max(0, max_count),))
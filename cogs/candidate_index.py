@@ -0,0 +1,183 @@
+import heapq, unicodedata
+from collections import OrderedDict
+
+candidate_index_options = {
+	'completion_cache_size': 1024,	# 每個題庫保留的自動完成結果數量
+}
+
+# 片假名轉成平假名，讓兩種寫法可以互相搜尋到
+KATAKANA_TO_HIRAGANA = { code: code - 0x60 for code in range(0x30A1, 0x30F7) }
+
+def normalize_text(text):
+	# NFKC 會把全形英數與半形片假名統一成一般寫法
+	return unicodedata.normalize("NFKC", text).casefold().translate(KATAKANA_TO_HIRAGANA)
+
+def is_cjk(char):
+	code = ord(char)
+	return (0x3040 <= code <= 0x30FF		# 平假名、片假名
+		or 0x3400 <= code <= 0x4DBF		# CJK 擴充 A
+		or 0x4E00 <= code <= 0x9FFF		# CJK 統一表意文字
+		or 0xAC00 <= code <= 0xD7AF		# 韓文
+		or 0xF900 <= code <= 0xFAFF)	# CJK 相容表意文字
+
+def tokenize(text):
+	# 除了空白以外，在中日韓文字與其他文字的交界處也會切開，例如 "yoasobi夜に駆ける"
+	tokens = []
+	for word in normalize_text(text).split():
+		begin = 0
+		for i in range(1, len(word)):
+			if is_cjk(word[i]) != is_cjk(word[i - 1]):
+				tokens.append(word[begin:i])
+				begin = i
+		tokens.append(word[begin:])
+	return tokens
+
+def edit_distance(a, b):
+	if len(a) < len(b):
+		a, b = b, a
+	previous = list(range(len(b) + 1))
+	for i, char_a in enumerate(a, 1):
+		current = [ i ]
+		for j, char_b in enumerate(b, 1):
+			current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+		previous = current
+	return previous[-1]
+
+class PackedPostings:
+	'''
+	編譯過的題庫內的反向索引，用法與 <gram, set(candidate id)> 的 dict 相同
+	只有實際被查詢到的 gram 才會從 memoryview 轉成 set
+	'''
+	def __init__(self, rows, offsets, postings):
+		self.rows = rows			# <gram, row>
+		self.offsets = offsets		# 每個 row 在 postings 中的開始位置，最後多一筆結尾位置
+		self.postings = postings	# 所有 row 的 candidate id 依序串接
+		self.cache = dict()
+
+	def get(self, gram, default=None):
+		result = self.cache.get(gram)
+		if result is None:
+			row = self.rows.get(gram)
+			if row is None:
+				return default
+			result = self.cache[gram] = set(self.postings[self.offsets[row]:self.offsets[row + 1]])
+		return result
+
+	def __getitem__(self, gram):
+		result = self.get(gram)
+		if result is None:
+			raise KeyError(gram)
+		return result
+
+	def __contains__(self, gram):
+		return gram in self.rows
+
+	def __iter__(self):
+		return iter(self.rows)
+
+	def __len__(self):
+		return len(self.rows)
+
+class CandidateIndex:
+	'''
+	以單字與雙字 n-gram 建立的反向索引，用於 /猜 指令的關鍵字搜尋
+	搜尋結果依照 開頭完全符合 > 符合的關鍵字數量 > 編輯距離 排序
+	'''
+	def __init__(self, candidates):
+		self.names = []			# 顯示用的原始文字
+		self.texts = []			# 正規化後的文字
+		self.postings = dict()	# <gram, set(candidate id)>
+		self.completions = OrderedDict()	# <正規化後的輸入, 自動完成結果>，越後面代表越近期使用
+
+		for name in candidates:
+			self.add(name)
+
+	@classmethod
+	def from_prebuilt(cls, names, texts, postings):
+		'''使用編譯過的題庫內預先建立好的索引，不需要重新正規化與切割 n-gram'''
+		index = cls(())
+		index.names = names
+		index.texts = texts
+		index.postings = postings
+		return index
+
+	def add(self, name):
+		idx = len(self.names)
+		text = normalize_text(name)
+		self.names.append(name)
+		self.texts.append(text)
+
+		self.completions.clear()
+		for i in range(len(text)):
+			for gram in (text[i], text[i:i + 2]):
+				if gram.isspace():
+					continue
+				if gram not in self.postings:
+					self.postings[gram] = set()
+				self.postings[gram].add(idx)
+
+	def match_token(self, token):
+		if len(token) == 1:
+			return self.postings.get(token, set())
+
+		# 取所有雙字 gram 的交集，從最小的集合開始縮小範圍，最後再確認是否真的包含整個關鍵字
+		grams = sorted((self.postings.get(token[i:i + 2], set()) for i in range(len(token) - 1)), key=len)
+		if not grams[0]:
+			return set()
+		result = grams[0].intersection(*grams[1:])
+		return { idx for idx in result if token in self.texts[idx] }
+
+	def search(self, query, limit=10):
+		'''
+		回傳 (最相關的 limit 個選項, 包含所有關鍵字的選項數量)
+		只符合部分關鍵字的選項也會列入結果，但不計入數量，與逐一比對所有關鍵字時的數量相同
+		'''
+		tokens = tokenize(query)
+		if not tokens:
+			return [], 0
+
+		unique_tokens = set(tokens)
+		coverage = dict()	# <candidate id, 符合的關鍵字數量>
+		for token in unique_tokens:
+			for idx in self.match_token(token):
+				coverage[idx] = coverage.get(idx, 0) + 1
+		if not coverage:
+			return [], 0
+
+		# 開頭是否符合以去掉空白的文字比較，中日文與英文連在一起或以空白隔開都視為相同
+		# 編輯距離的下限是長度差，先依下限排序，確定不可能進入前幾名時就不用再計算
+		prefix = "".join(tokens)
+		text = " ".join(tokens)
+		order = sorted((not self.has_prefix(idx, prefix), -count, abs(len(self.texts[idx]) - len(text)), idx) for idx, count in coverage.items())
+		best = []
+		for not_prefix, neg_count, lower_bound, idx in order:
+			if len(best) >= limit and (not_prefix, neg_count, lower_bound) > tuple(-value for value in best[0][:3]):
+				break
+			key = (not_prefix, neg_count, edit_distance(text, self.texts[idx]), idx)
+			item = tuple(-value for value in key)
+			if len(best) < limit:
+				heapq.heappush(best, item)
+			elif item > best[0]:
+				heapq.heapreplace(best, item)
+
+		result = sorted(tuple(-value for value in item) for item in best)
+		return [ self.names[key[3]] for key in result ], sum(1 for count in coverage.values() if count == len(unique_tokens))
+
+	def has_prefix(self, idx, prefix):
+		text = self.texts[idx]
+		return text.startswith(prefix) or (text[:1] == prefix[:1] and "".join(text.split()).startswith(prefix))
+
+	def complete(self, prefix, limit=25):
+		# 許多玩家會同時輸入相同的開頭，結果以 LRU 方式暫存
+		key = " ".join(tokenize(prefix))
+		if not key:
+			return []
+		if key in self.completions:
+			self.completions.move_to_end(key)
+			return self.completions[key]
+
+		result = self.search(key, limit)[0]
+		self.completions[key] = result
+		if len(self.completions) > candidate_index_options["completion_cache_size"]:
+			self.completions.popitem(last=False)
+		return result
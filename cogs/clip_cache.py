@@ -0,0 +1,147 @@
+import asyncio, hashlib, os, time, traceback, uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from cogs.cache_index import CacheIndex
+
+clip_cache_options = {
+	'directory': 'temp/clips',
+	'max_size': 512 * 1024 * 1024,	# bytes
+	'evict_ratio': 0.9,				# 超過上限時刪除到剩下這個比例，避免每次寫入都要刪除檔案
+	'stale_temp_age': 60 * 60,		# 秒，超過這個時間還沒完成寫入的暫存檔視為殘留檔案
+}
+
+class ClipCache:
+	'''
+	所有伺服器共用的片段暫存，以 (vid, start_ms, end_ms, codec) 作為索引
+	超過容量上限時會從最久未使用的片段開始刪除，任何程序正在使用中 (pin) 的片段都不會被刪除
+	索引的讀寫可能要等待其他程序的寫入鎖，lookup 與 commit 都在獨立的執行緒中依序執行，不會卡住 event loop
+	'''
+	def __init__(self, directory, max_size, evict_ratio, stale_temp_age):
+		self.directory = directory
+		self.max_size = max_size
+		self.evict_ratio = evict_ratio
+		self.stale_temp_age = stale_temp_age
+
+		self.pins = dict()				# <filename, 使用中的次數>，開始與結束使用時才寫入共用的索引
+		self.total_size = 0
+
+		# 使用順序記錄在共用的索引中，多個機器人程序共用同一個暫存資料夾時也會一致
+		# 這個物件在 import 時建立，分片模式的子程序是由父程序 fork 出來的，索引等到第一次使用時才開啟
+		self.index = CacheIndex(directory)
+		self.loaded_pid = None
+		self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clip_cache")
+
+	@staticmethod
+	def make_key(vid, start_ms, end_ms, codec):
+		return (vid, int(start_ms), int(end_ms), codec)
+
+	def get_filename(self, key):
+		digest = hashlib.sha1(repr(key).encode("utf8")).hexdigest()
+		return f"{digest}.{key[3]}"
+
+	def get_path(self, key):
+		return os.path.join(self.directory, self.get_filename(key))
+
+	def get_temp_path(self, key):
+		# 寫入完成前使用獨立的暫存檔名，避免其他伺服器讀到寫到一半的檔案
+		return f"{self.get_path(key)}.{uuid.uuid4().hex}.tmp"
+
+	async def run(self, func, *args):
+		return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+	async def lookup(self, key):
+		'''回傳片段的路徑並更新使用時間，沒有暫存時回傳 None'''
+		return await self.run(self.lookup_sync, key)
+
+	async def commit(self, key, temp_path):
+		'''把寫入完成的暫存檔放到正式的位置並加入索引，回傳片段的路徑'''
+		return await self.run(self.commit_sync, key, temp_path)
+
+	def pin(self, path):
+		# 索引的寫入依序執行，之後的 commit 與其他程序的刪除都會看到這個 pin
+		filename = os.path.basename(path)
+		count = self.pins.get(filename, 0)
+		self.pins[filename] = count + 1
+		if count == 0:
+			self.submit(self.pin_sync, filename)
+
+	def unpin(self, path):
+		filename = os.path.basename(path)
+		count = self.pins.get(filename, 0) - 1
+		if count > 0:
+			self.pins[filename] = count
+		elif self.pins.pop(filename, None) is not None:
+			self.submit(self.index.unpin_file, filename)
+
+	def submit(self, func, *args):
+		# pin 與 unpin 不需要等待結果，可以在 event loop 以外的地方呼叫
+		self.executor.submit(func, *args).add_done_callback(self.on_write_done)
+
+	@staticmethod
+	def on_write_done(future):
+		if not future.cancelled() and future.exception() is not None:
+			traceback.print_exception(future.exception())
+
+	# 以下函式會在索引的執行緒中執行
+
+	def remove_stale_temp_files(self):
+		# 其他程序可能正在寫入，只刪除太久沒有完成的暫存檔
+		now = time.time()
+		for entry in os.scandir(self.directory):
+			if not entry.name.endswith(".tmp"):
+				continue
+			try:
+				if now - entry.stat().st_mtime > self.stale_temp_age:
+					os.remove(entry.path)
+			except OSError:
+				pass
+
+	def ensure_loaded(self):
+		if self.loaded_pid != os.getpid():
+			self.loaded_pid = os.getpid()
+			self.load()
+
+	def load(self):
+		self.remove_stale_temp_files()
+		# 上次異常結束時可能有已經寫入但還沒記錄的片段，或是被手動刪除的片段
+		self.index.reconcile(lambda name: not name.endswith(".tmp"))
+		self.evict()
+
+	def lookup_sync(self, key):
+		self.ensure_loaded()
+		filename = self.get_filename(key)
+		path = os.path.join(self.directory, filename)
+		if self.index.touch_file(filename) is None:
+			# 寫入後還沒來得及記錄的片段
+			try:
+				size = os.path.getsize(path)
+			except OSError:
+				return None
+			self.index.add_file(filename, size)
+		elif not os.path.exists(path):
+			self.index.remove_file(filename)
+			return None
+		return path
+
+	def pin_sync(self, filename):
+		self.ensure_loaded()
+		self.index.pin_file(filename)
+
+	def commit_sync(self, key, temp_path):
+		self.ensure_loaded()
+		filename = self.get_filename(key)
+		path = os.path.join(self.directory, filename)
+		os.replace(temp_path, path)
+		self.index.add_file(filename, os.path.getsize(path))
+
+		self.evict()
+		return path
+
+	def evict(self):
+		# 索引中的總大小也包含其他程序寫入的片段，所有程序 pin 住的片段都不會被刪除
+		self.total_size = self.index.get_total_size()
+		if self.total_size <= self.max_size:
+			return
+		_, self.total_size = self.index.evict_files(self.max_size * self.evict_ratio)
+
+clip_cache = ClipCache(clip_cache_options['directory'], clip_cache_options['max_size'], clip_cache_options['evict_ratio'], clip_cache_options['stale_temp_age'])
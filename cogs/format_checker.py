@@ -1,8 +1,20 @@
+import json
+
 MAX_STR_LEN = 100
+MAX_PART_TIME = 2 ** 31 - 1		# ms，片段時間以 32 位元整數保存
+MAX_FILE_SIZE = 8 * 1024 * 1024		# bytes
+MAX_QUESTION_COUNT = 20000
+MAX_ERROR_COUNT = 100
 
 class FormatErrorCode:
 	OK								= 0
 	
+	FILE_TOO_LARGE					= 10
+	INVALID_JSON					= 11
+	QUESTION_SET_WRONG_TYPE			= 12
+	INVALID_PACK_FILE				= 13
+	UNSUPPORTED_PACK_VERSION		= 14
+	
 	NO_TITLE						= 100
 	TITLE_WRONG_TYPE				= 101
 	TITLE_TOO_LONG					= 102
@@ -14,6 +26,7 @@ class FormatErrorCode:
 	NO_QUESTIONS					= 300
 	QUESTIONS_WRONG_TYPE			= 301
 	EMPTY_QUESTIONS					= 302
+	TOO_MANY_QUESTIONS				= 303
 	
 	QUESTION_WRONG_TYPE				= 3000
 	
@@ -34,6 +47,7 @@ class FormatErrorCode:
 	QUESTION_PART_WRONG_LEN			= 33001
 	QUESTION_PART_WRONG_TIME_TYPE	= 33002
 	QUESTION_PART_INVALID_DURATION	= 33003
+	QUESTION_PART_TIME_OUT_OF_RANGE	= 33004
 	
 	QUESTION_NO_CANDIDATES			= 3400
 	QUESTION_CANDIDATES_WRONG_TYPE	= 3401
@@ -52,7 +66,131 @@ class FormatErrorCode:
 
 
 
-def validateQuestionFormat(question_set):
+class _TooManyErrors(Exception):
+	pass
+
+# 以下函式把題庫格式描述編譯成巢狀的檢查函式，每個檢查函式的參數為 (value, path, errors)
+# path 是 (上一層的 path, 欄位名稱或 index) 組成的鏈結串列，最外層為 None，只在發生錯誤時才會被組成字串，例如 questions[412].parts[1]
+
+def _formatPath(path):
+	keys = []
+	while path is not None:
+		path, key = path
+		keys.append(key)
+	keys.reverse()
+	return "".join(f"[{key}]" if type(key) is int else (f".{key}" if i else key) for i, key in enumerate(keys))
+
+def _report(errors, path, code, max_errors):
+	errors.append((_formatPath(path), code))
+	if len(errors) >= max_errors:
+		raise _TooManyErrors()
+
+def _compileString(wrong_type, *, empty=None, too_long=None, check=None):
+	min_len = 0 if empty is None else 1
+	max_len = float("inf") if too_long is None else MAX_STR_LEN
+	def validate(value, path, errors, max_errors):
+		# 絕大多數的字串都沒有錯誤，先以一次比較確認長度，有問題時才逐一判斷錯誤代碼
+		if type(value) is str and min_len <= len(value) <= max_len:
+			if check is not None:
+				code = check(value)
+				if code != FormatErrorCode.OK:
+					_report(errors, path, code, max_errors)
+			return
+		if type(value) is not str:
+			return _report(errors, path, wrong_type, max_errors)
+		if len(value) == 0:
+			return _report(errors, path, empty, max_errors)
+		return _report(errors, path, too_long, max_errors)
+	return validate
+
+def _compileList(wrong_type, item, *, empty=None, max_count=None, too_many=None):
+	def validate(value, path, errors, max_errors):
+		if type(value) is not list:
+			return _report(errors, path, wrong_type, max_errors)
+		if empty is not None and len(value) == 0:
+			return _report(errors, path, empty, max_errors)
+		if max_count is not None and len(value) > max_count:
+			return _report(errors, path, too_many, max_errors)
+		for i, element in enumerate(value):
+			item(element, (path, i), errors, max_errors)
+	return validate
+
+def _compileObject(wrong_type, fields):
+	def validate(value, path, errors, max_errors):
+		if type(value) is not dict:
+			return _report(errors, path, wrong_type, max_errors)
+		for key, missing, field in fields:
+			if key not in value:
+				_report(errors, (path, key), missing, max_errors)
+			else:
+				field(value[key], (path, key), errors, max_errors)
+	return validate
+
+def _checkVid(vid):
+	if len(vid) != 11 or not vid.replace('_', '').replace('-', '').isalnum():
+		return FormatErrorCode.QUESTION_WRONG_VID_FORMAT
+	return FormatErrorCode.OK
+
+def _validatePart(part, path, errors, max_errors):
+	if type(part) is not list:
+		return _report(errors, path, FormatErrorCode.QUESTION_PART_WRONG_TYPE, max_errors)
+	if len(part) != 2:
+		return _report(errors, path, FormatErrorCode.QUESTION_PART_WRONG_LEN, max_errors)
+	if type(part[0]) is not int or type(part[1]) is not int:
+		return _report(errors, path, FormatErrorCode.QUESTION_PART_WRONG_TIME_TYPE, max_errors)
+	if part[1] <= part[0]:
+		return _report(errors, path, FormatErrorCode.QUESTION_PART_INVALID_DURATION, max_errors)
+	if part[0] < 0 or part[1] > MAX_PART_TIME:
+		return _report(errors, path, FormatErrorCode.QUESTION_PART_TIME_OUT_OF_RANGE, max_errors)
+
+_collectQuestionErrors = _compileObject(FormatErrorCode.QUESTION_WRONG_TYPE, [
+	("vid", FormatErrorCode.QUESTION_NO_VID, _compileString(FormatErrorCode.QUESTION_VID_WRONG_TYPE, check=_checkVid)),
+	("title", FormatErrorCode.QUESTION_NO_TITLE, _compileString(FormatErrorCode.QUESTION_TITLE_WRONG_TYPE, empty=FormatErrorCode.QUESTION_EMPTY_TITLE, too_long=FormatErrorCode.QUESTION_TITLE_TOO_LONG)),
+	("parts", FormatErrorCode.QUESTION_NO_PARTS, _compileList(FormatErrorCode.QUESTION_PARTS_WRONG_TYPE, _validatePart, empty=FormatErrorCode.QUESTION_EMPTY_PARTS)),
+	("candidates", FormatErrorCode.QUESTION_NO_CANDIDATES, _compileList(FormatErrorCode.QUESTION_CANDIDATES_WRONG_TYPE,
+		_compileString(FormatErrorCode.QUESTION_CANDIDATE_WRONG_TYPE, empty=FormatErrorCode.QUESTION_EMPTY_CANDIDATE, too_long=FormatErrorCode.QUESTION_CANDIDATE_TOO_LONG),
+		empty=FormatErrorCode.QUESTION_EMPTY_CANDIDATES)),
+])
+
+def _isValidQuestion(question):
+	# 與 _collectQuestionErrors 的條件相同，但不需要傳遞 path 與呼叫巢狀的檢查函式
+	if type(question) is not dict:
+		return False
+	vid, title, parts, candidates = question.get("vid"), question.get("title"), question.get("parts"), question.get("candidates")
+	if type(vid) is not str or _checkVid(vid) != FormatErrorCode.OK:
+		return False
+	if type(title) is not str or not 0 < len(title) <= MAX_STR_LEN:
+		return False
+	if type(parts) is not list or not parts or type(candidates) is not list or not candidates:
+		return False
+	for part in parts:
+		if type(part) is not list or len(part) != 2:
+			return False
+		start, end = part
+		if type(start) is not int or type(end) is not int or not 0 <= start < end <= MAX_PART_TIME:
+			return False
+	for candidate in candidates:
+		if type(candidate) is not str or not 0 < len(candidate) <= MAX_STR_LEN:
+			return False
+	return True
+
+def _validateQuestion(question, path, errors, max_errors):
+	# 大部分的題目都沒有錯誤，只有在快速檢查不通過時才逐一找出錯誤的位置
+	if not _isValidQuestion(question):
+		_collectQuestionErrors(question, path, errors, max_errors)
+
+_validateQuestionSet = _compileObject(FormatErrorCode.QUESTION_SET_WRONG_TYPE, [
+	("title", FormatErrorCode.NO_TITLE, _compileString(FormatErrorCode.TITLE_WRONG_TYPE, too_long=FormatErrorCode.TITLE_TOO_LONG)),
+	("author", FormatErrorCode.NO_AUTHOR, _compileString(FormatErrorCode.AUTHOR_WRONG_TYPE, too_long=FormatErrorCode.AUTHOR_TOO_LONG)),
+	("questions", FormatErrorCode.NO_QUESTIONS, _compileList(FormatErrorCode.QUESTIONS_WRONG_TYPE, _validateQuestion,
+		empty=FormatErrorCode.EMPTY_QUESTIONS, max_count=MAX_QUESTION_COUNT, too_many=FormatErrorCode.TOO_MANY_QUESTIONS)),
+	("misleadings", FormatErrorCode.NO_MISLEADINGS, _compileList(FormatErrorCode.MISLEADINGS_WRONG_TYPE,
+		_compileString(FormatErrorCode.MISLEADING_WRONG_TYPE, empty=FormatErrorCode.EMPTY_MISLEADING, too_long=FormatErrorCode.MISLEADING_TOO_LONG))),
+])
+
+
+
+def collectFormatErrors(question_set, max_errors = MAX_ERROR_COUNT):
 	'''
 	{
 		"title": str,
@@ -71,89 +209,37 @@ def validateQuestionFormat(question_set):
 		],
 		"misleadings": [ str ]	# misleading answers (can be empty list)
 	}
+	
+	回傳所有格式錯誤的 [ (path, error_code) ]，最多 max_errors 筆
 	'''
 	
-	if "title" not in question_set:
-		return FormatErrorCode.NO_TITLE
-	if type(question_set["title"]) is not str:
-		return FormatErrorCode.TITLE_WRONG_TYPE
-	if len(question_set["title"]) > MAX_STR_LEN:
-		return FormatErrorCode.TITLE_TOO_LONG
-		
-	if "author" not in question_set:
-		return FormatErrorCode.NO_AUTHOR
-	if type(question_set["author"]) is not str:
-		return FormatErrorCode.AUTHOR_WRONG_TYPE
-	if len(question_set["author"]) > MAX_STR_LEN:
-		return FormatErrorCode.AUTHOR_TOO_LONG
-		
-	if "questions" not in question_set:
-		return FormatErrorCode.NO_QUESTIONS
-	if type(question_set["questions"]) is not list:
-		return FormatErrorCode.QUESTIONS_WRONG_TYPE
-	if len(question_set["questions"]) == 0:
-		return FormatErrorCode.EMPTY_QUESTIONS
-		
-	for question in question_set["questions"]:
-		if type(question) is not dict:
-			return FormatErrorCode.QUESTION_WRONG_TYPE
-			
-		if "vid" not in question:
-			return FormatErrorCode.QUESTION_NO_VID
-		if type(question["vid"]) is not str:
-			return FormatErrorCode.QUESTION_VID_WRONG_TYPE
-		if len(question["vid"]) != 11 or not question["vid"].replace('_', '').replace('-', '').isalnum():
-			return FormatErrorCode.QUESTION_WRONG_VID_FORMAT
-				
-		if "title" not in question:
-			return FormatErrorCode.QUESTION_NO_TITLE
-		if type(question["title"]) is not str:
-			return FormatErrorCode.QUESTION_TITLE_WRONG_TYPE
-		if len(question["title"]) == 0:
-			return FormatErrorCode.QUESTION_EMPTY_TITLE
-		if len(question["title"]) > MAX_STR_LEN:
-			return FormatErrorCode.QUESTION_TITLE_TOO_LONG
-			
-		if "parts" not in question:
-			return FormatErrorCode.QUESTION_NO_PARTS
-		if type(question["parts"]) is not list:
-			return FormatErrorCode.QUESTION_PARTS_WRONG_TYPE
-		if len(question["parts"]) == 0:
-			return FormatErrorCode.QUESTION_EMPTY_PARTS
-		for part in question["parts"]:
-			if type(part) is not list:
-				return FormatErrorCode.QUESTION_PART_WRONG_TYPE
-			if len(part) != 2:
-				return FormatErrorCode.QUESTION_PART_WRONG_LEN
-			if type(part[0]) is not int or type(part[1]) is not int:
-				return FormatErrorCode.QUESTION_PART_WRONG_TIME_TYPE
-			if part[1] <= part[0]:
-				return FormatErrorCode.QUESTION_PART_INVALID_DURATION
-					
-		if "candidates" not in question:
-			return FormatErrorCode.QUESTION_NO_CANDIDATES
-		if type(question["candidates"]) is not list:
-			return FormatErrorCode.QUESTION_CANDIDATES_WRONG_TYPE
-		if len(question["candidates"]) == 0:
-			return FormatErrorCode.QUESTION_EMPTY_CANDIDATES
-		for candidate in question["candidates"]:
-			if type(candidate) is not str:
-				return FormatErrorCode.QUESTION_CANDIDATE_WRONG_TYPE
-			if len(candidate) == 0:
-				return FormatErrorCode.QUESTION_EMPTY_CANDIDATE
-			if len(candidate) > MAX_STR_LEN:
-				return FormatErrorCode.QUESTION_CANDIDATE_TOO_LONG
-			
-	if "misleadings" not in question_set:
-		return FormatErrorCode.NO_MISLEADINGS
-	if type(question_set["misleadings"]) is not list:
-		return FormatErrorCode.MISLEADINGS_WRONG_TYPE
-	for option in question_set["misleadings"]:
-		if type(option) is not str:
-			return FormatErrorCode.MISLEADING_WRONG_TYPE
-		if len(option) == 0:
-			return FormatErrorCode.EMPTY_MISLEADING
-		if len(option) > MAX_STR_LEN:
-			return FormatErrorCode.MISLEADING_TOO_LONG
-	
-	return FormatErrorCode.OK
\ No newline at end of file
+	errors = []
+	try:
+		_validateQuestionSet(question_set, None, errors, max_errors)
+	except _TooManyErrors:
+		pass
+	return errors
+
+def validateQuestionFormat(question_set):
+	errors = collectFormatErrors(question_set, 1)
+	if errors:
+		return errors[0][1]
+	return FormatErrorCode.OK
+
+def loadQuestionSet(data):
+	'''
+	解析上傳的題庫檔案內容，回傳 (question_set, [ (path, error_code) ])
+	過大的檔案在解析前就會被拒絕
+	'''
+	
+	if len(data) > MAX_FILE_SIZE:
+		return None, [ ("", FormatErrorCode.FILE_TOO_LARGE) ]
+	try:
+		question_set = json.loads(data.decode("utf8"))
+	except (UnicodeDecodeError, ValueError, RecursionError):
+		return None, [ ("", FormatErrorCode.INVALID_JSON) ]
+	
+	errors = collectFormatErrors(question_set)
+	if errors:
+		return None, errors
+	return question_set, errors
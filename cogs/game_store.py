@@ -0,0 +1,141 @@
+import asyncio, sqlite3, time, traceback
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+game_store_options = {
+	'path': 'temp/games.db',
+	'pack_retention': 24 * 60 * 60,	# 秒，沒有遊戲在使用的題庫保留多久才刪除，其他程序可能已經寫入題庫但還沒寫入遊戲
+}
+
+class GameStore:
+	'''
+	以 SQLite (WAL) 保存進行中的遊戲進度，機器人重新啟動後可以接續遊戲
+	所有讀寫都在同一個執行緒中依序執行，不會卡住 event loop
+	'''
+	def __init__(self, path, pack_retention):
+		self.path = path
+		self.pack_retention = pack_retention
+		self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="game_store")
+		self.connection = None
+
+	def submit(self, func, *args):
+		future = asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+		future.add_done_callback(self.on_write_done)
+		return future
+
+	@staticmethod
+	def on_write_done(future):
+		if not future.cancelled() and future.exception() is not None:
+			traceback.print_exception(future.exception())
+
+	# 以下函式會在資料庫的執行緒中執行
+
+	def connect(self):
+		if self.connection is None:
+			# 分片模式下多個程序會同時寫入同一個檔案
+			self.connection = sqlite3.connect(self.path, timeout=30)
+			self.connection.execute("PRAGMA journal_mode=WAL")
+			self.connection.execute("PRAGMA synchronous=NORMAL")
+			self.connection.executescript('''
+				CREATE TABLE IF NOT EXISTS packs (
+					digest TEXT PRIMARY KEY,
+					data BLOB NOT NULL,
+					saved_at REAL NOT NULL DEFAULT 0
+				);
+				CREATE TABLE IF NOT EXISTS games (
+					guild_id INTEGER PRIMARY KEY,
+					voice_channel_id INTEGER NOT NULL,
+					text_channel_id INTEGER NOT NULL,
+					digest TEXT NOT NULL,
+					strict_mode INTEGER NOT NULL,
+					step INTEGER NOT NULL,
+					question_idx INTEGER NOT NULL,
+					question_order BLOB NOT NULL,
+					excluded_questions BLOB NOT NULL,
+					updated REAL NOT NULL
+				);
+				CREATE TABLE IF NOT EXISTS scores (
+					guild_id INTEGER NOT NULL,
+					user_id INTEGER NOT NULL,
+					score INTEGER NOT NULL,
+					PRIMARY KEY (guild_id, user_id)
+				);
+			''')
+			# 舊版的資料庫沒有 saved_at，原有的題庫視為很久以前寫入
+			if "saved_at" not in [ row[1] for row in self.connection.execute("PRAGMA table_info(packs)") ]:
+				with self.connection:
+					self.connection.execute("ALTER TABLE packs ADD COLUMN saved_at REAL NOT NULL DEFAULT 0")
+		return self.connection
+
+	def write_pack(self, digest, data):
+		# 重複使用的題庫也要更新寫入時間，遊戲資料寫入前不會被清掉
+		# 同時清掉沒有遊戲在使用、而且超過保留時間的題庫，剛寫入題庫但還沒開始遊戲的其他程序不受影響
+		now = time.time()
+		with self.connect() as connection:
+			connection.execute("INSERT INTO packs (digest, data, saved_at) VALUES (?, ?, ?) ON CONFLICT (digest) DO UPDATE SET saved_at = excluded.saved_at", (digest, data, now))
+			connection.execute("DELETE FROM packs WHERE saved_at < ? AND digest NOT IN (SELECT digest FROM games)", (now - self.pack_retention,))
+
+	def write_game(self, guild_id, voice_channel_id, text_channel_id, digest, strict_mode, step, question_idx, question_order, excluded_questions):
+		# 出題順序改變時寫入完整的遊戲資料，分數一併清除
+		with self.connect() as connection:
+			connection.execute("INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+				(guild_id, voice_channel_id, text_channel_id, digest, int(strict_mode), step, question_idx, question_order, excluded_questions, time.time()))
+			connection.execute("DELETE FROM scores WHERE guild_id = ?", (guild_id,))
+
+	def write_progress(self, guild_id, step, question_idx):
+		with self.connect() as connection:
+			connection.execute("UPDATE games SET step = ?, question_idx = ?, updated = ? WHERE guild_id = ?", (step, question_idx, time.time(), guild_id))
+
+	def write_excluded(self, guild_id, excluded_questions):
+		# 遊戲中途排除的題目只影響之後的出題順序，分數保留
+		with self.connect() as connection:
+			connection.execute("UPDATE games SET excluded_questions = ?, updated = ? WHERE guild_id = ?", (excluded_questions, time.time(), guild_id))
+
+	def write_score(self, guild_id, user_id, score):
+		with self.connect() as connection:
+			connection.execute("INSERT OR REPLACE INTO scores VALUES (?, ?, ?)", (guild_id, user_id, score))
+
+	def delete_game(self, guild_id):
+		with self.connect() as connection:
+			connection.execute("DELETE FROM games WHERE guild_id = ?", (guild_id,))
+			connection.execute("DELETE FROM scores WHERE guild_id = ?", (guild_id,))
+
+	def read_games(self):
+		with self.connect() as connection:
+			games = []
+			columns = [ "guild_id", "voice_channel_id", "text_channel_id", "digest", "strict_mode", "step", "question_idx", "question_order", "excluded_questions" ]
+			for row in connection.execute(f"SELECT {', '.join(columns)} FROM games").fetchall():
+				game = dict(zip(columns, row))
+				pack = connection.execute("SELECT data FROM packs WHERE digest = ?", (game["digest"],)).fetchone()
+				if pack is None:
+					continue
+				game["data"] = pack[0]
+				game["scores"] = connection.execute("SELECT user_id, score FROM scores WHERE guild_id = ?", (game["guild_id"],)).fetchall()
+				games.append(game)
+			return games
+
+	# 以下函式可以直接在 event loop 中呼叫，寫入會在背景依序完成
+
+	def save_pack(self, digest, data):
+		return self.submit(self.write_pack, digest, data)
+
+	def save_game(self, game):
+		return self.submit(self.write_game, game.guild_id, game.channel.id, game.text_channel.id, game.pack.digest, game.one_guess_per_part,
+			game.step, game.current_question_idx, game.question_order.tobytes(), array("i", sorted(game.excluded_questions)).tobytes())
+
+	def save_progress(self, game):
+		return self.submit(self.write_progress, game.guild_id, game.step, game.current_question_idx)
+
+	def save_excluded(self, game):
+		return self.submit(self.write_excluded, game.guild_id, array("i", sorted(game.excluded_questions)).tobytes())
+
+	def save_score(self, game, user):
+		return self.submit(self.write_score, game.guild_id, user.id, game.player_scores[user])
+
+	def remove_game(self, guild_id):
+		return self.submit(self.delete_game, guild_id)
+
+	async def load_games(self):
+		return await asyncio.get_running_loop().run_in_executor(self.executor, self.read_games)
+
+game_store = GameStore(game_store_options['path'], game_store_options['pack_retention'])
@@ -0,0 +1,151 @@
+import asyncio, contextlib, logging, os, sys, threading, time, traceback
+
+from cogs.metrics import metrics
+
+loop_watchdog_options = {
+	'interval': 0.05,		# 秒，量測 event loop 延遲的間隔
+	'threshold': 0.25,		# 秒，event loop 被卡住超過這個時間就擷取當下的呼叫堆疊
+	'max_stacks': 3,		# 同一次卡住最多擷取幾次堆疊，卡很久時可以看出是否換了別的地方卡住
+	'debug': False,			# 開啟 asyncio 的 debug 模式，記錄 cogs 內執行過久的 callback (會拖慢整體效能)
+	'slow_callback_duration': 0.1,	# 秒，debug 模式下超過這個時間的 callback 會被記錄
+}
+
+COGS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+def format_blocking_stack(frame):
+	# 只保留 event loop 開始執行 callback 之後的部分，前面都是 asyncio 本身的呼叫
+	frames = traceback.extract_stack(frame)
+	for i in range(len(frames) - 1, -1, -1):
+		if frames[i].name == "_run" and frames[i].filename.endswith(os.path.join("asyncio", "events.py")):
+			frames = frames[i + 1:]
+			break
+	return "".join(traceback.format_list(frames))
+
+class CogCallbackFilter(logging.Filter):
+	'''asyncio 的 debug 模式會回報所有執行過久的 callback，只保留 cogs 內程式碼造成的紀錄'''
+	def __init__(self, directory):
+		super().__init__()
+		self.directory = directory
+
+	def filter(self, record):
+		message = record.getMessage()
+		if not message.startswith("Executing "):
+			return True
+		return self.directory in message
+
+class LoopWatchdog:
+	'''
+	持續量測 event loop 的延遲並發佈到 metrics
+	event loop 被同步的呼叫卡住時，由另一個執行緒擷取 event loop 執行緒當下的呼叫堆疊，恢復後一併回報
+	'''
+	def __init__(self, interval, threshold, max_stacks):
+		self.interval = interval
+		self.threshold = threshold
+		self.max_stacks = max_stacks
+
+		self.loop_thread_id = None
+		self.last_beat = 0.0		# heartbeat 最近一次開始等待的時間 (time.monotonic)
+		self.stacks = []			# (heartbeat 時間, 堆疊)，這次卡住時擷取到的堆疊
+		self.lock = threading.Lock()
+		self.stopped = threading.Event()
+		self.task = None
+		self.thread = None
+		self.debug_filter = None
+
+		self.stall_count = 0
+		self.worst_lag = 0.0
+		self.last_stall = None		# (發生時間, 延遲秒數, 堆疊)
+
+	def start(self):
+		if self.task is not None:
+			return
+		self.loop_thread_id = threading.get_ident()
+		self.last_beat = time.monotonic()
+		self.stopped.clear()
+		self.task = asyncio.ensure_future(self.heartbeat())
+		self.thread = threading.Thread(target=self.monitor, name="loop_watchdog", daemon=True)
+		self.thread.start()
+
+	async def stop(self):
+		self.disable_debug()
+		if self.task is None:
+			return
+		self.stopped.set()
+		self.task.cancel()
+		with contextlib.suppress(asyncio.CancelledError):
+			await self.task
+		self.task = None
+		self.thread = None
+
+	def enable_debug(self, slow_callback_duration):
+		loop = asyncio.get_running_loop()
+		loop.set_debug(True)
+		loop.slow_callback_duration = slow_callback_duration
+		if self.debug_filter is None:
+			self.debug_filter = CogCallbackFilter(COGS_DIRECTORY)
+			logging.getLogger("asyncio").addFilter(self.debug_filter)
+
+	def disable_debug(self):
+		if self.debug_filter is not None:
+			logging.getLogger("asyncio").removeFilter(self.debug_filter)
+			self.debug_filter = None
+			asyncio.get_running_loop().set_debug(False)
+
+	async def heartbeat(self):
+		while True:
+			begin = time.monotonic()
+			self.last_beat = begin
+			await asyncio.sleep(self.interval)
+			lag = max(0.0, time.monotonic() - begin - self.interval)
+			metrics.record("loop_lag_seconds", lag)
+			if lag >= self.threshold:
+				self.report(begin, lag)
+
+	def monitor(self):
+		# 在獨立的執行緒中執行，event loop 卡住時 heartbeat 的時間不會更新
+		captured_beat = None
+		captured = 0
+		while not self.stopped.wait(self.interval):
+			beat = self.last_beat
+			if beat != captured_beat:
+				captured_beat = beat
+				captured = 0
+			if captured >= self.max_stacks:
+				continue
+			# 每多卡住 threshold 秒就再擷取一次
+			if time.monotonic() - beat - self.interval < self.threshold * (captured + 1):
+				continue
+
+			frame = sys._current_frames().get(self.loop_thread_id)
+			if frame is None:
+				continue
+			stack = format_blocking_stack(frame)
+			captured += 1
+			with self.lock:
+				self.stacks.append((beat, stack))
+
+	def report(self, beat, lag):
+		with self.lock:
+			# 卡在同一個地方時每次擷取到的堆疊都一樣，只保留一份
+			stacks = list(dict.fromkeys(stack for stack_beat, stack in self.stacks if stack_beat == beat))
+			self.stacks = []
+
+		self.stall_count += 1
+		self.worst_lag = max(self.worst_lag, lag)
+		self.last_stall = (time.time(), lag, stacks)
+		metrics.increment("loop_stalls_total")
+		metrics.log("loop_stall", duration=round(lag, 6), stacks=stacks)
+
+		print(f"Event loop was blocked for {lag * 1000:.0f} ms", file=sys.stderr)
+		for stack in stacks:
+			print(stack, end="", file=sys.stderr)
+
+	def get_metrics(self):
+		return {
+			"stalls": self.stall_count,
+			"worst_lag_ms": round(self.worst_lag * 1000, 1),
+			"threshold_ms": round(self.threshold * 1000, 1),
+			"debug": self.debug_filter is not None,
+		}
+
+loop_watchdog = LoopWatchdog(loop_watchdog_options['interval'], loop_watchdog_options['threshold'], loop_watchdog_options['max_stacks'])
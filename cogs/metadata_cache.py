@@ -0,0 +1,93 @@
+import json, os, time, uuid
+from collections import OrderedDict
+
+metadata_cache_options = {
+	'ttl': 60 * 60,			# 秒，Youtube 的串流網址數小時後就會失效
+	'max_entries': 4096,
+	'directory': 'temp/metadata',	# 多個機器人程序透過這個資料夾共用查詢結果
+}
+
+class MetadataCache:
+	'''暫存影片的串流資訊，重複遊玩相同題庫時不需要再次向 Youtube 查詢'''
+	def __init__(self, ttl, max_entries, directory):
+		self.ttl = ttl
+		self.max_entries = max_entries
+		self.directory = directory
+		self.entries = OrderedDict()	# <vid, (過期時間, info)>
+
+		if not os.path.exists(directory):
+			os.makedirs(directory)
+		# 清掉已經過期的檔案
+		now = time.time()
+		for entry in os.scandir(directory):
+			try:
+				if entry.stat().st_mtime + ttl < now:
+					os.remove(entry.path)
+			except OSError:
+				pass
+
+	def get_path(self, vid):
+		return os.path.join(self.directory, f"{vid}.json")
+
+	def get(self, vid):
+		entry = self.entries.get(vid)
+		if entry is None:
+			entry = self.load(vid)
+			if entry is None:
+				return None
+		if entry[0] < time.time():
+			self.discard(vid)
+			return None
+
+		self.entries.move_to_end(vid)
+		return entry[1]
+
+	def put(self, vid, data):
+		# 只保留播放需要的欄位，完整的 info 動輒數百 KB
+		info = {
+			"url": data["url"],
+			"http_headers": data.get("http_headers", {}),
+			"duration": data.get("duration"),
+			"title": data.get("title"),
+		}
+		entry = (time.time() + self.ttl, info)
+		self.remember(vid, entry)
+		self.save(vid, entry)
+		return info
+
+	def remember(self, vid, entry):
+		self.entries[vid] = entry
+		self.entries.move_to_end(vid)
+		while len(self.entries) > self.max_entries:
+			self.entries.popitem(last=False)
+
+	def load(self, vid):
+		# 記憶體中沒有時，讀取其他程序寫入的結果
+		try:
+			with open(self.get_path(vid), "r", encoding="utf8") as f:
+				data = json.load(f)
+		except (OSError, ValueError):
+			return None
+		entry = (data["expire"], data["info"])
+		self.remember(vid, entry)
+		return entry
+
+	def save(self, vid, entry):
+		path = self.get_path(vid)
+		temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+		try:
+			with open(temp_path, "w", encoding="utf8") as f:
+				json.dump({ "expire": entry[0], "info": entry[1] }, f)
+			os.replace(temp_path, path)
+		except OSError:
+			if os.path.exists(temp_path):
+				os.remove(temp_path)
+
+	def discard(self, vid):
+		self.entries.pop(vid, None)
+		try:
+			os.remove(self.get_path(vid))
+		except OSError:
+			pass
+
+metadata_cache = MetadataCache(metadata_cache_options['ttl'], metadata_cache_options['max_entries'], metadata_cache_options['directory'])
@@ -0,0 +1,160 @@
+import asyncio, bisect, json, threading, time
+from contextlib import contextmanager
+
+metrics_options = {
+	'host': '127.0.0.1',
+	'port': 9464,		# 以 Prometheus 格式提供 /metrics 的連接埠，設為 0 代表不開啟
+	'log_path': None,	# 設定檔案路徑時，每個計時區段都會以 JSON 格式逐行寫入，方便事後分析
+	'prefix': 'songguesser',
+}
+
+# 秒，涵蓋搜尋 (數毫秒) 到下載整首歌曲 (數十秒) 的範圍
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Histogram:
+	__slots__ = ("counts", "sum", "count")
+
+	def __init__(self):
+		self.counts = [ 0 ] * (len(DURATION_BUCKETS) + 1)	# 最後一格是超過所有區間的數量
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self, value):
+		self.counts[bisect.bisect_left(DURATION_BUCKETS, value)] += 1
+		self.sum += value
+		self.count += 1
+
+def format_labels(labels):
+	if not labels:
+		return ""
+	items = []
+	for key, value in labels:
+		value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+		items.append(f'{key}="{value}"')
+	return "{" + ",".join(items) + "}"
+
+class Metrics:
+	'''
+	出題流程各階段的計時、計數與即時數值
+	播放相關的紀錄會從 discord 的音訊執行緒寫入，所有修改都需要持有 lock
+	'''
+	def __init__(self, prefix, log_path=None):
+		self.prefix = prefix
+		self.lock = threading.Lock()
+		self.counters = dict()		# <(name, labels), value>
+		self.histograms = dict()	# <(name, labels), Histogram>
+		self.callbacks = dict()		# <name, (type, 回傳當前數值的函式)>
+		self.log_file = open(log_path, "a", encoding="utf8", buffering=1) if log_path else None
+		self.server = None
+
+	def increment(self, name, value=1, **labels):
+		key = (name, tuple(sorted(labels.items())))
+		with self.lock:
+			self.counters[key] = self.counters.get(key, 0) + value
+
+	def record(self, name, seconds, **labels):
+		key = (name, tuple(sorted(labels.items())))
+		with self.lock:
+			histogram = self.histograms.get(key)
+			if histogram is None:
+				histogram = self.histograms[key] = Histogram()
+			histogram.observe(seconds)
+
+	def observe(self, stage, seconds, **fields):
+		'''紀錄一個階段的耗時，fields 只會寫入 JSON 紀錄，不會成為 Prometheus 的 label'''
+		self.record("stage_duration_seconds", seconds, stage=stage)
+		self.log(stage, duration=round(seconds, 6), **fields)
+
+	@contextmanager
+	def span(self, stage, **fields):
+		# 失敗的階段同樣會計時，並額外計入錯誤次數；被取消的不算錯誤
+		begin = time.perf_counter()
+		try:
+			yield
+		except Exception as e:
+			self.increment("errors_total", stage=stage)
+			self.observe(stage, time.perf_counter() - begin, error=type(e).__name__, **fields)
+			raise
+		except BaseException:
+			self.observe(stage, time.perf_counter() - begin, cancelled=True, **fields)
+			raise
+		self.observe(stage, time.perf_counter() - begin, **fields)
+
+	def register(self, name, func, kind="gauge"):
+		# 數值在輸出時才向各模組查詢，平常不需要額外維護
+		self.callbacks[name] = (kind, func)
+
+	def log(self, event, **fields):
+		if self.log_file is None:
+			return
+		line = json.dumps(dict(time=time.time(), event=event, **fields), ensure_ascii=False, default=str)
+		with self.lock:
+			self.log_file.write(line + "\n")
+
+	def render(self):
+		lines = []
+		with self.lock:
+			counters = sorted(self.counters.items())
+			histograms = sorted((key, list(value.counts), value.sum, value.count) for key, value in self.histograms.items())
+
+		declared = set()
+		def declare(name, kind):
+			if name not in declared:
+				declared.add(name)
+				lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+
+		for (name, labels), value in counters:
+			declare(name, "counter")
+			lines.append(f"{self.prefix}_{name}{format_labels(labels)} {value}")
+
+		for (name, labels), counts, total, count in histograms:
+			declare(name, "histogram")
+			cumulative = 0
+			for bound, bucket_count in zip(DURATION_BUCKETS + ("+Inf",), counts):
+				cumulative += bucket_count
+				lines.append(f"{self.prefix}_{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+			lines.append(f"{self.prefix}_{name}_sum{format_labels(labels)} {total}")
+			lines.append(f"{self.prefix}_{name}_count{format_labels(labels)} {count}")
+
+		for name, (kind, func) in sorted(self.callbacks.items()):
+			try:
+				value = func()
+			except Exception:
+				continue
+			declare(name, kind)
+			lines.append(f"{self.prefix}_{name} {value}")
+
+		return "\n".join(lines) + "\n"
+
+	# 簡易的 HTTP 伺服器，只回應 GET /metrics
+
+	async def start_server(self, host, port):
+		if port and self.server is None:
+			self.server = await asyncio.start_server(self.handle_request, host, port)
+
+	async def stop_server(self):
+		if self.server is not None:
+			self.server.close()
+			await self.server.wait_closed()
+			self.server = None
+
+	async def handle_request(self, reader, writer):
+		try:
+			request = await asyncio.wait_for(reader.readline(), 5)
+			# 讀完剩下的標頭，避免客戶端在送出前就被關閉連線
+			while (await asyncio.wait_for(reader.readline(), 5)).strip():
+				pass
+
+			parts = request.decode("latin-1").split()
+			if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+				status, body = "200 OK", self.render().encode("utf8")
+			else:
+				status, body = "404 Not Found", b"not found\n"
+			writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+			await writer.drain()
+		except (asyncio.TimeoutError, ConnectionError):
+			pass
+		finally:
+			writer.close()
+
+metrics = Metrics(metrics_options['prefix'], metrics_options['log_path'])
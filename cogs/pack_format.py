@@ -0,0 +1,233 @@
+'''
+編譯過的二進位題庫格式 (.sgpk)
+
+題庫的字串、片段時間與搜尋索引都預先整理好，載入時直接從 memoryview 讀取，不需要解析 JSON、檢查格式或重建索引
+所有整數皆為 little-endian，每個區段都對齊 4 bytes
+
+	header		magic, 版本, flags, 標題/作者字串, 題目/選項/gram/字串數量, 區段數量
+	sections	每個區段的 (offset, 長度)
+	[0] STRING_OFFSETS		u32[string_count + 1]，每個字串在解碼後文字中的開始位置 (字元)
+	[1] STRING_DATA			所有字串串接後的 UTF-8
+	[2] QUESTIONS			u32[(question_count + 1) * 4]，vid, 標題, 第一個片段, 第一個選項；最後一列只用來標示結尾
+	[3] PARTS				i32[]，依序存放每個片段的 開始, 結束 時間 (ms)
+	[4] QUESTION_CANDIDATES	u32[]，每題正確答案在 CANDIDATES 中的 index
+	[5] CANDIDATES			u32[candidate_count * 3]，小寫的選項, 顯示用的選項, 正規化後的文字
+	[6] GRAMS				u32[(gram_count + 1) * 2]，gram 字串, 第一個 posting；最後一列只用來標示結尾
+	[7] POSTINGS			u32[]，每個 gram 出現在哪些選項
+
+python -m cogs.pack_format 題庫.json [輸出.sgpk] 可以把 JSON 題庫編譯成這個格式
+'''
+import struct, sys
+from array import array
+
+MAGIC = b"SGPK"
+VERSION = 1
+FILE_EXTENSION = ".sgpk"
+
+HEADER = struct.Struct("<4sHHIIIIIII")
+SECTION = struct.Struct("<II")
+
+(STRING_OFFSETS, STRING_DATA, QUESTIONS, PARTS, QUESTION_CANDIDATES, CANDIDATES, GRAMS, POSTINGS) = range(8)
+SECTION_COUNT = 8
+
+QUESTION_COLUMNS = 4
+CANDIDATE_COLUMNS = 3
+GRAM_COLUMNS = 2
+
+class PackFormatError(Exception):
+	pass
+
+class UnsupportedPackVersion(PackFormatError):
+	pass
+
+class CompiledPack:
+	'''解碼後的原始資料，字串以外的陣列都是直接指向原始 buffer 的 memoryview'''
+	__slots__ = ("title", "author", "strings", "questions", "parts", "question_candidates", "candidates", "grams", "postings")
+
+	def __init__(self, title, author, strings, questions, parts, question_candidates, candidates, grams, postings):
+		self.title = title
+		self.author = author
+		self.strings = strings
+		self.questions = questions
+		self.parts = parts
+		self.question_candidates = question_candidates
+		self.candidates = candidates
+		self.grams = grams
+		self.postings = postings
+
+	def get_question_count(self):
+		return len(self.questions) // QUESTION_COLUMNS - 1
+
+	def get_candidate_count(self):
+		return len(self.candidates) // CANDIDATE_COLUMNS
+
+def is_compiled_pack(data):
+	return bytes(data[:len(MAGIC)]) == MAGIC
+
+def to_le_bytes(values, typecode):
+	values = array(typecode, values)
+	if sys.byteorder != "little":
+		values.byteswap()
+	return values.tobytes()
+
+def encode_pack(title, author, questions, candidates, postings):
+	'''
+	questions: [ (vid, title, parts (依序的 開始, 結束 時間), [ 正確答案在 candidates 中的 index ]) ]
+	candidates: [ (小寫的選項, 顯示用的選項, 正規化後的文字) ]
+	postings: <gram, 選項 index 的集合>
+	'''
+	strings = dict()	# <字串, id>
+	def intern(text):
+		string_id = strings.get(text)
+		if string_id is None:
+			string_id = strings[text] = len(strings)
+		return string_id
+
+	title_id = intern(title)
+	author_id = intern(author)
+
+	question_rows = array("I")
+	parts = array("i")
+	question_candidates = array("I")
+	for vid, question_title, question_parts, candidate_ids in questions:
+		question_rows.extend((intern(vid), intern(question_title), len(parts), len(question_candidates)))
+		parts.extend(question_parts)
+		question_candidates.extend(candidate_ids)
+	question_rows.extend((0, 0, len(parts), len(question_candidates)))
+
+	candidate_rows = array("I")
+	for lowered, display, text in candidates:
+		candidate_rows.extend((intern(lowered), intern(display), intern(text)))
+
+	gram_rows = array("I")
+	posting_values = array("I")
+	grams = sorted(postings)
+	for gram in grams:
+		gram_rows.extend((intern(gram), len(posting_values)))
+		posting_values.extend(sorted(postings[gram]))
+	gram_rows.extend((0, len(posting_values)))
+
+	string_offsets = array("I", [ 0 ])
+	for text in strings:
+		string_offsets.append(string_offsets[-1] + len(text))
+	string_data = "".join(strings).encode("utf8")
+
+	sections = [
+		to_le_bytes(string_offsets, "I"),
+		string_data,
+		to_le_bytes(question_rows, "I"),
+		to_le_bytes(parts, "i"),
+		to_le_bytes(question_candidates, "I"),
+		to_le_bytes(candidate_rows, "I"),
+		to_le_bytes(gram_rows, "I"),
+		to_le_bytes(posting_values, "I"),
+	]
+
+	header = HEADER.pack(MAGIC, VERSION, 0, title_id, author_id, len(questions), len(candidates), len(grams), len(strings), SECTION_COUNT)
+	offset = HEADER.size + SECTION.size * SECTION_COUNT
+	table = []
+	body = []
+	for section in sections:
+		table.append(SECTION.pack(offset, len(section)))
+		padding = b"\0" * (-len(section) % 4)
+		body.append(section + padding)
+		offset += len(section) + len(padding)
+	return header + b"".join(table) + b"".join(body)
+
+def view_array(view, offset, length, typecode):
+	section = view[offset:offset + length]
+	if len(section) != length or length % 4:
+		raise PackFormatError("section out of range")
+	if sys.byteorder == "little":
+		return section.cast(typecode)
+	# big-endian 的機器需要轉換，只能複製一份
+	values = array(typecode, section.tobytes())
+	values.byteswap()
+	return memoryview(values)
+
+def decode_pack(data):
+	'''
+	data 可以是 bytes 或 memoryview，回傳 CompiledPack
+	只檢查不會讓之後存取時發生錯誤的部分 (區段範圍、index 上限)，內容是否合理由呼叫端檢查
+	'''
+	view = memoryview(data)
+	if len(view) < HEADER.size:
+		raise PackFormatError("file too small")
+	magic, version, flags, title_id, author_id, question_count, candidate_count, gram_count, string_count, section_count = HEADER.unpack_from(view)
+	if magic != MAGIC:
+		raise PackFormatError("not a compiled question pack")
+	if version != VERSION:
+		raise UnsupportedPackVersion(f"unsupported version {version}")
+	if section_count < SECTION_COUNT or len(view) < HEADER.size + SECTION.size * section_count:
+		raise PackFormatError("missing sections")
+
+	sections = [ SECTION.unpack_from(view, HEADER.size + SECTION.size * i) for i in range(section_count) ]
+	def section_array(idx, typecode, expected=None):
+		values = view_array(view, sections[idx][0], sections[idx][1], typecode)
+		if expected is not None and len(values) != expected:
+			raise PackFormatError(f"section {idx} has wrong size")
+		return values
+
+	string_offsets = section_array(STRING_OFFSETS, "I", string_count + 1)
+	offset, length = sections[STRING_DATA]
+	text = str(view[offset:offset + length], "utf8")
+	if string_offsets[-1] != len(text):
+		raise PackFormatError("string table is truncated")
+	strings = [ text[string_offsets[i]:string_offsets[i + 1]] for i in range(string_count) ]
+
+	questions = section_array(QUESTIONS, "I", (question_count + 1) * QUESTION_COLUMNS)
+	parts = section_array(PARTS, "i")
+	question_candidates = section_array(QUESTION_CANDIDATES, "I")
+	candidates = section_array(CANDIDATES, "I", candidate_count * CANDIDATE_COLUMNS)
+	grams = section_array(GRAMS, "I", (gram_count + 1) * GRAM_COLUMNS)
+	postings = section_array(POSTINGS, "I")
+
+	# 所有 index 都要在範圍內，之後存取時才不需要再檢查
+	if max(title_id, author_id) >= string_count:
+		raise PackFormatError("string index out of range")
+	for column in range(2):
+		if question_count and max(questions[column:-QUESTION_COLUMNS:QUESTION_COLUMNS]) >= string_count:
+			raise PackFormatError("string index out of range")
+	if candidate_count and max(candidates) >= string_count:
+		raise PackFormatError("string index out of range")
+	if gram_count and max(grams[0:-GRAM_COLUMNS:GRAM_COLUMNS]) >= string_count:
+		raise PackFormatError("string index out of range")
+	if question_candidates and max(question_candidates) >= candidate_count:
+		raise PackFormatError("candidate index out of range")
+	if postings and max(postings) >= candidate_count:
+		raise PackFormatError("candidate index out of range")
+	for column, limit in ((2, len(parts)), (3, len(question_candidates))):
+		bounds = questions[column::QUESTION_COLUMNS]
+		if bounds[0] != 0 or bounds[-1] != limit or any(bounds[i] > bounds[i + 1] for i in range(question_count)):
+			raise PackFormatError("question table is corrupted")
+	if len(parts) % 2:
+		raise PackFormatError("question table is corrupted")
+
+	return CompiledPack(strings[title_id], strings[author_id], strings, questions, parts, question_candidates, candidates, grams, postings)
+
+def main():
+	import argparse, os
+	from cogs.question_pack import load_question_pack
+
+	parser = argparse.ArgumentParser(description="把 JSON 題庫編譯成二進位格式")
+	parser.add_argument("source", help="JSON 題庫檔案")
+	parser.add_argument("output", nargs="?", help=f"輸出檔案，預設為相同檔名的 {FILE_EXTENSION}")
+	args = parser.parse_args()
+
+	with open(args.source, "rb") as f:
+		data = f.read()
+	pack, errors = load_question_pack(data)
+	if errors:
+		for path, code in errors:
+			print(f"{path or '(root)'}: error {code}")
+		return 1
+
+	output = args.output or os.path.splitext(args.source)[0] + FILE_EXTENSION
+	compiled = pack.compile()
+	with open(output, "wb") as f:
+		f.write(compiled)
+	print(f"{len(pack.questions)} questions, {len(data)} -> {len(compiled)} bytes: {output}")
+	return 0
+
+if __name__ == "__main__":
+	raise SystemExit(main())
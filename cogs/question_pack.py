@@ -0,0 +1,140 @@
+import hashlib, sys, weakref
+from array import array
+
+from cogs.candidate_index import CandidateIndex, PackedPostings
+from cogs.format_checker import FormatErrorCode, MAX_FILE_SIZE, MAX_PART_TIME, MAX_QUESTION_COUNT, MAX_STR_LEN, loadQuestionSet, _checkVid
+from cogs.pack_format import CANDIDATE_COLUMNS, GRAM_COLUMNS, QUESTION_COLUMNS, PackFormatError, UnsupportedPackVersion, decode_pack, encode_pack, is_compiled_pack
+
+class Question:
+	__slots__ = ("vid", "title", "parts", "candidates")
+
+	def __init__(self, vid, title, parts, candidates):
+		self.vid = vid
+		self.title = title
+		self.parts = parts				# array('i') 或編譯過的題庫內的 memoryview，依序存放每個片段的 開始, 結束 時間 (ms)
+		self.candidates = candidates	# frozenset，轉成小寫的正確答案
+
+	def get_part_count(self):
+		return len(self.parts) // 2
+
+	def get_parts(self):
+		return [ (self.parts[i], self.parts[i + 1]) for i in range(0, len(self.parts), 2) ]
+
+class QuestionPack:
+	'''
+	編譯過後的唯讀題庫，內容相同的題庫在所有伺服器間共用同一個物件
+	每場遊戲只另外保存自己的出題順序
+	'''
+	__slots__ = ("digest", "title", "author", "questions", "candidates", "candidate_index", "__weakref__")
+
+	def __init__(self, digest, title, author, questions, candidates, candidate_index=None):
+		self.digest = digest
+		self.title = title
+		self.author = author
+		self.questions = questions		# tuple(Question)
+		self.candidates = candidates	# <小寫的選項, 顯示用的選項>，包含正確答案與誤導用答案
+		self.candidate_index = candidate_index or CandidateIndex(candidates.values())
+
+	@classmethod
+	def from_question_set(cls, digest, question_set):
+		# 字串都經過 intern，不同題目或不同題庫間相同的選項只會保存一份
+		candidates = dict()
+		for option in question_set["misleadings"]:
+			candidates[sys.intern(option.lower())] = sys.intern(option)
+
+		questions = []
+		for question in question_set["questions"]:
+			question_candidates = []
+			for candidate in question["candidates"]:
+				lowered = sys.intern(candidate.lower())
+				candidates[lowered] = sys.intern(candidate)
+				question_candidates.append(lowered)
+
+			parts = array("i")
+			for part in question["parts"]:
+				parts.extend(part)
+			questions.append(Question(sys.intern(question["vid"]), question["title"], parts, frozenset(question_candidates)))
+
+		return cls(digest, question_set["title"], question_set["author"], tuple(questions), candidates)
+
+	@classmethod
+	def from_compiled(cls, digest, data):
+		'''
+		從編譯過的題庫建立，片段時間與搜尋索引直接使用 data 內的資料，不會另外複製
+		檔案內容不是由使用者手動編輯，只檢查會影響遊戲進行的部分，不合理時拋出 PackFormatError
+		'''
+		compiled = decode_pack(data)
+		strings = compiled.strings
+		if not compiled.title or not compiled.author or max(len(compiled.title), len(compiled.author)) > MAX_STR_LEN:
+			raise PackFormatError("invalid title or author")
+		if not 0 < compiled.get_question_count() <= MAX_QUESTION_COUNT:
+			raise PackFormatError("invalid question count")
+
+		rows = compiled.candidates
+		lowered = [ sys.intern(strings[rows[i]]) for i in range(0, len(rows), CANDIDATE_COLUMNS) ]
+		names = [ sys.intern(strings[rows[i + 1]]) for i in range(0, len(rows), CANDIDATE_COLUMNS) ]
+		texts = [ strings[rows[i + 2]] for i in range(0, len(rows), CANDIDATE_COLUMNS) ]
+		candidates = dict(zip(lowered, names))
+		if len(candidates) != len(lowered):
+			raise PackFormatError("duplicated candidates")
+		# 正確答案與誤導用答案會直接成為自動完成的選項與按鈕文字，長度限制與 JSON 題庫相同
+		for idx, (key, name) in enumerate(zip(lowered, names)):
+			if not name or len(name) > MAX_STR_LEN or key != name.lower():
+				raise PackFormatError(f"invalid candidate {idx}")
+
+		questions = []
+		rows = compiled.questions
+		for i in range(0, len(rows) - QUESTION_COLUMNS, QUESTION_COLUMNS):
+			vid = strings[rows[i]]
+			title = strings[rows[i + 1]]
+			parts = compiled.parts[rows[i + 2]:rows[i + 2 + QUESTION_COLUMNS]]
+			question_candidates = frozenset(lowered[idx] for idx in compiled.question_candidates[rows[i + 3]:rows[i + 3 + QUESTION_COLUMNS]])
+			if _checkVid(vid) != FormatErrorCode.OK or not title or len(title) > MAX_STR_LEN:
+				raise PackFormatError(f"invalid question {len(questions)}")
+			if not parts or len(parts) % 2 or not question_candidates:
+				raise PackFormatError(f"invalid question {len(questions)}")
+			for j in range(0, len(parts), 2):
+				if parts[j] < 0 or parts[j + 1] <= parts[j] or parts[j + 1] > MAX_PART_TIME:
+					raise PackFormatError(f"invalid part in question {len(questions)}")
+			questions.append(Question(sys.intern(vid), title, parts, question_candidates))
+
+		grams = compiled.grams
+		gram_rows = { strings[grams[i]]: i // GRAM_COLUMNS for i in range(0, len(grams) - GRAM_COLUMNS, GRAM_COLUMNS) }
+		postings = PackedPostings(gram_rows, grams[1::GRAM_COLUMNS], compiled.postings)
+		candidate_index = CandidateIndex.from_prebuilt(names, texts, postings)
+		return cls(digest, compiled.title, compiled.author, tuple(questions), candidates, candidate_index)
+
+	def compile(self):
+		'''編譯成二進位的題庫格式 (cogs/pack_format.py)，回傳 bytes'''
+		candidate_ids = { lowered: idx for idx, lowered in enumerate(self.candidates) }
+		texts = self.candidate_index.texts
+		candidates = [ (lowered, name, texts[idx]) for idx, (lowered, name) in enumerate(self.candidates.items()) ]
+		questions = [ (question.vid, question.title, question.parts, sorted(candidate_ids[candidate] for candidate in question.candidates)) for question in self.questions ]
+		return encode_pack(self.title, self.author, questions, candidates, self.candidate_index.postings)
+
+loaded_packs = weakref.WeakValueDictionary()	# <content hash, QuestionPack>
+
+def load_question_pack(data):
+	'''回傳 (QuestionPack, [ (path, error_code) ])，相同內容的題庫已經載入時直接共用'''
+	digest = hashlib.sha256(data).hexdigest()
+	pack = loaded_packs.get(digest)
+	if pack is not None:
+		return pack, []
+
+	if is_compiled_pack(data):
+		if len(data) > MAX_FILE_SIZE:
+			return None, [ ("", FormatErrorCode.FILE_TOO_LARGE) ]
+		try:
+			pack = QuestionPack.from_compiled(digest, data)
+		except UnsupportedPackVersion:
+			return None, [ ("", FormatErrorCode.UNSUPPORTED_PACK_VERSION) ]
+		except (PackFormatError, UnicodeDecodeError, ValueError, IndexError, TypeError):
+			return None, [ ("", FormatErrorCode.INVALID_PACK_FILE) ]
+	else:
+		question_set, errors = loadQuestionSet(data)
+		if errors:
+			return None, errors
+		pack = QuestionPack.from_question_set(digest, question_set)
+
+	loaded_packs[digest] = pack
+	return pack, []
@@ -1,20 +1,31 @@
 # This example requires the 'message_content' privileged intent to function.
 
-import asyncio, functools
-import json, os, random, struct, traceback
+import asyncio, contextlib, functools, io, math, queue, threading, uuid
+from array import array
+from collections import deque, OrderedDict
+import os, random, re, socket, struct, time, traceback
 
 import discord
 from yt_dlp import YoutubeDL
-from pydub import AudioSegment
+from yt_dlp.networking import exceptions as ytdlp_network_errors
+from yt_dlp.utils import DownloadError, ExtractorError
 
 from discord.ext import commands
 from discord import app_commands
 
 from cogs.format_checker import *
+from cogs.question_pack import load_question_pack
+from cogs.pack_format import FILE_EXTENSION as PACK_FILE_EXTENSION
+from cogs.clip_cache import ClipCache, clip_cache
+from cogs.metadata_cache import metadata_cache
+from cogs.game_store import game_store
+from cogs.metrics import metrics, metrics_options
+from cogs.loop_watchdog import loop_watchdog, loop_watchdog_options
+from cogs.audio_worker import ProcessError, audio_worker_pool, clip_encode_options, export_clips, get_encode_args
 
 ytdlp_format_options = {
 	'format': 'bestaudio',
-	# 'outtmpl': 'temp/main',  # set individually for each discord guild
+	# 'outtmpl': 'temp/main',  # set individually for each download
 	'restrictfilenames': True,
 	'noplaylist': True,
 	'nocheckcertificate': True,
@@ -26,44 +37,368 @@ ytdlp_format_options = {
 	'source_address': '0.0.0.0',  # bind to ipv4 since ipv6 addresses cause issues sometimes
 }
 
-ffmpeg_options = {
-	'options': '-vn',
+clip_extract_options = {
+	'mode': 'range',	# range: 只從串流讀取片段的時間區間 / full: 下載整首歌曲後切割
 }
 
-ytdlp_options = dict()
-class YTDLSource(discord.PCMVolumeTransformer):
-	def __init__(self, source, *, volume=0.5):
-		super().__init__(source, volume)
+prefetch_options = {
+	'lookahead': 2,		# 播放當前題目時，預先準備之後幾題的片段
+}
+
+warmup_options = {
+	'concurrency': 8,	# 同時查詢的影片數量
+	'clips': 3,			# 預先準備前幾題的片段
+}
+
+playback_options = {
+	'countdown': 5,				# 秒，開始遊戲前的倒數，與準備第一題同時進行
+	'restart_countdown': 3,		# 秒，重新開始時的倒數
+	'voice_ready_timeout': 10,	# 秒，等待語音連線可以送出音訊的時間上限
+}
+
+auto_stop_options = {
+	'grace_period': 30,	# 語音頻道內沒有玩家後，等待多少秒才結束遊戲
+}
+
+download_scheduler_options = {
+	'max_concurrency': 6,	# 所有伺服器合計同時進行的下載數量
+	'max_retries': 2,		# 只重試網路錯誤、HTTP 5xx 與 429
+	'retry_delay': 1,		# 秒，每次重試的等待時間加倍
+}
+
+# ffmpeg 直接讀取串流時，網路中斷、逾時、伺服器錯誤與請求過多的訊息
+TRANSIENT_FFMPEG_ERROR = re.compile(r"Server returned 5\d\d|HTTP error (429|5\d\d)|Connection (timed out|reset|refused)|Network is unreachable|I/O error", re.IGNORECASE)
+
+def is_transient_error(error):
+	'''
+	網路錯誤、HTTP 5xx 與 429 可能在稍後重試時成功
+	影片不存在、私人影片、地區限制、格式錯誤等情況重試也不會成功，直接回報失敗
+	yt-dlp 會把原始錯誤包在 DownloadError / ExtractorError 內，沿著原因一路往下檢查
+	'''
+	seen = set()
+	while error is not None and id(error) not in seen:
+		seen.add(id(error))
+		if isinstance(error, ytdlp_network_errors.HTTPError):
+			return error.status == 429 or error.status >= 500
+		if isinstance(error, (ytdlp_network_errors.TransportError, ConnectionError, TimeoutError, socket.timeout)):
+			return True
+		if isinstance(error, ProcessError):
+			return TRANSIENT_FFMPEG_ERROR.search(error.stderr) is not None
+		if isinstance(error, DownloadError):
+			error = error.exc_info[1] if error.exc_info else None
+		elif isinstance(error, ExtractorError):
+			error = error.cause
+		else:
+			error = error.__cause__
+	return False
+
+class DownloadJob:
+	def __init__(self, guild_id, key, factory):
+		self.guild_id = guild_id
+		self.key = key
+		self.factory = factory		# 回傳 coroutine 的函式，重試時會再次呼叫
+		self.future = asyncio.get_running_loop().create_future()
+		self.task = None
+		self.waiters = 0
+
+class DownloadScheduler:
+	'''
+	所有伺服器共用的下載排程
+	相同 key 的工作同時只會執行一次，各伺服器排隊中的工作會輪流執行
+	'''
+	def __init__(self, max_concurrency, max_retries, retry_delay):
+		self.max_concurrency = max_concurrency
+		self.max_retries = max_retries
+		self.retry_delay = retry_delay
+		
+		self.queues = OrderedDict()		# <guild_id, deque(DownloadJob)>，輪到的伺服器取出一個工作後移到最後面
+		self.jobs = dict()				# <key, DownloadJob>，排隊中或執行中的工作
+		self.running = 0
+		self.stats = { "submitted": 0, "coalesced": 0, "completed": 0, "failed": 0, "retried": 0, "cancelled": 0 }
+	
+	async def run(self, guild_id, key, factory):
+		job = self.jobs.get(key)
+		if job is None:
+			job = DownloadJob(guild_id, key, factory)
+			self.jobs[key] = job
+			self.queues.setdefault(guild_id, deque()).append(job)
+			self.stats["submitted"] += 1
+			self.dispatch()
+		else:
+			self.stats["coalesced"] += 1
+		
+		job.waiters += 1
+		try:
+			return await asyncio.shield(job.future)
+		finally:
+			job.waiters -= 1
+			if job.waiters == 0 and not job.future.done():
+				self.cancel(job)
+	
+	def cancel(self, job):
+		# 已經沒有人需要結果的工作直接取消
+		self.stats["cancelled"] += 1
+		if job.task is not None:
+			job.task.cancel()
+			return
+			
+		queue = self.queues[job.guild_id]
+		queue.remove(job)
+		if not queue:
+			del self.queues[job.guild_id]
+		del self.jobs[job.key]
+		job.future.cancel()
+	
+	def dispatch(self):
+		while self.running < self.max_concurrency and self.queues:
+			guild_id, queue = self.queues.popitem(last=False)
+			job = queue.popleft()
+			if queue:
+				self.queues[guild_id] = queue
+			
+			self.running += 1
+			job.task = asyncio.ensure_future(self.execute(job))
+	
+	async def execute(self, job):
+		try:
+			for attempt in range(self.max_retries + 1):
+				try:
+					result = await job.factory()
+					break
+				except Exception as e:
+					if attempt >= self.max_retries or not is_transient_error(e):
+						raise
+					self.stats["retried"] += 1
+					await asyncio.sleep(self.retry_delay * 2 ** attempt)
+			self.stats["completed"] += 1
+			job.future.set_result(result)
+		except asyncio.CancelledError:
+			job.future.cancel()
+		except Exception as e:
+			self.stats["failed"] += 1
+			job.future.set_exception(e)
+		finally:
+			self.running -= 1
+			del self.jobs[job.key]
+			self.dispatch()
+	
+	def get_metrics(self):
+		metrics = {
+			"queued": sum(len(queue) for queue in self.queues.values()),
+			"running": self.running,
+			"queued_guilds": len(self.queues),
+		}
+		metrics.update(self.stats)
+		return metrics
+
+download_scheduler = DownloadScheduler(download_scheduler_options['max_concurrency'], download_scheduler_options['max_retries'], download_scheduler_options['retry_delay'])
+
+ytdlp_pool_options = {
+	'size': download_scheduler_options['max_concurrency'],
+	'directory': 'temp/downloads',	# 整首歌曲下載的暫存位置，切割完片段後就會刪除
+}
+
+class YoutubeDLPool:
+	'''
+	重複使用 YoutubeDL 物件，避免每次查詢都重新初始化 extractor 與連線設定
+	每個物件同時只會被一個執行緒借出，輸出檔名在借出時個別指定
+	'''
+	def __init__(self, options, size):
+		self.options = options
+		self.size = size
+		
+		self.idle = queue.LifoQueue()
+		self.created = 0
+		self.lock = threading.Lock()
+	
+	def checkout(self):
+		try:
+			return self.idle.get_nowait()
+		except queue.Empty:
+			pass
+		with self.lock:
+			if self.created < self.size:
+				self.created += 1
+				return YoutubeDL(self.options)
+		return self.idle.get()
+	
+	@contextlib.contextmanager
+	def acquire(self, outtmpl=None):
+		ytdl = self.checkout()
+		default_outtmpl = ytdl.params["outtmpl"]
+		try:
+			if outtmpl:
+				ytdl.params["outtmpl"] = dict(default_outtmpl, default=outtmpl)
+			yield ytdl
+		finally:
+			ytdl.params["outtmpl"] = default_outtmpl
+			self.idle.put(ytdl)
+	
+	# 以下函式會阻塞，需要在 executor 中執行
+	
+	def extract_info(self, url):
+		with self.acquire() as ytdl:
+			return ytdl.extract_info(url, download=False)
+	
+	def download(self, url, outtmpl):
+		with self.acquire(outtmpl) as ytdl:
+			data = ytdl.extract_info(url, download=True)
+			return ytdl.prepare_filename(data)
+	
+	def close(self):
+		while True:
+			try:
+				ytdl = self.idle.get_nowait()
+			except queue.Empty:
+				break
+			ytdl.close()
+			self.created -= 1
+
+ytdlp_pool = YoutubeDLPool(ytdlp_format_options, ytdlp_pool_options['size'])
+
+class YTDLSource(discord.AudioSource):
+	def __init__(self, filename):
+		self.file = open(filename, "rb")
+		self.packets = self.iter_audio_packets(discord.oggparse.OggStream(self.file).iter_packets())
+		self.play_time = None		# 呼叫播放的時間，讀到第一個封包時紀錄延遲
+	
+	@staticmethod
+	def iter_audio_packets(packets):
+		# 跳過 Ogg/Opus 的標頭封包，只送出音訊資料
+		for packet in packets:
+			if packet.startswith(b"OpusHead") or packet.startswith(b"OpusTags"):
+				continue
+			yield packet
+	
+	def read(self):
+		packet = next(self.packets, b"")
+		if self.play_time is not None:
+			# 在 discord 的音訊執行緒中執行
+			metrics.observe("first_packet", time.perf_counter() - self.play_time)
+			self.play_time = None
+		return packet
+	
+	def is_opus(self):
+		return True
+	
+	def cleanup(self):
+		self.file.close()
 
 	@classmethod
-	async def load_from_url(cls, url, parts, guild_id, *, loop=None):
-		directory = f"temp/{guild_id}"
-		if guild_id not in ytdlp_options:
-			if not os.path.exists(directory):
-				os.mkdir(directory)
+	async def load_from_url(cls, vid, parts, guild_id):
+		# 所有片段都已經在共用暫存中的話，就不需要重新下載與轉檔
+		codec = clip_encode_options["codec"]
+		keys = [ ClipCache.make_key(vid, part[0], part[1], codec) for part in parts ]
+		paths = [ await clip_cache.lookup(key) for key in keys ]
+		hits = sum(1 for path in paths if path)
+		metrics.increment("clip_cache_total", hits, result="hit")
+		metrics.increment("clip_cache_total", len(paths) - hits, result="miss")
+		if all(paths):
+			for path in paths:
+				clip_cache.pin(path)
+			return paths
+		
+		missing = [ i for i in range(len(parts)) if not paths[i] ]
+		if clip_extract_options["mode"] == "range":
+			try:
+				data = await cls.resolve(vid, guild_id)
+				# 其他伺服器正在處理相同片段時，會直接等待同一個結果
+				results = await asyncio.gather(*(download_scheduler.run(guild_id, ("clip",) + keys[i], functools.partial(cls.extract_range, data, keys[i], parts[i], clip_encode_options)) for i in missing), return_exceptions=True)
+				for i, result in zip(missing, results):
+					if not isinstance(result, BaseException):
+						paths[i] = result
+				for result in results:
+					if isinstance(result, BaseException):
+						raise result
+			except asyncio.CancelledError:
+				raise
+			except Exception as e:
+				# 串流不支援跳轉等情況時，改回下載整首歌曲的方式
+				print(f"[{guild_id}] Range extraction of {vid} failed, fallback to full download: {e}")
+				metrics.increment("range_fallback_total")
+				metadata_cache.discard(vid)
+			missing = [ i for i in range(len(parts)) if not paths[i] ]
 				
-			options = ytdlp_format_options.copy()
-			options["outtmpl"] = f"{directory}/main.%(ext)s"
-			ytdlp_options[guild_id] = options
-		
-		# remove old files
-		for file in os.listdir(directory):
-			os.remove(os.path.join(directory, file))
-		
-		with YoutubeDL(ytdlp_options[guild_id]) as ytdl:
-			loop = loop or asyncio.get_event_loop()
-			data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=True))
-			filename = ytdl.prepare_filename(data)
-		
-		song = AudioSegment.from_file(filename, filename[(filename.find('.') + 1):])
-		for i in range(len(parts)):
-			part = parts[i]
-			song[part[0]:part[1]].export(f"{directory}/{i}", format="mp3")
+		if missing:
+			missing_parts = tuple(tuple(parts[i]) for i in missing)
+			results = await download_scheduler.run(guild_id, ("full", vid, missing_parts), functools.partial(cls.extract_full, vid, missing_parts, [ keys[i] for i in missing ]))
+			for i, result in zip(missing, results):
+				paths[i] = result
+		
+		for path in paths:
+			clip_cache.pin(path)
+		return paths
+	
+	@staticmethod
+	def remove_temp_files(temp_paths):
+		for path in temp_paths:
+			if path and os.path.exists(path):
+				os.remove(path)
+	
+	@classmethod
+	async def resolve(cls, vid, guild_id=None):
+		# 只查詢串流資訊不下載，結果會暫存一段時間
+		data = metadata_cache.get(vid)
+		metrics.increment("metadata_cache_total", result="miss" if data is None else "hit")
+		if data is None:
+			data = await download_scheduler.run(guild_id, ("info", vid), functools.partial(cls.fetch_info, vid))
+		return data
+	
+	@classmethod
+	async def fetch_info(cls, vid):
+		loop = asyncio.get_running_loop()
+		with metrics.span("resolve", vid=vid):
+			info = await loop.run_in_executor(None, ytdlp_pool.extract_info, f"https://www.youtube.com/watch?v={vid}")
+		return metadata_cache.put(vid, info)
+	
+	@classmethod
+	async def extract_range(cls, data, key, part, encode_options):
+		# 讓 ffmpeg 直接跳到片段的時間區間讀取串流，完整歌曲不會落地
+		stream_url = data["url"]
+		headers = "".join(f"{key}: {value}\r\n" for key, value in data.get("http_headers", {}).items())
+		args = [ "-nostdin", "-loglevel", "error", "-y" ]
+		if stream_url.startswith("http"):
+			args += [ "-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "5" ]
+		if headers:
+			args += [ "-headers", headers ]
+		
+		temp_path = clip_cache.get_temp_path(key)
+		args += [ "-ss", f"{part[0] / 1000:.3f}", "-i", stream_url, "-t", f"{(part[1] - part[0]) / 1000:.3f}", "-vn" ] + get_encode_args(encode_options) + [ temp_path ]
+		try:
+			with metrics.span("clip_extract", vid=key[0]):
+				await audio_worker_pool.run_process("ffmpeg", *args)
+		except BaseException:
+			cls.remove_temp_files([ temp_path ])
+			raise
+		return await clip_cache.commit(key, temp_path)
+	
+	@classmethod
+	async def extract_full(cls, vid, parts, keys):
+		# 每次下載使用不同的檔名，同時下載多首歌曲時不會互相覆蓋
+		outtmpl = f"{ytdlp_pool_options['directory']}/{uuid.uuid4().hex}.%(ext)s"
+		loop = asyncio.get_running_loop()
+		with metrics.span("download", vid=vid):
+			filename = await loop.run_in_executor(None, ytdlp_pool.download, f"https://www.youtube.com/watch?v={vid}", outtmpl)
+		
+		temp_paths = [ clip_cache.get_temp_path(key) for key in keys ]
+		try:
+			# 解碼與轉檔交給程序池處理，避免卡住 event loop
+			with metrics.span("clip_export", vid=vid):
+				timings = await audio_worker_pool.run(export_clips, filename, [ list(part) for part in parts ], temp_paths, clip_encode_options)
+			for stage, seconds in timings.items():
+				metrics.observe(stage, seconds, vid=vid)
+		except BaseException:
+			cls.remove_temp_files(temp_paths)
+			raise
+		finally:
+			# 片段已經存進共用暫存，完整歌曲不再需要
+			if os.path.exists(filename):
+				os.remove(filename)
+		return [ await clip_cache.commit(key, temp_path) for key, temp_path in zip(keys, temp_paths) ]
 
 	@classmethod
-	async def get_part(cls, part, guild_id):
-		filename = f"temp/{guild_id}/{part}"
-		return cls(discord.FFmpegPCMAudio(filename, **ffmpeg_options))
+	async def get_part(cls, filename):
+		return cls(filename)
 
 
 
@@ -80,71 +415,135 @@ class GameData:
 		self.channel = None
 		self.text_channel = None
 		self.voice_client = None
+		self.member_count = 0		# 遊戲語音頻道內的玩家人數 (不含機器人)
+		self.idle_task = None
 		
 		# settings
 		self.one_guess_per_part = False
 		
 		# game progress
 		self.step = GameStep.IDLE
-		self.question_set = None
+		self.pack = None
+		self.excluded_questions = set()		# 暖身時發現無法播放的題目
+		self.question_order = array("i")	# 題庫內題目的出題順序
 		self.current_question_idx = 0
 		self.player_scores = dict()
 		
 		# question progress
+		self.clip_files = []
+		self.prefetch_tasks = dict()	# <question idx, asyncio.Task>
 		self.current_question_part = 0
 		self.guessed_players = set()
 		self.answer_guessed = False
 	
 	def reset_progress(self):
+		self.cancel_prefetch()
 		self.current_question_idx = 0
-		if self.question_set:
-			random.shuffle(self.question_set["questions"])
+		if self.pack:
+			order = [ idx for idx in range(len(self.pack.questions)) if idx not in self.excluded_questions ]
+			random.shuffle(order)
+			self.question_order = array("i", order)
 		self.player_scores.clear()
 			
 		self.reset_question()
 	
+	def release_clips(self):
+		for path in self.clip_files:
+			clip_cache.unpin(path)
+		self.clip_files = []
+	
+	def cancel_prefetch(self):
+		for task in self.prefetch_tasks.values():
+			if not task.done():
+				task.cancel()
+			elif not task.cancelled() and task.exception() is None:
+				for path in task.result():
+					clip_cache.unpin(path)
+		self.prefetch_tasks.clear()
+	
+	def count_members(self):
+		self.member_count = sum(1 for member in self.channel.members if not member.bot) if self.channel else 0
+	
+	def cancel_idle_timer(self):
+		if self.idle_task:
+			self.idle_task.cancel()
+			self.idle_task = None
+	
 	def reset_question(self):
 		self.current_question_part = 0
 		self.guessed_players.clear()
 		self.answer_guessed = None
-		
+	
+	def get_question_count(self):
+		return len(self.question_order)
+	
+	def get_question(self, idx):
+		return self.pack.questions[self.question_order[idx]]
+	
 	@staticmethod
-	def initialize_question_set(question_set):
-		result = validateQuestionFormat(question_set)
-		if result != FormatErrorCode.OK:
-			return result
-		
-		# generate candidate answer set
-		candidate_set = dict()
-		for option in question_set["misleadings"]:
-			candidate_set[option.lower()] = option
-		for question in question_set["questions"]:
-			question_candidate_set = set()
-			for candidate in question["candidates"]:
-				candidate_set[candidate.lower()] = candidate
-				question_candidate_set.add(candidate.lower())
-			question["candidates"] = question_candidate_set
-		question_set["candidates"] = candidate_set
-		
-		return 0
+	def get_format_error_text(errors, limit=10):
+		lines = [ f"> `{path or '(root)'}` (錯誤代碼: {code})" for path, code in errors[:limit] ]
+		if len(errors) > limit:
+			lines.append(f"> ...以及其他 {len(errors) - limit} 個錯誤")
+		return "\n".join(lines)
 	
 class SongGuesser(commands.Cog):
 	def __init__(self, bot):
-		directory = "temp"
-		if not os.path.exists(directory):
-			os.mkdir(directory)
+		for directory in [ "temp", ytdlp_pool_options["directory"] ]:
+			if not os.path.exists(directory):
+				os.makedirs(directory)
 			
 		self.bot = bot
 		self.games = dict()	 # <Guild, GameData>
+		self.restored = False
+		self.register_metrics()
+	
+	def register_metrics(self):
+		metrics.register("games", lambda: len(self.games))
+		metrics.register("games_playing", lambda: sum(1 for game in self.games.values() if game.step == GameStep.PLAYING))
+		metrics.register("downloads_queued", lambda: sum(len(queue) for queue in download_scheduler.queues.values()))
+		metrics.register("downloads_running", lambda: download_scheduler.running)
+		for key in download_scheduler.stats:
+			metrics.register(f"downloads_{key}_total", lambda key=key: download_scheduler.stats[key], "counter")
+		metrics.register("audio_workers_pending", lambda: audio_worker_pool.pending)
+		metrics.register("clip_cache_bytes", lambda: clip_cache.total_size)
+		metrics.register("clip_cache_pinned", lambda: len(clip_cache.pins))
 	
-	async def on_play_finished(self, e, game, message):
+	async def cog_load(self):
+		loop_watchdog.start()
+		if loop_watchdog_options["debug"]:
+			loop_watchdog.enable_debug(loop_watchdog_options["slow_callback_duration"])
+		try:
+			await metrics.start_server(metrics_options["host"], metrics_options["port"])
+		except OSError as e:
+			print(f"Failed to start metrics server on port {metrics_options['port']}: {e}")
+	
+	async def cog_unload(self):
+		audio_worker_pool.shutdown()
+		ytdlp_pool.close()
+		await metrics.stop_server()
+		await loop_watchdog.stop()
+	
+	async def on_play_finished(self, e, game, message_task):
 		if game.step != GameStep.PLAYING:
 			return
 			
 		if e:
 			print(f"[{game.guild_id}] Play question {game.current_question_idx + 1} part {game.current_question_part + 1} error: {e}")
+			metrics.increment("errors_total", stage="playback")
+		message = await message_task
 		await message.edit(content=f"第 {game.current_question_idx + 1} 題片段 {game.current_question_part + 1} 播放完畢，快用 `/猜` 指令搶答吧！")
 		
+	async def wait_voice_ready(self, game):
+		# 語音連線中斷重連的期間無法送出音訊，連線正常時不需要等待
+		loop = asyncio.get_running_loop()
+		deadline = loop.time() + playback_options["voice_ready_timeout"]
+		while not game.voice_client.is_connected():
+			if loop.time() >= deadline or game.step != GameStep.PLAYING:
+				return False
+			await asyncio.sleep(0.05)
+		return True
+		
 	async def play_part(self, game):
 		if game.step != GameStep.PLAYING:
 			return
@@ -152,31 +551,208 @@ class SongGuesser(commands.Cog):
 		if game.voice_client.is_playing():
 			game.voice_client.stop()
 			
-		source = await YTDLSource.get_part(game.current_question_part, game.guild_id)
-			
-		message = await game.text_channel.send(f"正在播放第 {game.current_question_idx + 1} 題片段 {game.current_question_part + 1}，使用 `/猜` 指令進行搶答")
-		await asyncio.sleep(2)
+		source = await YTDLSource.get_part(game.clip_files[game.current_question_part])
+		
+		# 片段已經準備好，語音連線可以送出時就立刻播放，提示訊息同時送出
+		message_task = asyncio.ensure_future(game.text_channel.send(f"正在播放第 {game.current_question_idx + 1} 題片段 {game.current_question_part + 1}，使用 `/猜` 指令進行搶答"))
+		if not await self.wait_voice_ready(game):
+			source.cleanup()
+			print(f"[{game.guild_id}] Voice connection is not ready, skip playing question {game.current_question_idx + 1} part {game.current_question_part + 1}")
+			await message_task
+			return
 		for i in range(2):
 			try:
-				game.voice_client.play(source, after=lambda e, game=game, message=message: asyncio.run_coroutine_threadsafe(self.on_play_finished(e, game, message), self.bot.loop))
+				source.play_time = time.perf_counter()
+				game.voice_client.play(source, after=lambda e, game=game, message_task=message_task: asyncio.run_coroutine_threadsafe(self.on_play_finished(e, game, message_task), self.bot.loop))
 				break
 			except Exception as e:
+				metrics.increment("errors_total", stage="play_part")
 				if not discord.opus.is_loaded():
 					_bitness = struct.calcsize('P') * 8
 					_target = 'x64' if _bitness > 32 else 'x86'
 					_filename = f"bin/libopus-0.{_target}.dll"
 					discord.opus.load_opus(_filename)
+		await message_task
+	
+	def prepare_question(self, game, idx):
+		if idx in game.prefetch_tasks:
+			return game.prefetch_tasks[idx]
+			
+		question = game.get_question(idx)
+		vid = question.vid
+		task = asyncio.ensure_future(YTDLSource.load_from_url(vid, question.get_parts(), game.guild_id))
+		game.prefetch_tasks[idx] = task
+		return task
+		
+	def schedule_prefetch(self, game):
+		begin = game.current_question_idx + 1
+		end = min(begin + prefetch_options["lookahead"], game.get_question_count())
+		for idx in range(begin, end):
+			self.prepare_question(game, idx)
 	
 	async def init_question(self, game):
+		while True:
+			if game.step != GameStep.PLAYING:
+				return
+				
+			game_store.save_progress(game)
+			begin = time.perf_counter()
+			idx = game.current_question_idx
+			task = game.prefetch_tasks.get(idx)
+			if task and task.done() and (task.cancelled() or task.exception()):
+				# 預先載入失敗的題目重新嘗試一次
+				del game.prefetch_tasks[idx]
+			task = self.prepare_question(game, idx)
+			self.schedule_prefetch(game)
+			
+			with metrics.span("question_prepare", guild_id=game.guild_id):
+				await asyncio.wait([ task ])
+			# 下載途中遊戲可能已經被中止，預先載入的工作也會一併被取消
+			if task.cancelled() or game.prefetch_tasks.get(idx) is not task:
+				return
+			del game.prefetch_tasks[idx]
+			if task.exception() is None:
+				break
+				
+			# 無法播放的題目直接跳過，不會停在沒有播放任何片段的狀態
+			await self.skip_question(game, idx, task.exception())
+			if game.step != GameStep.PLAYING:
+				return
+			if game.current_question_idx + 1 >= game.get_question_count():
+				await self.end_game(game)
+				return
+			game.current_question_idx += 1
+			
+		clip_files = task.result()
+		game.release_clips()
+		game.clip_files = clip_files
 		if game.step != GameStep.PLAYING:
+			game.release_clips()
 			return
-			
-		idx = game.current_question_idx
-		vid = game.question_set["questions"][idx]["vid"]
-		await YTDLSource.load_from_url(f"https://www.youtube.com/watch?v={vid}", game.question_set["questions"][idx]["parts"], game.guild_id, loop=self.bot.loop)
 		game.reset_question()
 		await self.play_part(game)
+		# 從切換題目到開始播放的總時間
+		metrics.observe("question_transition", time.perf_counter() - begin, guild_id=game.guild_id)
+	
+	async def skip_question(self, game, idx, error):
+		metrics.increment("errors_total", stage="question_prepare")
+		question = game.get_question(idx)
+		print(f"[{game.guild_id}] Failed to prepare question {idx + 1} ({question.vid}): {error}")
+		text = f"第 {idx + 1} 題 __{question.title}__ 無法播放，自動跳到下一題"
+		# 與檢查題庫時相同，暫時性的網路錯誤不會把題目永久排除
+		if not is_transient_error(error):
+			game.excluded_questions.add(game.question_order[idx])
+			game_store.save_excluded(game)
+			text += "，之後重新開始時也會略過這題"
+		try:
+			await game.text_channel.send(text)
+		except discord.HTTPException:
+			pass
+		
+	async def countdown(self, game, seconds):
+		'''
+		倒數的同時就開始準備第一題，倒數結束且片段準備好後才回傳
+		回傳 False 代表遊戲在等待期間被中止
+		'''
+		task = self.prepare_question(game, 0)
+		loop = asyncio.get_running_loop()
+		deadline = loop.time() + seconds
+		message = await game.text_channel.send(f"遊戲將於 {seconds} 秒後開始...")
+		text = message.content
+		while True:
+			if game.step == GameStep.STOPPED:
+				return False
+				
+			# 以截止時間計算剩餘秒數，編輯訊息花費的時間不會讓倒數變長
+			remaining = deadline - loop.time()
+			if remaining > 0:
+				new_text = f"遊戲將於 {math.ceil(remaining)} 秒後開始..."
+			elif not task.done():
+				new_text = "正在準備第一題..."
+			else:
+				break
+				
+			if new_text != text:
+				text = new_text
+				try:
+					await message.edit(content=text)
+				except discord.HTTPException:
+					pass
+					
+			remaining = deadline - loop.time()
+			if remaining > 0:
+				# 等到顯示的秒數需要更新為止
+				await asyncio.sleep(remaining - (math.ceil(remaining) - 1))
+			else:
+				await asyncio.wait([ task ])
+				
+		try:
+			await message.edit(content="遊戲開始！")
+		except discord.HTTPException:
+			pass
+		return game.step != GameStep.STOPPED
+		
+	async def warmup_game(self, game):
+		# 同時查詢所有影片的串流資訊，找出已經被刪除或無法播放的題目
+		vids = dict()	# <vid, [ 題庫內的題目 index ]>
+		for idx, question in enumerate(game.pack.questions):
+			vids.setdefault(question.vid, []).append(idx)
+		
+		message = await game.text_channel.send(f"正在檢查題庫內的影片... (0/{len(vids)})")
+		semaphore = asyncio.Semaphore(warmup_options["concurrency"])
+		progress = { "done": 0, "last_update": 0 }
+		dead_vids = []
+		unchecked_vids = []	# 重試後仍然是暫時性錯誤的影片，不能確定無法播放，不會被排除
+		
+		async def check(vid):
+			async with semaphore:
+				if game.step == GameStep.STOPPED:
+					return
+				try:
+					await YTDLSource.resolve(vid, game.guild_id)
+				except Exception as e:
+					if is_transient_error(e):
+						print(f"[{game.guild_id}] Video {vid} could not be checked: {e}")
+						unchecked_vids.append(vid)
+					else:
+						print(f"[{game.guild_id}] Video {vid} is unavailable: {e}")
+						dead_vids.append(vid)
+			
+			progress["done"] += 1
+			# 避免太頻繁編輯訊息被 discord 限制
+			now = self.bot.loop.time()
+			if now - progress["last_update"] >= 1:
+				progress["last_update"] = now
+				try:
+					await message.edit(content=f"正在檢查題庫內的影片... ({progress['done']}/{len(vids)})")
+				except discord.HTTPException:
+					pass
+		
+		await asyncio.gather(*(check(vid) for vid in vids))
+		if game.step == GameStep.STOPPED:
+			return
+		
+		result_text = f"已檢查題庫內的 {len(vids)} 部影片"
+		if dead_vids:
+			dead_questions = [ idx for vid in dead_vids for idx in vids[vid] ]
+			game.excluded_questions.update(dead_questions)
+			game.question_order = array("i", [ idx for idx in game.question_order if idx not in game.excluded_questions ])
+			
+			titles = [ game.pack.questions[idx].title for idx in dead_questions ]
+			result_text += f"，以下 {len(titles)} 題無法播放，將會被略過：\n> " + "\n> ".join(titles[:10])
+			if len(titles) > 10:
+				result_text += f"\n> ...以及其他 {len(titles) - 10} 題"
+		if unchecked_vids:
+			result_text += f"\n另有 {len(unchecked_vids)} 部影片因為網路問題暫時無法檢查，仍會保留在題庫中"
+		try:
+			await message.edit(content=result_text)
+		except discord.HTTPException:
+			pass
 		
+		# 先準備好前幾題的片段，開始後就不需要等待下載
+		for idx in range(min(warmup_options["clips"], game.get_question_count())):
+			self.prepare_question(game, idx)
+	
 	async def next_question(self, interaction, current_question_idx = -1, button = None):
 		game = await self.game_command_pre_check(interaction)
 		if not game:
@@ -192,10 +768,10 @@ class SongGuesser(commands.Cog):
 		
 		# 點按鈕代表沒人猜出來要跳過，顯示答案
 		if button:
-			vid = game.question_set["questions"][current_question_idx]["vid"]
+			vid = game.get_question(current_question_idx).vid
 			await game.text_channel.send(f"沒有人猜出來，公布答案：\nhttps://www.youtube.com/watch?v={vid}")
 			
-		if game.current_question_idx + 1 >= len(game.question_set["questions"]):
+		if game.current_question_idx + 1 >= game.get_question_count():
 			await self.settle_game(interaction)
 			return
 			
@@ -211,7 +787,12 @@ class SongGuesser(commands.Cog):
 			button.disabled = True
 			await interaction.response.edit_message(view=button.view)
 			
+		await self.end_game(game)
+	
+	async def end_game(self, game):
 		game.step = GameStep.WAITING
+		game.cancel_prefetch()
+		game_store.save_progress(game)
 		
 		end_hint = "\n可以使用 `/重新開始` 指令再玩一次\n或用 `/開始遊戲` 指令遊玩其它題庫"
 		if len(game.player_scores) == 0:
@@ -225,11 +806,12 @@ class SongGuesser(commands.Cog):
 	# =========================================================================================
 
 	@app_commands.command(name = "開始遊戲")
-	@app_commands.describe(attachment = "上傳題庫的JSON檔案")
+	@app_commands.describe(attachment = f"上傳題庫的JSON檔案，或是編譯過的{PACK_FILE_EXTENSION}檔案")
 	@app_commands.describe(strict_mode = "嚴格模式，設為True時每名玩家一個片段只能猜測一次答案")
+	@app_commands.describe(warmup = "開始前先檢查所有影片是否能播放，並略過無法播放的題目")
 	@app_commands.default_permissions(moderate_members=True)
 	@app_commands.checks.has_permissions(moderate_members=True)
-	async def start(self, interaction, attachment: discord.Attachment, strict_mode: bool):
+	async def start(self, interaction, attachment: discord.Attachment, strict_mode: bool, warmup: bool = False):
 		"""上傳題庫，開始一場猜歌遊戲"""
 		try:
 			if interaction.guild.id not in self.games:
@@ -244,16 +826,23 @@ class SongGuesser(commands.Cog):
 				await interaction.response.send_message(f"你必須在語音頻道內才能開啟一場遊戲", ephemeral=True)
 				return
 				
+			# 過大的檔案不用下載就直接拒絕
+			if attachment.size > MAX_FILE_SIZE:
+				await interaction.response.send_message(f"題庫檔案 {attachment.filename} 超過 {MAX_FILE_SIZE // 1024 // 1024} MB 的大小上限，無法開始遊戲", ephemeral=True)
+				return
+				
 			try:
 				data = await attachment.read()
-				question_set = json.loads(data.decode("utf8"))
-				initialize_result = GameData.initialize_question_set(question_set)
-				if initialize_result != 0:
-					await interaction.response.send_message(f"題庫檔案 {attachment.filename} 的格式不符，無法開始遊戲 (錯誤代碼: {initialize_result})", ephemeral=True)
+				pack, errors = await self.load_pack(data)
+				if errors:
+					await interaction.response.send_message(f"題庫檔案 {attachment.filename} 的格式不符，無法開始遊戲\n{GameData.get_format_error_text(errors)}", ephemeral=True)
 					return
-				game.question_set = question_set
+				game.pack = pack
+				game.excluded_questions = set()
+				game_store.save_pack(pack.digest, data)
 			except:
 				await interaction.response.send_message(f"上傳題庫檔案 {attachment.filename} 時發生錯誤，請檢查檔案內容是否正確", ephemeral=True)
+				return
 				
 			voice_client = interaction.guild.voice_client
 			if voice_client is None:
@@ -271,27 +860,68 @@ class SongGuesser(commands.Cog):
 			game.voice_client = voice_client
 			game.step = GameStep.WAITING
 			game.one_guess_per_part = strict_mode
+			game.count_members()
+			self.update_idle_timer(game)
 			
-			title = game.question_set["title"]
-			author = game.question_set["author"]
+			title = game.pack.title
+			author = game.pack.author
 			await interaction.response.send_message(f"{interaction.user.name} 開始了 __**{title} (by {author})**__ 的猜歌遊戲\n加入 <#{game.channel.id}> 頻道一起遊玩吧！")
 			
-			#倒數後直接開始第一題
-			message = await game.text_channel.send("遊戲將於 5 秒後開始...")
-			for i in range(4, -1, -1):
-				await asyncio.sleep(1)
+			game.reset_progress()
+			if warmup:
+				await self.warmup_game(game)
 				if game.step == GameStep.STOPPED:
 					return
-				
-				if i > 0:
-					await message.edit(content=f"遊戲將於 {i} 秒後開始...")
-				else:
-					await message.edit(content=f"遊戲即將開始...")
+				if game.get_question_count() == 0:
+					game.step = GameStep.WAITING
+					await game.text_channel.send("題庫內沒有任何可以播放的題目，無法開始遊戲")
+					return
+			
+			# 倒數的同時準備第一題，結束後直接開始播放
+			if not await self.countdown(game, playback_options["countdown"]):
+				return
 			
 			game.step = GameStep.PLAYING
-			game.reset_progress()
+			game_store.save_game(game)
 			await self.init_question(game)
 		except Exception:
+			metrics.increment("errors_total", stage="start")
+			traceback.print_exc()
+		
+	@app_commands.command(name = "編譯題庫")
+	@app_commands.describe(attachment = "上傳題庫的JSON檔案")
+	@app_commands.default_permissions(moderate_members=True)
+	@app_commands.checks.has_permissions(moderate_members=True)
+	async def compile_pack(self, interaction, attachment: discord.Attachment):
+		"""把題庫編譯成載入速度更快的格式，可以直接用於開始遊戲"""
+		try:
+			if attachment.size > MAX_FILE_SIZE:
+				await interaction.response.send_message(f"題庫檔案 {attachment.filename} 超過 {MAX_FILE_SIZE // 1024 // 1024} MB 的大小上限", ephemeral=True)
+				return
+				
+			try:
+				data = await attachment.read()
+				pack, errors = await self.load_pack(data)
+				if errors:
+					await interaction.response.send_message(f"題庫檔案 {attachment.filename} 的格式不符，無法編譯\n{GameData.get_format_error_text(errors)}", ephemeral=True)
+					return
+					
+				# 題庫是唯讀的，可以在其他執行緒編譯，避免大型題庫卡住 event loop
+				with metrics.span("pack_compile"):
+					compiled = await asyncio.get_running_loop().run_in_executor(None, pack.compile)
+			except Exception:
+				traceback.print_exc()
+				await interaction.response.send_message(f"編譯題庫檔案 {attachment.filename} 時發生錯誤，請檢查檔案內容是否正確", ephemeral=True)
+				return
+				
+			# 編譯後包含搜尋索引，檔案可能比原本的 JSON 大
+			if len(compiled) > MAX_FILE_SIZE:
+				await interaction.response.send_message(f"題庫 __**{pack.title}**__ 編譯後超過 {MAX_FILE_SIZE // 1024 // 1024} MB 的大小上限，請直接使用 JSON 檔案開始遊戲", ephemeral=True)
+				return
+			filename = os.path.splitext(attachment.filename)[0] + PACK_FILE_EXTENSION
+			await interaction.response.send_message(f"已編譯 __**{pack.title}**__ 共 {len(pack.questions)} 題", file=discord.File(io.BytesIO(compiled), filename), ephemeral=True)
+		except Exception:
+			metrics.increment("errors_total", stage="compile")
 			traceback.print_exc()
 		
 	@app_commands.command(name = "結束遊戲")
@@ -304,14 +934,9 @@ class SongGuesser(commands.Cog):
 			await interaction.response.send_message("當前伺服器沒有舉行中的猜歌遊戲", ephemeral=True)
 			return
 		
-		voice_client = interaction.guild.voice_client
-		if voice_client is not None:
-			await voice_client.disconnect()
-			
 		game = self.games[interaction.guild.id]
-		game.step = GameStep.STOPPED
+		await self.close_game(interaction.guild.id)
 		await interaction.response.send_message(f"已中止在 <#{game.channel.id}> 舉行的猜歌遊戲")
-		del self.games[interaction.guild.id]
 		
 	# =========================================================================================
 	
@@ -368,7 +993,7 @@ class SongGuesser(commands.Cog):
 		if not game:
 			return
 			
-		if game.current_question_part + 1 >= len(game.question_set["questions"][game.current_question_idx]["parts"]):
+		if game.current_question_part + 1 >= game.get_question(game.current_question_idx).get_part_count():
 			await interaction.response.send_message("已經沒有更多歌曲片段了！", ephemeral=True)
 			return
 			
@@ -408,8 +1033,9 @@ class SongGuesser(commands.Cog):
 		game.guessed_players.add(interaction.user)
 		
 		idx = game.current_question_idx
-		if answer.lower() in game.question_set["questions"][idx]["candidates"]:
-			vid = game.question_set["questions"][idx]["vid"]
+		question = game.get_question(idx)
+		if answer.lower() in question.candidates:
+			vid = question.vid
 			await interaction.response.send_message(f"⭕ {interaction.user.name} 猜：{answer}\n成功獲得一分！\n使用 `/下一題` 指令繼續遊戲\nhttps://www.youtube.com/watch?v={vid}")
 			game.answer_guessed = True
 			
@@ -417,6 +1043,7 @@ class SongGuesser(commands.Cog):
 				game.player_scores[interaction.user] = 1
 			else:
 				game.player_scores[interaction.user] += 1
+			game_store.save_score(game, interaction.user)
 		else:
 			await interaction.response.send_message(f"❌ {interaction.user.name} 猜：{answer}")
 	
@@ -438,17 +1065,11 @@ class SongGuesser(commands.Cog):
 			return
 		
 		lowered_answer = answer.lower()
-		if lowered_answer not in game.question_set["candidates"]:
+		if lowered_answer not in game.pack.candidates:
 			# 讓他看相關的選項
-			related_list = []
-			tokens = lowered_answer.split()
-			over_10_candidates = False
-			for candidate in game.question_set["candidates"]:
-				if all(candidate.find(token) >= 0 for token in tokens):
-					if len(related_list) >= 10:
-						over_10_candidates = True
-						break
-					related_list.append(game.question_set["candidates"][candidate])
+			with metrics.span("search", guild_id=game.guild_id):
+				related_list, related_count = game.pack.candidate_index.search(answer, 10)
+			over_10_candidates = related_count > 10
 			
 			if len(related_list) == 0:
 				await interaction.response.send_message("沒有任何符合或相似的選項，建議使用更廣泛的關鍵字", ephemeral=True)
@@ -466,6 +1087,16 @@ class SongGuesser(commands.Cog):
 			
 		await self.guessAccurate(interaction, answer)
 	
+	@guess.autocomplete("answer")
+	async def guess_autocomplete(self, interaction, current: str):
+		game = self.games.get(interaction.guild_id)
+		if not game or game.step != GameStep.PLAYING:
+			return []
+		
+		with metrics.span("autocomplete", guild_id=game.guild_id):
+			options = game.pack.candidate_index.complete(current)
+		return [ app_commands.Choice(name=option, value=option) for option in options ]
+	
 	@app_commands.command(name = "結算")
 	@app_commands.default_permissions(moderate_members=True)
 	@app_commands.checks.has_permissions(moderate_members=True)
@@ -498,24 +1129,168 @@ class SongGuesser(commands.Cog):
 		if not game:
 			return
 			
-		title = game.question_set["title"]
-		await interaction.response.send_message(f"{interaction.user.name} 重新開始了一輪 __**{title}**__ 的猜歌遊戲！\n遊戲即將開始...")
-		# 倒數 3 秒
-		await asyncio.sleep(3)
-		# 重置遊戲進度，開始播放第一題
-		game.step = GameStep.PLAYING
+		title = game.pack.title
+		await interaction.response.send_message(f"{interaction.user.name} 重新開始了一輪 __**{title}**__ 的猜歌遊戲！")
+		# 重置遊戲進度，倒數的同時準備新一輪的第一題
+		game.step = GameStep.WAITING
+		if game.voice_client.is_playing():
+			game.voice_client.stop()
 		game.reset_progress()
+		if game.get_question_count() == 0:
+			await game.text_channel.send("題庫內沒有任何可以播放的題目，無法開始遊戲")
+			return
+		if not await self.countdown(game, playback_options["restart_countdown"]):
+			return
+		game.step = GameStep.PLAYING
+		game_store.save_game(game)
 		await self.init_question(game)
 	
 	# =========================================================================================
 
-	async def check_auto_stop(self):
-		for guild in self.bot.guilds:
-			for vc in guild.voice_channels:
-				if len(vc.members) == 1 and self.bot.user in vc.members:
-					await vc.guild.voice_client.disconnect()
-					if guild.id in self.games:
-						del self.games[guild.id]
+	@commands.Cog.listener()
+	async def on_ready(self):
+		# 重新連線時也會觸發，只在啟動時恢復一次
+		if self.restored:
+			return
+		self.restored = True
+		await self.restore_games()
+	
+	@staticmethod
+	async def load_pack(data):
+		# 解析 JSON、檢查格式與建立搜尋索引對大型題庫要花上一秒以上，在其他執行緒進行避免卡住 event loop
+		with metrics.span("pack_load"):
+			return await asyncio.get_running_loop().run_in_executor(None, load_question_pack, data)
+	
+	async def restore_games(self):
+		# 接續機器人關閉前進行中的遊戲，已經暫存過的片段可以直接使用
+		for record in await game_store.load_games():
+			guild_id = record["guild_id"]
+			# 分片模式下只恢復這個程序負責的伺服器
+			if self.bot.shard_count and (guild_id >> 22) % self.bot.shard_count not in (self.bot.shard_ids or range(self.bot.shard_count)):
+				continue
+			guild = self.bot.get_guild(guild_id)
+			voice_channel = guild.get_channel(record["voice_channel_id"]) if guild else None
+			text_channel = guild.get_channel(record["text_channel_id"]) if guild else None
+			if record["step"] != GameStep.PLAYING or not voice_channel or not text_channel or guild_id in self.games:
+				game_store.remove_game(guild_id)
+				continue
+				
+			pack, errors = await self.load_pack(record["data"])
+			question_order = array("i", record["question_order"])
+			if errors or record["question_idx"] >= len(question_order):
+				game_store.remove_game(guild_id)
+				continue
+			
+			game = GameData(guild_id)
+			game.pack = pack
+			game.question_order = question_order
+			game.excluded_questions = set(array("i", record["excluded_questions"]))
+			game.current_question_idx = record["question_idx"]
+			game.one_guess_per_part = bool(record["strict_mode"])
+			game.channel = voice_channel
+			game.text_channel = text_channel
+			self.games[guild_id] = game
+			try:
+				for user_id, score in record["scores"]:
+					user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+					game.player_scores[user] = score
+					
+				if guild.voice_client is None:
+					await voice_channel.connect()
+				else:
+					await guild.voice_client.move_to(voice_channel)
+				game.voice_client = guild.voice_client
+				game.step = GameStep.PLAYING
+				game.count_members()
+				self.update_idle_timer(game)
+				
+				await text_channel.send(f"機器人已重新啟動，接續進行 __**{pack.title}**__ 的第 {game.current_question_idx + 1} 題")
+				asyncio.ensure_future(self.init_question(game)).add_done_callback(self.on_restore_done)
+			except Exception:
+				traceback.print_exc()
+				await self.close_game(guild_id)
+	
+	@staticmethod
+	def on_restore_done(task):
+		# 接續的第一題在背景進行，錯誤不會傳回 restore_games
+		if not task.cancelled() and task.exception() is not None:
+			metrics.increment("errors_total", stage="restore")
+			traceback.print_exception(task.exception())
+	
+	async def close_game(self, guild_id):
+		# 釋放遊戲佔用的所有資源並離開語音頻道
+		game = self.games.pop(guild_id, None)
+		if game:
+			game_store.remove_game(guild_id)
+			game.step = GameStep.STOPPED
+			game.cancel_idle_timer()
+			game.cancel_prefetch()
+			game.release_clips()
+		
+		guild = self.bot.get_guild(guild_id)
+		if guild and guild.voice_client is not None:
+			await guild.voice_client.disconnect()
+	
+	async def auto_stop(self, game):
+		await asyncio.sleep(auto_stop_options["grace_period"])
+		game.idle_task = None
+		if self.games.get(game.guild_id) is game and game.member_count == 0:
+			print(f"[{game.guild_id}] No players left in voice channel, stop the game")
+			await self.close_game(game.guild_id)
+	
+	def update_idle_timer(self, game):
+		if game.member_count > 0:
+			game.cancel_idle_timer()
+		elif game.idle_task is None:
+			game.idle_task = asyncio.ensure_future(self.auto_stop(game))
+	
+	@commands.Cog.listener()
+	async def on_voice_state_update(self, member, before, after):
+		if before.channel == after.channel:
+			return
+		
+		game = self.games.get(member.guild.id)
+		if not game or game.step == GameStep.STOPPED or game.channel is None:
+			return
+		
+		if member == self.bot.user:
+			if after.channel is None:
+				# 機器人被踢出語音頻道
+				await self.close_game(member.guild.id)
+				return
+			game.channel = after.channel
+			game.count_members()
+		elif not member.bot:
+			if before.channel == game.channel:
+				game.member_count -= 1
+			if after.channel == game.channel:
+				game.member_count += 1
+		else:
+			return
+		self.update_idle_timer(game)
+		
+	@commands.command()
+	async def downloads(self, ctx) -> None:
+		if not ctx.message.author.guild_permissions.moderate_members:
+			return
+			
+		metrics = download_scheduler.get_metrics()
+		await ctx.send("\n".join(f"{key}: {value}" for key, value in metrics.items()))
+		
+	@commands.command()
+	async def lag(self, ctx) -> None:
+		if not ctx.message.author.guild_permissions.moderate_members:
+			return
+			
+		metrics = loop_watchdog.get_metrics()
+		text = "\n".join(f"{key}: {value}" for key, value in metrics.items())
+		if loop_watchdog.last_stall:
+			_, last_lag, stacks = loop_watchdog.last_stall
+			text += f"\nlast stall: {last_lag * 1000:.0f} ms"
+			if stacks:
+				# 只顯示最內層的幾行，完整的堆疊在 console 與 JSON 紀錄中
+				text += "\n```\n" + stacks[0][-1500:] + "```"
+		await ctx.send(text)
 		
 	@commands.command()
 	async def sync(self, ctx) -> None:
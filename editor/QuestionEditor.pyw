@@ -1,20 +1,23 @@
-import sys, os, json, re, pickle, copy
-from collections import OrderedDict
+import sys, os, json, re, copy, functools, threading, bisect
+from array import array
+import http.client
 
 sys.path.insert(0, '..')
 from cogs.format_checker import *
+from cogs.cache_index import CacheIndex
 
 import urllib
 from urllib.parse import urlparse
 from urllib.parse import parse_qs
 
 from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadCancelled
 from pytube import Playlist
 
 from PyQt6 import uic
 from PyQt6 import QtWidgets, QtGui
 from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
-from PyQt6.QtCore import Qt, QCoreApplication, QUrl, QSize, QTime, QRect
+from PyQt6.QtCore import Qt, QCoreApplication, QUrl, QSize, QTime, QRect, QObject, QThreadPool, QRunnable, QEventLoop, QTimer, QAbstractListModel, QModelIndex, pyqtSignal
 
 WINDOW_TITLE = "猜歌機器人題庫編輯器"
 YOUTUBE_ERROR_MSG = "無法載入指定的 Youtube 影片"
@@ -34,8 +37,13 @@ QUESTION_OBJ_TEMPLATE = {
 	"candidates": []
 }
 
-YOUTUBE_CACHE_INFO_FILE = "cache/data_v2.pickle"
-YOUTUBE_CACHE_AUDIO_FILE = "cache/audio_order.pickle"
+LEGACY_CACHE_FILES = ("cache/data_v2.pickle", "cache/audio_order.pickle")  # 舊版整份重寫的暫存紀錄
+
+YOUTUBE_INFO_WORKERS = 8	# 同時查詢影片資訊的數量，每個執行緒各自保留一條連線
+YOUTUBE_INFO_TIMEOUT = 10	# 秒
+AUDIO_DOWNLOAD_WORKERS = 2	# 同時在背景下載的音檔數量
+AUDIO_PREFETCH_COUNT = 3	# 選擇題目時預先下載列表中之後幾題的音檔
+SEARCH_DEBOUNCE_MS = 200	# 停止輸入多久後才開始搜尋
 
 
 
@@ -47,6 +55,7 @@ class UserSetting:
 		UserSetting.volume = 50
 		UserSetting.cache_size = 100  # MB
 		UserSetting.cache_info_count = 300
+		UserSetting.undo_memory = 64  # MB
 		UserSetting.load_file_path = ""
 		UserSetting.save_new_file_path = ""
 		
@@ -59,6 +68,7 @@ class UserSetting:
 			UserSetting.volume = userData.get("volume", 50)
 			UserSetting.cache_size = userData.get("cache_size", 100)
 			UserSetting.cache_info_count = userData.get("cache_info_count", 300)
+			UserSetting.undo_memory = userData.get("undo_memory", 64)
 			UserSetting.load_file_path = userData.get("load_file_path", "")
 			UserSetting.save_new_file_path = userData.get("save_new_file_path", "")
 	
@@ -69,17 +79,222 @@ class UserSetting:
 				"volume": UserSetting.volume,
 				"cache_size": UserSetting.cache_size,
 				"cache_info_count": UserSetting.cache_info_count,
+				"undo_memory": UserSetting.undo_memory,
 				"load_file_path": UserSetting.load_file_path,
 				"save_new_file_path": UserSetting.save_new_file_path
 			}, indent=4))
 
 
 
+noembed_local = threading.local()
+
+def requestYoutubeInfo(vid):
+	'''
+	向 noembed 查詢影片資訊，無法取得時回傳 None
+	可以在任意執行緒呼叫，每個執行緒重複使用自己的連線，連線中斷時重新連線一次
+	'''
+	path = f"/embed?url=https://www.youtube.com/watch?v={vid}"
+	for retry in range(2):
+		connection = getattr(noembed_local, "connection", None)
+		if connection is None:
+			connection = noembed_local.connection = http.client.HTTPSConnection("noembed.com", timeout = YOUTUBE_INFO_TIMEOUT)
+		try:
+			connection.request("GET", path)
+			data = json.loads(connection.getresponse().read().decode("utf8"))
+			break
+		except (OSError, http.client.HTTPException):
+			connection.close()
+			noembed_local.connection = None
+		except ValueError:
+			return None
+	else:
+		return None
+		
+	if "error" in data:
+		return None
+	try:
+		return {
+			"title": data["title"],
+			"author": data["author_name"],
+			"thumbnail": data["thumbnail_url"]
+		}
+	except KeyError:
+		return None
+
+class YoutubeInfoLoader(QObject):
+	'''
+	在背景執行緒同時查詢多部影片的資訊，同時進行的數量由執行緒數量限制
+	每次 load 會產生新的批次編號，取消後舊批次還沒開始的查詢會直接略過
+	'''
+	loaded = pyqtSignal(int, str, object)	# (批次編號, vid, info)，在主執行緒發出，無法取得時 info 為 None
+	finished = pyqtSignal(int, str, object)	# 由背景執行緒發出，轉接到 loaded 讓接收端都在主執行緒執行
+	
+	def __init__(self, max_workers):
+		super().__init__()
+		self.pool = QThreadPool(self)
+		self.pool.setMaxThreadCount(max_workers)
+		self.batch = 0
+		self.finished.connect(self.loaded)
+		
+	def load(self, vids):
+		self.batch += 1
+		for vid in vids:
+			self.pool.start(functools.partial(self.run, self.batch, vid))
+		return self.batch
+		
+	def run(self, batch, vid):
+		if batch != self.batch:
+			return
+		self.finished.emit(batch, vid, requestYoutubeInfo(vid))
+		
+	def cancel(self):
+		self.batch += 1
+		self.pool.clear()
+
+
+
+YTDLP_FORMAT_OPTIONS = {
+	'format': 'bestaudio',
+	'restrictfilenames': True,
+	'noplaylist': True,
+	'nocheckcertificate': True,
+	'ignoreerrors': False,
+	'logtostderr': False,
+	'quiet': True,
+	'no_warnings': True,
+	'default_search': 'auto',
+	'source_address': '0.0.0.0',  # bind to ipv4 since ipv6 addresses cause issues sometimes
+}
+
+class AudioDownloader(QObject):
+	'''
+	在背景執行緒下載音檔到 cache 資料夾，同一部影片同時只會有一個下載
+	下載前會先發出串流網址，讓播放器不用等待整個檔案下載完成
+	預先下載使用獨立的執行緒，不會佔用使用者要播放的影片的下載
+	'''
+	resolved = pyqtSignal(str, object)		# (vid, 串流網址)，無法取得時為 None
+	progress = pyqtSignal(str, int, int)	# (vid, 已下載 bytes, 總 bytes)，總大小未知時為 0
+	finished = pyqtSignal(str, bool)		# (vid, 是否下載成功)
+	# 由背景執行緒發出，轉到主執行緒處理
+	thread_resolved = pyqtSignal(str, object)
+	thread_finished = pyqtSignal(str, bool)
+	
+	PRIORITY_PREFETCH = 0
+	PRIORITY_PLAY = 1
+	
+	def __init__(self, max_workers):
+		super().__init__()
+		self.pools = {
+			AudioDownloader.PRIORITY_PREFETCH: QThreadPool(self),
+			AudioDownloader.PRIORITY_PLAY: QThreadPool(self),
+		}
+		self.pools[AudioDownloader.PRIORITY_PREFETCH].setMaxThreadCount(1)
+		self.pools[AudioDownloader.PRIORITY_PLAY].setMaxThreadCount(max_workers)
+		self.tasks = dict()			# <vid, (QRunnable, priority)>，還沒完成的下載
+		self.stream_urls = dict()	# <vid, 串流網址>，下載中的影片已取得的串流網址
+		self.stopped = False
+		self.thread_resolved.connect(self.onResolved)
+		self.thread_finished.connect(self.onFinished)
+		
+	def download(self, vid, priority):
+		if vid in self.tasks:
+			task, task_priority = self.tasks[vid]
+			# 還在排隊的預先下載改成立即處理
+			if priority > task_priority and self.pools[task_priority].tryTake(task):
+				self.start(vid, priority)
+			if vid in self.stream_urls:
+				self.resolved.emit(vid, self.stream_urls[vid])
+			return
+			
+		self.start(vid, priority)
+		
+	def start(self, vid, priority):
+		task = QRunnable.create(functools.partial(self.run, vid))
+		self.tasks[vid] = (task, priority)
+		self.pools[priority].start(task)
+		
+	def cancelPrefetch(self):
+		pool = self.pools[AudioDownloader.PRIORITY_PREFETCH]
+		for vid, (task, priority) in list(self.tasks.items()):
+			if priority == AudioDownloader.PRIORITY_PREFETCH and pool.tryTake(task):
+				del self.tasks[vid]
+		
+	def stop(self):
+		'''關閉編輯器時使用，之後不會再下載任何音檔'''
+		# 還在排隊的直接取消，下載中的會在下一次回報進度時中止，並在結束時自行移除紀錄
+		self.stopped = True
+		for vid, (task, priority) in list(self.tasks.items()):
+			if self.pools[priority].tryTake(task):
+				del self.tasks[vid]
+		
+	def run(self, vid):
+		def hook(status):
+			if self.stopped:
+				raise DownloadCancelled()
+			if status["status"] == "downloading":
+				self.progress.emit(vid, status.get("downloaded_bytes") or 0, status.get("total_bytes") or status.get("total_bytes_estimate") or 0)
+				
+		options = dict(YTDLP_FORMAT_OPTIONS, outtmpl = f"cache/{vid}", progress_hooks = [ hook ])
+		resolved = False
+		success = False
+		try:
+			with YoutubeDL(options) as ytdl:
+				info = ytdl.extract_info(f"https://www.youtube.com/watch?v={vid}", download = False)
+				self.thread_resolved.emit(vid, info.get("url"))
+				resolved = True
+				ytdl.process_ie_result(info, download = True)
+			success = os.path.isfile(f"cache/{vid}")
+		except Exception:
+			if not resolved:
+				self.thread_resolved.emit(vid, None)
+		self.thread_finished.emit(vid, success)
+		
+	def onResolved(self, vid, url):
+		if url:
+			self.stream_urls[vid] = url
+		self.resolved.emit(vid, url)
+		
+	def onFinished(self, vid, success):
+		self.tasks.pop(vid, None)
+		self.stream_urls.pop(vid, None)
+		self.finished.emit(vid, success)
+
+
+
+UNREACHABLE_SAVE_IDX = -2	# 存檔時的狀態已經無法透過復原/重做回到
+
+def estimateSize(value):
+	# 只需要大概的數字決定何時刪除舊的紀錄，和其他物件共用的字串也會被重複計算
+	if type(value) is dict:
+		return sys.getsizeof(value) + sum(estimateSize(k) + estimateSize(v) for k, v in value.items())
+	if type(value) is list:
+		return sys.getsizeof(value) + sum(estimateSize(v) for v in value)
+	return sys.getsizeof(value)
+
+# 所有紀錄都直接保存被修改的物件而不複製，之後對該物件的修改也都會有紀錄，依序復原/重做時內容會一致
+
 class ModifyRecord:
+	'''修改單一欄位，或插入/刪除列表中單一項目的紀錄'''
 	def __init__(self, path, before, after):
 		self.path = path
-		self.before = copy.deepcopy(before)
-		self.after = copy.deepcopy(after)
+		self.before = before
+		self.after = after
+		self.size = estimateSize(path) + estimateSize(before) + estimateSize(after)
+
+class PermuteRecord:
+	'''重新排序列表的紀錄，排序後的第 i 項是排序前的第 order[i] 項'''
+	def __init__(self, path, order):
+		self.path = path
+		self.order = array("I", order)
+		self.size = estimateSize(path) + sys.getsizeof(self.order)
+
+class ExtendRecord:
+	'''在列表尾端加入多個項目的紀錄'''
+	def __init__(self, path, start, items):
+		self.path = path
+		self.start = start
+		self.items = items
+		self.size = estimateSize(path) + estimateSize(items)
 
 
 
@@ -107,19 +322,225 @@ class Slider(QtWidgets.QSlider):
 
 
 
+class QuestionTitleIndex:
+	'''
+	題目標題的搜尋索引，以單字與雙字 n-gram 建立反向索引，隨著列表的修改逐列更新
+	每一列對應一個不會改變的 id，新增、刪除與排序題目時只需要移動 id，不需要重新切割 n-gram
+	繼續輸入關鍵字時只需要在上一次的結果中篩選
+	'''
+	def __init__(self):
+		self.ids = []			# 每一列對應的 id
+		self.titles = dict()	# <id, 小寫後的標題>
+		self.postings = dict()	# <gram, set(id)>
+		self.rows = None		# <id, 列>，列表的結構改變後要用到時才重新建立
+		self.next_id = 0
+		self.last_text = ""
+		self.last_rows = None
+	
+	@staticmethod
+	def getGrams(title):
+		return { title[i:i + n] for n in (1, 2) for i in range(len(title) - n + 1) }
+	
+	def invalidate(self):
+		self.last_rows = None
+	
+	def addTitle(self, idx, title):
+		title = title.lower()
+		self.titles[idx] = title
+		for gram in self.getGrams(title):
+			if gram not in self.postings:
+				self.postings[gram] = set()
+			self.postings[gram].add(idx)
+	
+	def removeTitle(self, idx):
+		for gram in self.getGrams(self.titles.pop(idx)):
+			posting = self.postings[gram]
+			posting.discard(idx)
+			if not posting:
+				del self.postings[gram]
+	
+	def newIds(self, titles):
+		ids = []
+		for title in titles:
+			self.addTitle(self.next_id, title)
+			ids.append(self.next_id)
+			self.next_id += 1
+		return ids
+	
+	def reset(self, titles):
+		self.titles.clear()
+		self.postings.clear()
+		self.ids = self.newIds(titles)
+		self.rows = None
+		self.invalidate()
+	
+	def insert(self, row, titles):
+		self.ids[row:row] = self.newIds(titles)
+		self.rows = None
+		self.invalidate()
+	
+	def remove(self, row, count):
+		for idx in self.ids[row:row + count]:
+			self.removeTitle(idx)
+		del self.ids[row:row + count]
+		self.rows = None
+		self.invalidate()
+	
+	def set(self, row, title):
+		idx = self.ids[row]
+		self.removeTitle(idx)
+		self.addTitle(idx, title)
+		self.invalidate()
+	
+	def permute(self, order):
+		self.ids = [ self.ids[i] for i in order ]
+		self.rows = None
+		self.invalidate()
+	
+	def getRows(self):
+		if self.rows is None:
+			self.rows = { idx: row for row, idx in enumerate(self.ids) }
+		return self.rows
+	
+	def search(self, text):
+		'''回傳標題包含 text 的所有列，由小到大排序'''
+		text = text.lower()
+		if not text:
+			return []
+		if self.last_rows is not None and text.find(self.last_text) >= 0:
+			rows = [ i for i in self.last_rows if self.titles[self.ids[i]].find(text) >= 0 ]
+		else:
+			if len(text) == 1:
+				ids = self.postings.get(text, ())
+			else:
+				# 取所有雙字 gram 的交集，從最小的集合開始縮小範圍，最後再確認是否真的包含整個關鍵字
+				grams = sorted((self.postings.get(text[i:i + 2], set()) for i in range(len(text) - 1)), key=len)
+				ids = grams[0].intersection(*grams[1:]) if grams[0] else ()
+			rows = self.getRows()
+			rows = sorted(rows[idx] for idx in ids if self.titles[idx].find(text) >= 0)
+		self.last_text = text
+		self.last_rows = rows
+		return rows
+
+class QuestionListModel(QAbstractListModel):
+	'''
+	直接使用題庫內的題目列表，畫面只會向 model 讀取看得到的列
+	題目列表的新增、刪除、排序與標題修改都要透過這裡，才能通知畫面與更新搜尋索引
+	'''
+	titleEdited = pyqtSignal(int, str)  # 使用者在列表上修改標題，由編輯器檢查並記錄後再呼叫 setTitle
+	
+	def __init__(self):
+		super().__init__()
+		self.questions = []
+		self.title_index = QuestionTitleIndex()
+	
+	def rowCount(self, parent = QModelIndex()):
+		return 0 if parent.isValid() else len(self.questions)
+	
+	def data(self, index, role = Qt.ItemDataRole.DisplayRole):
+		if not index.isValid() or index.row() >= len(self.questions):
+			return None
+		if role == Qt.ItemDataRole.DisplayRole or role == Qt.ItemDataRole.EditRole:
+			return self.questions[index.row()]["title"]
+		return None
+	
+	def flags(self, index):
+		return super().flags(index) | Qt.ItemFlag.ItemIsEditable
+	
+	def setData(self, index, value, role = Qt.ItemDataRole.EditRole):
+		if role != Qt.ItemDataRole.EditRole or not index.isValid():
+			return False
+		self.titleEdited.emit(index.row(), value)
+		return True
+	
+	def setQuestions(self, questions):
+		self.beginResetModel()
+		self.questions = questions
+		self.title_index.reset(question["title"] for question in questions)
+		self.endResetModel()
+	
+	def insertQuestion(self, row, question):
+		self.beginInsertRows(QModelIndex(), row, row)
+		self.questions.insert(row, question)
+		self.title_index.insert(row, [ question["title"] ])
+		self.endInsertRows()
+	
+	def removeQuestion(self, row):
+		self.beginRemoveRows(QModelIndex(), row, row)
+		del self.questions[row]
+		self.title_index.remove(row, 1)
+		self.endRemoveRows()
+	
+	def extendQuestions(self, questions):
+		if not questions:
+			return
+		start = len(self.questions)
+		self.beginInsertRows(QModelIndex(), start, start + len(questions) - 1)
+		self.questions.extend(questions)
+		self.title_index.insert(start, [ question["title"] for question in questions ])
+		self.endInsertRows()
+	
+	def truncateQuestions(self, start):
+		if start >= len(self.questions):
+			return
+		self.beginRemoveRows(QModelIndex(), start, len(self.questions) - 1)
+		self.title_index.remove(start, len(self.questions) - start)
+		del self.questions[start:]
+		self.endRemoveRows()
+	
+	def permuteQuestions(self, order):
+		'''排序後的第 i 列是排序前的第 order[i] 列，選擇的題目會跟著移動'''
+		self.layoutAboutToBeChanged.emit()
+		new_rows = [ 0 ] * len(order)
+		for i, j in enumerate(order):
+			new_rows[j] = i
+		persistent = self.persistentIndexList()
+		self.changePersistentIndexList(persistent, [ self.index(new_rows[index.row()]) for index in persistent ])
+		self.questions[:] = [ self.questions[i] for i in order ]
+		self.title_index.permute(order)
+		self.layoutChanged.emit()
+	
+	def setTitle(self, row, title):
+		self.questions[row]["title"] = title
+		self.title_index.set(row, title)
+		index = self.index(row)
+		self.dataChanged.emit(index, index, [ Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole ])
+
+class SearchHighlightDelegate(QtWidgets.QStyledItemDelegate):
+	'''只在畫出看得到的列時才檢查是否為搜尋結果，不需要逐列設定背景'''
+	def __init__(self, brush, select_brush, parent = None):
+		super().__init__(parent)
+		self.brush = brush
+		self.select_brush = select_brush
+		self.rows = set()
+		self.select_row = -1
+	
+	def setHighlights(self, rows, select_row):
+		self.rows = set(rows)
+		self.select_row = select_row
+	
+	def paint(self, painter, option, index):
+		row = index.row()
+		if row == self.select_row:
+			painter.fillRect(option.rect, self.select_brush)
+		elif row in self.rows:
+			painter.fillRect(option.rect, self.brush)
+		super().paint(painter, option, index)
+
+
 # 參考 settings.ui 生成的程式碼調整
 class SettingWindow(QtWidgets.QDialog):
 	def __init__(self):
 		super().__init__()
 		
-		self.resize(200, 120)
-		self.setMinimumSize(200, 120)
-		self.setMaximumSize(200, 120)
+		self.resize(200, 170)
+		self.setMinimumSize(200, 170)
+		self.setMaximumSize(200, 170)
 		self.setModal(True)
 		self.setWindowTitle("設定")
 		
 		self.verticalLayoutWidget = QtWidgets.QDialog(self)
-		self.verticalLayoutWidget.setGeometry(QRect(40, 10, 121, 101))
+		self.verticalLayoutWidget.setGeometry(QRect(40, 10, 121, 151))
 		self.verticalLayout = QtWidgets.QVBoxLayout(self.verticalLayoutWidget)
 		self.verticalLayout.setSpacing(0)
 		
@@ -158,6 +579,24 @@ class SettingWindow(QtWidgets.QDialog):
 		self.cache_info_setter.valueChanged.connect(self.changeCacheInfo)
 
 		self.verticalLayout.addWidget(self.cache_info_setter)
+
+		self.label_3 = QtWidgets.QLabel(self.verticalLayoutWidget)
+		self.label_3.setFont(font)
+		self.label_3.setAlignment(Qt.AlignmentFlag.AlignCenter)
+		self.label_3.setText(QCoreApplication.translate("SettingWindow", u"\u5fa9\u539f\u7d00\u9304\u8a18\u61b6\u9ad4\u4e0a\u9650", None))
+
+		self.verticalLayout.addWidget(self.label_3)
+
+		self.undo_memory_setter = QtWidgets.QSpinBox(self.verticalLayoutWidget)
+		self.undo_memory_setter.setAlignment(Qt.AlignmentFlag.AlignCenter)
+		self.undo_memory_setter.setMinimum(1)
+		self.undo_memory_setter.setMaximum(100000)
+		self.undo_memory_setter.setStepType(QtWidgets.QAbstractSpinBox.StepType.AdaptiveDecimalStepType)
+		self.undo_memory_setter.setValue(UserSetting.undo_memory)
+		self.undo_memory_setter.setSuffix(QCoreApplication.translate("SettingWindow", u" MB", None))
+		self.undo_memory_setter.valueChanged.connect(self.changeUndoMemory)
+
+		self.verticalLayout.addWidget(self.undo_memory_setter)
 		self.setLayout(self.verticalLayout)
 	
 	def changeCacheSize(self, value):
@@ -169,6 +608,11 @@ class SettingWindow(QtWidgets.QDialog):
 		if value < 0:
 			self.cache_info_setter.setValue(UserSetting.cache_info_count)
 		UserSetting.cache_info_count = value
+	
+	def changeUndoMemory(self, value):
+		if value < 0:
+			self.undo_memory_setter.setValue(UserSetting.undo_memory)
+		UserSetting.undo_memory = value
 
 # 參考 misleading_edit.ui 生成的程式碼調整
 class MisleadingAnsWindow(QtWidgets.QWidget):
@@ -292,40 +736,17 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		# 加載使用者設定資料
 		UserSetting.Load()
 		
-		# 影片資訊 cache
+		# 影片資訊與音檔的使用順序都記錄在 cache 資料夾的索引中，需要時才讀取
 		if not os.path.exists("cache"):
 			os.mkdir("cache")
-		if os.path.isfile(YOUTUBE_CACHE_INFO_FILE):
-			with open(YOUTUBE_CACHE_INFO_FILE, "rb") as f:
-				self.youtube_cache = pickle.load(f)
-				while len(self.youtube_cache) > UserSetting.cache_info_count:
-					self.youtube_cache.popitem(last = False)
-		else:
-			self.youtube_cache = OrderedDict()
-			
-		# 音檔 cache 紀錄
-		if os.path.isfile(YOUTUBE_CACHE_AUDIO_FILE):
-			with open(YOUTUBE_CACHE_AUDIO_FILE, "rb") as f:
-				self.youtube_audio_cache = pickle.load(f)
-		else:
-			self.youtube_audio_cache = OrderedDict()
-		# 保險起見用現有的檔案刷新一次資訊 (但保留紀錄的順序)
-		size_quota = UserSetting.cache_size * 1048576
-		self.cache_size_total = 0
-		for vid in self.youtube_audio_cache:
-			file_path = f"cache/{vid}"
+		self.cache_index = CacheIndex("cache")
+		for file_path in LEGACY_CACHE_FILES:
 			if os.path.isfile(file_path):
-				file_size = os.path.getsize(file_path)
-				self.youtube_audio_cache[vid] = file_size
-				self.cache_size_total += file_size
-			else:
-				del self.youtube_audio_cache[vid]
-		while self.cache_size_total > size_quota and len(self.youtube_audio_cache) > 0:
-			self.cache_size_total -= self.youtube_audio_cache.popitem(last = False)[1]
-		# 刪掉沒有控管的檔案
-		for file in os.listdir("cache"):
-			if "." not in file and file not in self.youtube_audio_cache:
-				os.remove(f"cache/{file}")
+				os.remove(file_path)
+		# 以現有的檔案修正索引，只有檔名為影片 ID 的音檔列入管理，沒有紀錄的音檔以修改時間決定順序
+		self.cache_index.reconcile(lambda name: "." not in name)
+		self.cache_index.trim_records(UserSetting.cache_info_count)
+		self.evictAudioCache(UserSetting.cache_size * 1048576)
 		
 		# 確認是否先存檔的 message box
 		self.check_save = QtWidgets.QMessageBox(self)
@@ -352,6 +773,16 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		
 		# 提示訊息
 		self.message_box = QtWidgets.QMessageBox(self)
+		
+		# 背景查詢影片資訊，查到的結果都會寫入暫存
+		self.youtube_info_loader = YoutubeInfoLoader(YOUTUBE_INFO_WORKERS)
+		self.youtube_info_loader.loaded.connect(self.onYoutubeInfoLoaded)
+		
+		# 背景下載音檔，下載完成前先用串流播放
+		self.audio_downloader = AudioDownloader(AUDIO_DOWNLOAD_WORKERS)
+		self.audio_downloader.resolved.connect(self.onAudioStreamResolved)
+		self.audio_downloader.progress.connect(self.onAudioDownloadProgress)
+		self.audio_downloader.finished.connect(self.onAudioDownloaded)
 
 		self.question_set = copy.deepcopy(QUESTION_SET_TEMPLATE)
 		self.question_vid_set = set()  # 紀錄當前題庫的影片 ID 列表
@@ -359,6 +790,8 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		self.file_path = None
 		
 		self.need_reload_media = False
+		self.waiting_media_vid = ""  # 等待取得串流網址的影片 ID
+		self.waiting_media_autoplay = False
 		self.dragPositionWasPlaying = False
 		self.next_media_start_time = None
 		self.auto_pause_time = -1
@@ -366,6 +799,7 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		self.modify_record = []
 		self.modify_record_idx = -1
 		self.save_modify_record_idx = -1
+		self.modify_record_size = 0  # 所有紀錄估計佔用的 bytes
 		
 		self.auto_select_qustion_idx = -1
 		self.auto_select_qustion_part_idx = -1
@@ -396,17 +830,26 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		self.edit_misleading_btn.clicked.connect(self.misleading_ans_window.show)
 		
 		# 題目列表
-		self.default_background_brush = QtGui.QBrush()
 		self.highlight_background_brush = QtGui.QBrush(QtGui.QColor(255, 255, 0))
 		self.highlight_select_background_brush = QtGui.QBrush(QtGui.QColor(255, 127, 0))
 		
-		self.question_list_widget.itemSelectionChanged.connect(self.updateQuestionDetail)
-		self.question_list_widget.itemChanged.connect(self.editQuestionTitle)
+		self.question_list_model = QuestionListModel()
+		self.question_list_model.setQuestions(self.question_set["questions"])
+		self.question_list_model.titleEdited.connect(self.editQuestionTitle)
+		self.question_list_delegate = SearchHighlightDelegate(self.highlight_background_brush, self.highlight_select_background_brush, self.question_list_view)
+		self.question_list_view.setModel(self.question_list_model)
+		self.question_list_view.setItemDelegate(self.question_list_delegate)
+		self.question_list_view.selectionModel().selectionChanged.connect(self.updateQuestionDetail)
 		self.add_question_btn.clicked.connect(self.addQuestion)
 		self.del_question_btn.clicked.connect(self.delQuestion)
 		self.sort_question_btn.clicked.connect(self.sortQuestion)
 		
-		self.search_input.textEdited.connect(self.updateSearch)
+		# 停止輸入一段時間後才搜尋
+		self.search_timer = QTimer(self)
+		self.search_timer.setSingleShot(True)
+		self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+		self.search_timer.timeout.connect(lambda: self.updateSearch(self.search_input.text()))
+		self.search_input.textEdited.connect(self.search_timer.start)
 		self.prev_search_btn.clicked.connect(self.prevSearch)
 		self.next_search_btn.clicked.connect(self.nextSearch)
 		
@@ -503,11 +946,11 @@ class QuestionEditor(QtWidgets.QMainWindow):
 				self.settings_window.hide()
 			if self.misleading_ans_window.isVisible():
 				self.misleading_ans_window.hide()
+			self.youtube_info_loader.cancel()
+			self.audio_downloader.stop()
 				
-			with open(YOUTUBE_CACHE_INFO_FILE, "wb") as f:
-				pickle.dump(self.youtube_cache, f)
-			with open(YOUTUBE_CACHE_AUDIO_FILE, "wb") as f:
-				pickle.dump(self.youtube_audio_cache, f)
+			# 暫存紀錄在使用時就已經寫入
+			self.cache_index.close()
 				
 			# 儲存使用者偏好資料
 			UserSetting.Save()
@@ -525,20 +968,92 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		self.modify_record.clear()
 		self.modify_record_idx = -1
 		self.save_modify_record_idx = -1
+		self.modify_record_size = 0
 	
 	def recordModify(self, path, *, before=None, after=None):
 		if type(path[-1]) is not list and before == after:
 			return
-			
+		self.pushModifyRecord(ModifyRecord(path, before, after))
+	
+	def recordPermute(self, path, order):
+		self.pushModifyRecord(PermuteRecord(path, order))
+	
+	def recordExtend(self, path, start, items):
+		self.pushModifyRecord(ExtendRecord(path, start, items))
+	
+	def pushModifyRecord(self, record):
+		for old_record in self.modify_record[(self.modify_record_idx + 1):]:
+			self.modify_record_size -= old_record.size
 		del self.modify_record[(self.modify_record_idx + 1):]
-		self.modify_record.append(ModifyRecord(path, before, after))
+		self.modify_record.append(record)
+		self.modify_record_size += record.size
 		
 		if self.save_modify_record_idx > self.modify_record_idx:
-			self.save_modify_record_idx = -1
+			self.save_modify_record_idx = UNREACHABLE_SAVE_IDX
 		self.modify_record_idx += 1
+		self.trimModifyRecord()
 		
 		self.updateWindowTitle()
 	
+	def trimModifyRecord(self):
+		# 超過記憶體上限時從最舊的紀錄開始刪除，至少保留最新的一筆
+		size_quota = UserSetting.undo_memory * 1048576
+		trim_count = 0
+		while self.modify_record_size > size_quota and trim_count < len(self.modify_record) - 1:
+			self.modify_record_size -= self.modify_record[trim_count].size
+			trim_count += 1
+		if trim_count == 0:
+			return
+			
+		del self.modify_record[:trim_count]
+		self.modify_record_idx -= trim_count
+		if self.save_modify_record_idx != UNREACHABLE_SAVE_IDX:
+			self.save_modify_record_idx -= trim_count
+			if self.save_modify_record_idx < -1:
+				self.save_modify_record_idx = UNREACHABLE_SAVE_IDX
+	
+	def getRecordTarget(self, path):
+		target = self.question_set
+		for key in path:
+			target = target[key]
+		return target
+	
+	def applyPermute(self, record, undo):
+		target = self.getRecordTarget(record.path)
+		order = record.order
+		if undo:
+			# 反向的排列
+			inverse = [ 0 ] * len(order)
+			for i, j in enumerate(order):
+				inverse[j] = i
+			order = inverse
+			
+		if record.path == ["questions"]:
+			# model 會讓選擇跟著原本的題目移動
+			self.question_list_model.permuteQuestions(order)
+		else:
+			target[:] = [ target[j] for j in order ]
+	
+	def applyExtend(self, record, undo):
+		target = self.getRecordTarget(record.path)
+		if record.path != ["questions"]:
+			if undo:
+				del target[record.start:]
+			else:
+				target.extend(record.items)
+			return
+			
+		row = self.getCurrentQuestionRow()
+		vids = [ question["vid"] for question in record.items ]
+		if undo:
+			self.question_list_model.truncateQuestions(record.start)
+			self.question_vid_set.difference_update(vids)
+		else:
+			self.question_list_model.extendQuestions(record.items)
+			self.question_vid_set.update(vids)
+		# 原本選擇的題目被移除時改選第一題
+		self.auto_select_qustion_idx = row if 0 <= row < len(target) else 0
+	
 	def undo(self):
 		if self.modify_record_idx < 0:
 			return
@@ -546,11 +1061,14 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		record = self.modify_record[self.modify_record_idx]
 		self.modify_record_idx -= 1
 		
-		if len(record.path) == 1 and record.path[0] == "questions":	 # 排序題目列表 or 匯入題庫
-			if len(record.before) != len(record.after):	 # 匯入題庫
-				for question in record.after[len(record.before):]:
-					self.question_vid_set.remove(question["vid"])
-			self.auto_select_qustion_idx = self.getNewSelectQuestionIdx(record.after, record.before)
+		if type(record) is PermuteRecord:  # 排序題目列表 or 誤導用答案
+			self.applyPermute(record, True)
+			self.updatePage()
+			return
+		if type(record) is ExtendRecord:  # 匯入題庫 or 播放清單
+			self.applyExtend(record, True)
+			self.updatePage()
+			return
 			
 		target = self.question_set
 		for i in range(len(record.path) - 1):
@@ -570,13 +1088,19 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		elif record.before == None:
 			if len(record.path) == 2 and record.path[0] == "questions":	 # undo add question
 				self.question_vid_set.remove(target[record.path[-1]]["vid"])
-			del target[record.path[-1]]
+				self.question_list_model.removeQuestion(record.path[-1])
+			else:
+				del target[record.path[-1]]
 		elif record.after == None:
 			if len(record.path) == 2 and record.path[0] == "questions":	 # undo remove question
 				self.question_vid_set.add(record.before["vid"])
-			target.insert(record.path[-1], copy.deepcopy(record.before))
+				self.question_list_model.insertQuestion(record.path[-1], record.before)
+			else:
+				target.insert(record.path[-1], record.before)
+		elif len(record.path) == 3 and record.path[0] == "questions" and record.path[-1] == "title":
+			self.question_list_model.setTitle(record.path[1], record.before)
 		else:
-			target[record.path[-1]] = copy.deepcopy(record.before)
+			target[record.path[-1]] = record.before
 			
 		self.updatePage()
 	
@@ -587,11 +1111,14 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		record = self.modify_record[self.modify_record_idx + 1]
 		self.modify_record_idx += 1
 		
-		if len(record.path) == 1 and record.path[0] == "questions":	 # 排序題目列表 or 匯入題庫
-			if len(record.before) != len(record.after):	 # 匯入題庫
-				for question in record.after[len(record.before):]:
-					self.question_vid_set.add(question["vid"])
-			self.auto_select_qustion_idx = self.getNewSelectQuestionIdx(record.before, record.after)
+		if type(record) is PermuteRecord:  # 排序題目列表 or 誤導用答案
+			self.applyPermute(record, False)
+			self.updatePage()
+			return
+		if type(record) is ExtendRecord:  # 匯入題庫 or 播放清單
+			self.applyExtend(record, False)
+			self.updatePage()
+			return
 		
 		target = self.question_set
 		for i in range(len(record.path) - 1):
@@ -611,43 +1138,93 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		elif record.after == None:
 			if len(record.path) == 2 and record.path[0] == "questions":	 # redo remove question
 				self.question_vid_set.remove(target[record.path[-1]]["vid"])
-			del target[record.path[-1]]
+				self.question_list_model.removeQuestion(record.path[-1])
+			else:
+				del target[record.path[-1]]
 		elif record.before == None:
 			if len(record.path) == 2 and record.path[0] == "questions":	 # redo add question
 				self.question_vid_set.add(record.after["vid"])
-			target.insert(record.path[-1], copy.deepcopy(record.after))
+				self.question_list_model.insertQuestion(record.path[-1], record.after)
+			else:
+				target.insert(record.path[-1], record.after)
+		elif len(record.path) == 3 and record.path[0] == "questions" and record.path[-1] == "title":
+			self.question_list_model.setTitle(record.path[1], record.after)
 		else:
-			target[record.path[-1]] = copy.deepcopy(record.after)
+			target[record.path[-1]] = record.after
 		
 		self.updatePage()
 		
 	# ====================================================================================================
 
 	def getYoutubeInfo(self, vid):
-		if vid in self.youtube_cache:
-			self.youtube_cache.move_to_end(vid)
-			return self.youtube_cache[vid]
-			
-		url = f"https://noembed.com/embed?url=https://www.youtube.com/watch?v={vid}"
-		try:
-			data = json.loads(urllib.request.urlopen(url).read().decode("utf8"))
-			if "error" in data:
-				return None
-		except:
-			return None
-			
-		info = {
-			"title": data["title"],
-			"author": data["author_name"],
-			"thumbnail": data["thumbnail_url"]
-		}
-		
-		self.youtube_cache[vid] = info
-		while len(self.youtube_cache) > UserSetting.cache_info_count:
-			self.youtube_cache.popitem(last = False)
+		info = self.cache_index.get_record(vid)
+		if info:
+			return info
 			
+		info = requestYoutubeInfo(vid)
+		if info:
+			self.addYoutubeInfoCache(vid, info)
 		return info
 	
+	def addYoutubeInfoCache(self, vid, info):
+		if self.cache_index.get_record(vid) is not None:
+			return
+		
+		self.cache_index.put_record(vid, info)
+		self.cache_index.trim_records(UserSetting.cache_info_count)
+	
+	def onYoutubeInfoLoaded(self, batch, vid, info):
+		# 被取消的批次仍可能有已送出的查詢回來，一樣寫入暫存
+		if info:
+			self.addYoutubeInfoCache(vid, info)
+	
+	def loadYoutubeInfos(self, vids, text):
+		'''
+		同時查詢多部影片的資訊並顯示進度，回傳 <vid, info>，無法取得的影片 info 為 None
+		使用者取消時立即回傳 None，不等待進行中的查詢
+		'''
+		infos = dict()
+		pending = []
+		for vid in vids:
+			info = self.cache_index.get_record(vid)
+			if info:
+				infos[vid] = info
+			else:
+				pending.append(vid)
+		if not pending:
+			return infos
+		
+		progress = QtWidgets.QProgressDialog(text, "取消", 0, len(vids), self)
+		progress.setWindowTitle(WINDOW_TITLE)
+		progress.setWindowModality(Qt.WindowModality.WindowModal)
+		progress.setAutoClose(False)
+		progress.setMinimumDuration(500)
+		progress.setValue(len(infos))
+		
+		loop = QEventLoop()
+		def onLoaded(loaded_batch, vid, info):
+			if loaded_batch != batch:
+				return
+			infos[vid] = info
+			progress.setValue(len(infos))
+			if info:
+				progress.setLabelText(f"{text}\n{info['title']}")
+			if len(infos) >= len(vids):
+				loop.quit()
+		
+		self.youtube_info_loader.loaded.connect(onLoaded)
+		progress.canceled.connect(loop.quit)
+		batch = self.youtube_info_loader.load(pending)
+		loop.exec()
+		self.youtube_info_loader.loaded.disconnect(onLoaded)
+		
+		canceled = len(infos) < len(vids)
+		if canceled:
+			self.youtube_info_loader.cancel()
+		progress.reset()
+		progress.deleteLater()
+		return None if canceled else infos
+	
 	def getYoutubePlaylist(self, url):
 		try:
 			playlist = Playlist(url)
@@ -655,39 +1232,71 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		except:
 			return None
 
-	def downloadYoutube(self, vid):
-		if vid in self.youtube_audio_cache:
-			self.youtube_audio_cache.move_to_end(vid)
+	def downloadYoutube(self, vid, priority = AudioDownloader.PRIORITY_PLAY):
+		'''已經有暫存檔時回傳 True，否則在背景開始下載'''
+		if self.cache_index.touch_file(vid) is not None:
+			return True
+		self.audio_downloader.download(vid, priority)
+		return False
+	
+	def prefetchYoutube(self, qidx):
+		# 只保留目前位置之後的預先下載，快速切換題目時不會累積大量下載
+		self.audio_downloader.cancelPrefetch()
+		question_list = self.question_set["questions"]
+		for question in question_list[qidx + 1:qidx + 1 + AUDIO_PREFETCH_COUNT]:
+			if not self.cache_index.has_file(question["vid"]):
+				self.audio_downloader.download(question["vid"], AudioDownloader.PRIORITY_PREFETCH)
+	
+	def addAudioCache(self, vid):
+		file_size = os.path.getsize(f"cache/{vid}")
+		# 預先下載完成時，正在播放的音檔可能是最舊的，不能刪除
+		self.evictAudioCache(UserSetting.cache_size * 1048576 - file_size, { self.current_detail_vid })
+		self.cache_index.add_file(vid, file_size)
+	
+	def evictAudioCache(self, size_quota, keep = ()):
+		removed, _ = self.cache_index.evict_files(max(size_quota, 0), keep)
+		for old_vid in removed:
+			# 順便清掉歌曲長度暫存
+			info = self.cache_index.get_record(old_vid, touch = False)
+			if info and info.pop("duration", None) is not None:
+				self.cache_index.put_record(old_vid, info, touch = False)
+	
+	def onAudioStreamResolved(self, vid, url):
+		if vid != self.waiting_media_vid:
+			return
+		self.waiting_media_vid = ""
+		
+		if self.cache_index.has_file(vid):
+			# 下載比預期更早完成時直接使用暫存檔
+			self.media_player.setSource(QUrl.fromLocalFile(f"cache/{vid}"))
+		elif url:
+			self.media_player.setSource(QUrl(url))
+		else:
+			self.need_reload_media = True
+			self.next_media_start_time = None
+			self.statusbar.showMessage(YOUTUBE_ERROR_MSG, 5000)
 			return
 			
-		url = f"https://www.youtube.com/watch?v={vid}"
-		ytdlp_format_options = {
-			'format': 'bestaudio',
-			'outtmpl': f'cache/{vid}',
-			'restrictfilenames': True,
-			'noplaylist': True,
-			'nocheckcertificate': True,
-			'ignoreerrors': False,
-			'logtostderr': False,
-			'quiet': True,
-			'no_warnings': True,
-			'default_search': 'auto',
-			'source_address': '0.0.0.0',  # bind to ipv4 since ipv6 addresses cause issues sometimes
-		}
-		with YoutubeDL(ytdlp_format_options) as ytdl:
-			ytdl.download(url)
+		if self.waiting_media_autoplay:
+			self.media_player.play()
+	
+	def onAudioDownloadProgress(self, vid, downloaded, total):
+		if total > 0:
+			self.statusbar.showMessage(f"下載音檔中 {vid} ({downloaded * 100 // total}%)")
+		else:
+			self.statusbar.showMessage(f"下載音檔中 {vid} ({downloaded // 1024} KB)")
+	
+	def onAudioDownloaded(self, vid, success):
+		if not success:
+			self.statusbar.showMessage(f"無法下載 {vid} 的音檔", 5000)
+			# 還在等待串流網址時，改為下次播放再重試
+			if vid == self.waiting_media_vid:
+				self.onAudioStreamResolved(vid, None)
+			return
 			
-		file_size = os.path.getsize(f"cache/{vid}")
-		size_quota = UserSetting.cache_size * 1048576
-		while self.cache_size_total + file_size > size_quota and len(self.youtube_audio_cache) > 0:
-			cache_item = self.youtube_audio_cache.popitem(last = False)
-			self.cache_size_total -= cache_item[1]
-			os.remove(f"cache/{cache_item[0]}")
-			# 順便清掉歌曲長度暫存
-			if cache_item[0] in self.youtube_cache:
-				del self.youtube_cache[cache_item[0]]["duration"]
-		self.youtube_audio_cache[vid] = file_size
-		self.cache_size_total += file_size
+		if not self.cache_index.has_file(vid):
+			self.addAudioCache(vid)
+		self.statusbar.showMessage(f"已下載 {vid} 的音檔", 3000)
 
 	def getYoutubeVideoID(self, url):
 		youtube_regex = (r'(https?://)?(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})')
@@ -697,9 +1306,18 @@ class QuestionEditor(QtWidgets.QMainWindow):
 			return youtube_match.group(6)
 		return ""
 	
+	def getCurrentQuestionRow(self):
+		return self.question_list_view.currentIndex().row()
+	
+	def setCurrentQuestionRow(self, row):
+		if 0 <= row < self.question_list_model.rowCount():
+			self.question_list_view.setCurrentIndex(self.question_list_model.index(row))
+		else:
+			self.question_list_view.setCurrentIndex(QModelIndex())
+	
 	def getCurrentQuestion(self):
 		question_list = self.question_set["questions"]
-		idx = self.question_list_widget.currentRow()
+		idx = self.getCurrentQuestionRow()
 		if idx < 0 or idx >= len(question_list):
 			return None, -1
 		return question_list[idx], idx
@@ -726,39 +1344,21 @@ class QuestionEditor(QtWidgets.QMainWindow):
 			self.setWindowTitle(f"New File - {WINDOW_TITLE}")
 		
 	def updateQuestionList(self):
+		# 列表內容由 model 逐列通知，這裡只需要更新搜尋醒目提示與題目數量
 		question_list = self.question_set["questions"]
 		self.question_list_title.setText(f"題目列表 ({len(question_list)})")
 		
-		for i in range(len(question_list)):
-			if self.question_list_widget.count() <= i:
-				item = QtWidgets.QListWidgetItem()
-				item.setFlags(item.flags() | Qt.ItemFlag.ItemIsEditable)
-				self.question_list_widget.addItem(item)
-			else:
-				item = self.question_list_widget.item(i)
-				
-			item.setText(question_list[i]["title"])
-			item.setHidden(False)
-			
-			if i in self.search_indexes:
-				if i == self.search_indexes[self.current_search_index]:
-					item.setBackground(self.highlight_select_background_brush)
-				else:
-					item.setBackground(self.highlight_background_brush)
-			else:
-				item.setBackground(self.default_background_brush)
-				
-		for i in range(len(question_list), self.question_list_widget.count()):
-			item = self.question_list_widget.item(i)
-			item.setHidden(True)
+		select_row = self.search_indexes[self.current_search_index] if self.search_indexes else -1
+		self.question_list_delegate.setHighlights(self.search_indexes, select_row)
+		self.question_list_view.viewport().update()
 		
 		if self.auto_select_qustion_idx >= 0:
 			if self.auto_select_qustion_idx >= len(question_list):
 				self.auto_select_qustion_idx = len(question_list) - 1
-			if self.question_list_widget.currentRow() != self.auto_select_qustion_idx and self.auto_select_qustion_part_idx < 0:
+			if self.getCurrentQuestionRow() != self.auto_select_qustion_idx and self.auto_select_qustion_part_idx < 0:
 				self.auto_select_qustion_part_idx = 0
 				
-			self.question_list_widget.setCurrentRow(self.auto_select_qustion_idx)
+			self.setCurrentQuestionRow(self.auto_select_qustion_idx)
 			self.auto_select_qustion_idx = -1
 	
 	def updateQuestionAnswerList(self):
@@ -828,7 +1428,10 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		vid = question["vid"]
 		if vid != self.current_detail_vid:
 			self.need_reload_media = True
+			self.waiting_media_vid = ""
+			self.next_media_start_time = None
 			self.media_player.stop()
+			self.prefetchYoutube(qidx)
 			
 			info = self.getYoutubeInfo(vid)
 			# 更新右邊資訊
@@ -890,6 +1493,7 @@ class QuestionEditor(QtWidgets.QMainWindow):
 				return
 				
 		self.question_set = copy.deepcopy(QUESTION_SET_TEMPLATE)
+		self.question_list_model.setQuestions(self.question_set["questions"])
 		self.question_vid_set.clear()
 		self.current_detail_vid = ""
 		self.file_path = None
@@ -918,6 +1522,7 @@ class QuestionEditor(QtWidgets.QMainWindow):
 				return
 		
 		self.question_set = question_set
+		self.question_list_model.setQuestions(question_set["questions"])
 		self.question_vid_set.clear()
 		for question in question_set["questions"]:
 			self.question_vid_set.add(question["vid"])
@@ -975,19 +1580,20 @@ class QuestionEditor(QtWidgets.QMainWindow):
 				self.message_box.critical(self, WINDOW_TITLE, f"題庫檔案格式有誤，錯誤代碼：{result}")
 				return
 		
-		imported = 0
-		new_question_list = self.question_set["questions"].copy()
+		question_list = self.question_set["questions"]
+		start = len(question_list)
+		import_list = []
 		for question in question_set["questions"]:
 			if question["vid"] in self.question_vid_set:
 				continue
 				
-			new_question_list.append(question)
+			import_list.append(question)
 			self.question_vid_set.add(question["vid"])
-			imported += 1
 			
+		imported = len(import_list)
 		if imported > 0:
-			self.recordModify(["questions"], before = self.question_set["questions"], after = new_question_list)
-			self.question_set["questions"] = new_question_list
+			self.recordExtend(["questions"], start, import_list)
+			self.question_list_model.extendQuestions(import_list)
 			
 			if self.search_input.text() != "":
 				self.updateSearch(self.search_input.text(), change_search_select = False)
@@ -1042,25 +1648,19 @@ class QuestionEditor(QtWidgets.QMainWindow):
 				is_playlist = True
 				
 		if is_playlist:
-			duplicate_count = 0
+			# 播放清單內重複的影片也算在重複的數量內
+			vids = [ vid for vid in dict.fromkeys(playlist) if vid not in self.question_vid_set ]
+			duplicate_count = len(playlist) - len(vids)
 			invalid_count = 0
 			real_add_list = []
-			progress = QtWidgets.QProgressDialog("匯入播放清單中...", "取消", 0, len(playlist), self)
-			progress.setWindowTitle(WINDOW_TITLE)
-			progress.setAutoClose(True)
-			progress.setMinimumDuration(500)
-			for i, vid in enumerate(playlist):
-				if progress.wasCanceled():
-					break
-					
-				progress.setValue(i)
-				QtWidgets.QApplication.processEvents()
-				
-				if vid in self.question_vid_set:
-					duplicate_count += 1
-					continue
+			
+			infos = self.loadYoutubeInfos(vids, "匯入播放清單中...")
+			# 被取消直接放棄所有匯入
+			if infos is None:
+				return
 				
-				info = self.getYoutubeInfo(vid)
+			for vid in vids:
+				info = infos[vid]
 				if not info:
 					invalid_count += 1
 					continue
@@ -1073,23 +1673,19 @@ class QuestionEditor(QtWidgets.QMainWindow):
 				
 				real_add_list.append(question)
 			
-			# 被取消直接放棄所有匯入
-			if progress.wasCanceled():
-				return
-			progress.reset()
-			
+			# 整個播放清單只記錄一次，復原時一次移除
+			if real_add_list:
+				self.recordExtend(["questions"], len(self.question_set["questions"]), real_add_list)
+			self.question_list_model.extendQuestions(real_add_list)
 			for question in real_add_list:
-				self.question_set["questions"].append(question)
 				self.question_vid_set.add(question["vid"])
-				
-				self.recordModify(["questions", len(self.question_set["questions"]) - 1], after = question)
 			
 			self.message_box.information(self, WINDOW_TITLE, f"已匯入播放清單的 {len(playlist)} 部影片\n已忽略重複的 {duplicate_count} 部影片\n共 {invalid_count} 部影片無法載入")
 		else:
 			if vid in self.question_vid_set:
 				for i, question in enumerate(self.question_set["questions"]):
 					if question["vid"] == vid:
-						self.question_list_widget.setCurrentRow(i)
+						self.setCurrentQuestionRow(i)
 						self.updateQuestionDetail()
 						break
 				return
@@ -1105,7 +1701,7 @@ class QuestionEditor(QtWidgets.QMainWindow):
 			question["parts"].append([0, 3000])	 # 預設片段是前 3 秒
 			question["candidates"].append(info["title"][:MAX_STR_LEN])
 			
-			self.question_set["questions"].append(question)
+			self.question_list_model.insertQuestion(len(self.question_set["questions"]), question)
 			self.question_vid_set.add(vid)
 			
 			self.recordModify(["questions", len(self.question_set["questions"]) - 1], after = question)
@@ -1116,7 +1712,7 @@ class QuestionEditor(QtWidgets.QMainWindow):
 			self.updateQuestionList()
 			
 		# 點到新增的那個項目上
-		self.question_list_widget.setCurrentRow(len(self.question_set["questions"]) - 1)
+		self.setCurrentQuestionRow(len(self.question_set["questions"]) - 1)
 		self.updateQuestionDetail()
 	
 	def delQuestion(self):
@@ -1124,63 +1720,52 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		if len(question_list) == 0:
 			return
 		
-		idx = self.question_list_widget.currentRow()
-		if idx >= len(question_list):
+		idx = self.getCurrentQuestionRow()
+		if idx < 0 or idx >= len(question_list):
 			return
 		
 		self.recordModify(["questions", idx], before = question_list[idx])
 		
 		self.question_vid_set.remove(question_list[idx]["vid"])
-		del question_list[idx]
+		self.question_list_model.removeQuestion(idx)
 		
-		if idx >= len(question_list):
-			self.question_list_widget.setCurrentRow(len(question_list) - 1)
+		self.setCurrentQuestionRow(min(idx, len(question_list) - 1))
 		self.part_list_widget.setCurrentRow(0)
 		
 		if self.search_input.text() != "":
 			self.updateSearch(self.search_input.text(), change_search_select = False)
 		self.updatePage()
 	
-	def getNewSelectQuestionIdx(self, before_list, after_list):
-		# 找到原本選的那個的新 index 選過去
-		ori_select_vid = before_list[self.question_list_widget.currentRow()]["vid"]
-		for i in range(len(after_list)):
-			if after_list[i]["vid"] == ori_select_vid:
-				return i
-		return 0
-	
 	def sortQuestion(self):
 		question_list = self.question_set["questions"]
 		if len(question_list) <= 1:
 			return
 		
-		sorted_list = sorted(question_list, key = lambda q: q["title"])
-		if all([question_list[i]["vid"] == sorted_list[i]["vid"] for i in range(len(question_list))]):
+		# 只記錄排序前後的對應關係
+		order = sorted(range(len(question_list)), key = lambda i: question_list[i]["title"])
+		if all(i == order[i] for i in range(len(order))):
 			return
 		
-		self.question_list_widget.setCurrentRow(self.getNewSelectQuestionIdx(question_list, sorted_list))
-		
-		self.recordModify(["questions"], before=question_list, after=sorted_list)
-		self.question_set["questions"] = sorted_list
+		self.recordPermute(["questions"], order)
+		# model 會讓選擇跟著原本的題目移動
+		self.question_list_model.permuteQuestions(order)
 		self.updatePage()
 	
-	def editQuestionTitle(self, item):
-		# 空字串不接受，顯示回原本內容
-		if len(item.text()) == 0:
-			self.updateQuestionList()
+	def editQuestionTitle(self, qidx, text):
+		# 空字串不接受，model 沒有被修改，畫面會維持原本內容
+		if len(text) == 0:
 			return
 		
-		qidx = self.question_list_widget.row(item)
 		if qidx < 0 or qidx >= len(self.question_set["questions"]):
 			return
 			
-		newText = item.text()[:MAX_STR_LEN]
+		newText = text[:MAX_STR_LEN]
 		question = self.question_set["questions"][qidx]
 		if question["title"] == newText:
 			return
 			
 		self.recordModify(["questions", qidx, "title"], before = question["title"], after = newText)
-		question["title"] = newText
+		self.question_list_model.setTitle(qidx, newText)
 		
 		if self.search_input.text() != "":
 			self.updateSearch(self.search_input.text(), change_search_select = False)
@@ -1188,66 +1773,54 @@ class QuestionEditor(QtWidgets.QMainWindow):
 			self.updateQuestionList()
 		
 	def updateSearch(self, text, *, change_search_select = True):
-		question_list = self.question_set["questions"]
-		current_select = self.question_list_widget.currentRow()
+		self.search_timer.stop()
+		current_select = self.getCurrentQuestionRow()
 		
-		self.search_indexes = []
+		# 索引回傳的結果已經依照列排序
+		self.search_indexes = self.question_list_model.title_index.search(text)
 		if change_search_select:
-			self.current_search_index = -1
-			
-		is_clear_search = text == ""
-		if not is_clear_search:
-			lower_text = text.lower()
-			for i in range(len(question_list)):
-				if question_list[i]["title"].lower().find(lower_text) >= 0:
-					self.search_indexes.append(i)
-					# 自動跳到當前選擇之後的第一個搜尋結果
-					if change_search_select and self.current_search_index < 0 and i >= current_select:
-						self.current_search_index = len(self.search_indexes) - 1
-			
-		# 當前選擇之後沒有符合的搜尋就跳回第一個搜尋結果
-		if change_search_select and self.current_search_index < 0:
-			self.current_search_index = 0
+			# 自動跳到當前選擇之後的第一個搜尋結果，沒有的話跳回第一個搜尋結果
+			self.current_search_index = bisect.bisect_left(self.search_indexes, current_select)
+			if self.current_search_index >= len(self.search_indexes):
+				self.current_search_index = 0
 		# 沒有自動重選時，有可能項目變動導致原本選的項目不存在了
 		if self.current_search_index >= len(self.search_indexes):
 			self.current_search_index = 0
 		
-		if is_clear_search:
+		if text == "":
 			self.search_count_label.setText("-/-")
-			if change_search_select:
-				self.question_list_widget.scrollToItem(self.question_list_widget.item(current_select))
+			if change_search_select and current_select >= 0:
+				self.question_list_view.scrollTo(self.question_list_model.index(current_select))
 		else:
 			self.search_count_label.setText(f"{self.current_search_index + 1}/{len(self.search_indexes)}")
 			if change_search_select and len(self.search_indexes) > 0:
-				self.question_list_widget.scrollToItem(self.question_list_widget.item(self.search_indexes[self.current_search_index]))
+				self.question_list_view.scrollTo(self.question_list_model.index(self.search_indexes[self.current_search_index]))
 			
 		self.updateQuestionList()
-		
-	def prevSearch(self):
-		if len(self.search_indexes) > 1:
-			self.question_list_widget.item(self.search_indexes[self.current_search_index]).setBackground(self.highlight_background_brush)
-			self.current_search_index -= 1
-			if self.current_search_index < 0:
-				self.current_search_index = len(self.search_indexes) - 1
-			self.question_list_widget.item(self.search_indexes[self.current_search_index]).setBackground(self.highlight_select_background_brush)
+	
+	def moveSearch(self, step):
+		# 還在等待搜尋時先完成搜尋
+		if self.search_timer.isActive():
+			self.updateSearch(self.search_input.text())
 			
+		if len(self.search_indexes) > 1:
+			self.current_search_index = (self.current_search_index + step) % len(self.search_indexes)
 			self.search_count_label.setText(f"{self.current_search_index + 1}/{len(self.search_indexes)}")
+			# 只需要重畫原本與新的醒目提示列
+			previous_row = self.question_list_delegate.select_row
+			select_row = self.search_indexes[self.current_search_index]
+			self.question_list_delegate.select_row = select_row
+			self.question_list_view.update(self.question_list_model.index(previous_row))
+			self.question_list_view.update(self.question_list_model.index(select_row))
 		
 		if len(self.search_indexes) > 0:
-			self.question_list_widget.scrollToItem(self.question_list_widget.item(self.search_indexes[self.current_search_index]))
+			self.question_list_view.scrollTo(self.question_list_model.index(self.search_indexes[self.current_search_index]))
 		
-	def nextSearch(self):
-		if len(self.search_indexes) > 1:
-			self.question_list_widget.item(self.search_indexes[self.current_search_index]).setBackground(self.highlight_background_brush)
-			self.current_search_index += 1
-			if self.current_search_index >= len(self.search_indexes):
-				self.current_search_index = 0
-			self.question_list_widget.item(self.search_indexes[self.current_search_index]).setBackground(self.highlight_select_background_brush)
-			
-			self.search_count_label.setText(f"{self.current_search_index + 1}/{len(self.search_indexes)}")
+	def prevSearch(self):
+		self.moveSearch(-1)
 		
-		if len(self.search_indexes) > 0:
-			self.question_list_widget.scrollToItem(self.question_list_widget.item(self.search_indexes[self.current_search_index]))
+	def nextSearch(self):
+		self.moveSearch(1)
 		
 	# ====================================================================================================
 	
@@ -1323,12 +1896,12 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		if len(ori_list) <= 1:
 			return None
 			
-		sorted_list = sorted(ori_list)
-		if all([ori_list[i] == sorted_list[i] for i in range(len(sorted_list))]):
+		order = sorted(range(len(ori_list)), key = lambda i: ori_list[i])
+		if all(i == order[i] for i in range(len(order))):
 			return None
 		
-		self.recordModify(["misleadings"], before=ori_list, after=sorted_list)
-		self.question_set["misleadings"] = sorted_list
+		self.recordPermute(["misleadings"], order)
+		ori_list[:] = [ ori_list[i] for i in order ]
 		
 		return self.question_set["misleadings"]
 	
@@ -1338,7 +1911,11 @@ class QuestionEditor(QtWidgets.QMainWindow):
 	
 	# ====================================================================================================
 	
-	def checkDownloadBeforePlay(self, start_time = None):
+	def checkDownloadBeforePlay(self, start_time = None, *, autoplay = True):
+		'''
+		確認當前題目的音檔已經載入播放器，回傳是否可以直接操作播放器
+		還沒有暫存檔時會在背景下載，並在取得串流網址後從 start_time 開始播放 (autoplay 為 False 時只跳到該時間)
+		'''
 		if self.need_reload_media:
 			self.need_reload_media = False
 			question, qidx = self.getCurrentQuestion()
@@ -1346,21 +1923,36 @@ class QuestionEditor(QtWidgets.QMainWindow):
 				return
 			
 			vid = question["vid"]
-			self.downloadYoutube(vid)
-			self.media_player.setSource(QUrl.fromLocalFile(f"cache/{vid}"))
-			if start_time != None:
-				self.next_media_start_time = start_time
-				self.media_player.play()
+			self.next_media_start_time = start_time
+			if self.downloadYoutube(vid):
+				self.media_player.setSource(QUrl.fromLocalFile(f"cache/{vid}"))
+				if start_time != None and autoplay:
+					self.media_player.play()
+				return True
+				
+			# 還沒下載過的音檔先等待取得串流網址，取得後再自動播放
+			self.waiting_media_vid = vid
+			self.waiting_media_autoplay = autoplay
+			self.statusbar.showMessage(f"正在載入 {vid} 的音訊...")
+			return False
+		elif self.waiting_media_vid:
+			# 等待中又操作播放器時，以最後一次的操作為準
+			self.next_media_start_time = start_time
+			self.waiting_media_autoplay = autoplay
+			return False
 		else:
 			if start_time != None:
-				self.media_player.play()
+				if autoplay:
+					self.media_player.play()
 				self.media_player.setPosition(start_time)
+			return True
 
 	def playPause(self):
-		# 先下載並載入音檔
-		self.checkDownloadBeforePlay()
 		# 手動按播放或暫停時中斷試聽
 		self.auto_pause_time = -1
+		# 先載入音檔，還沒載入完成時會自動開始播放
+		if not self.checkDownloadBeforePlay():
+			return
 		
 		if self.media_player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
 			self.media_player.pause()
@@ -1377,22 +1969,24 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		self.auto_pause_time = question_part[1]
 	
 	def seekSlightlyLeft(self):
-		# 先下載並載入音檔
-		self.checkDownloadBeforePlay()
 		# 微調時間軸時中斷試聽
 		self.auto_pause_time = -1
 		
 		target_time = max(self.position_slider.value() - 50, 0)
+		# 先載入音檔，還沒載入完成時會在載入後跳到指定時間
+		if not self.checkDownloadBeforePlay(target_time, autoplay = False):
+			return
 		self.media_player.setPosition(target_time)
 		self.media_player.pause()
 	
 	def seekSlightlyRight(self):
-		# 先下載並載入音檔
-		self.checkDownloadBeforePlay()
 		# 微調時間軸時中斷試聽
 		self.auto_pause_time = -1
 		
 		target_time = min(self.position_slider.value() + 50, self.position_slider.maximum())
+		# 先載入音檔，還沒載入完成時會在載入後跳到指定時間
+		if not self.checkDownloadBeforePlay(target_time, autoplay = False):
+			return
 		self.media_player.setPosition(target_time)
 		self.media_player.pause()
 	
@@ -1401,10 +1995,11 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		if not question_part:
 			return
 			
-		# 先下載並載入音檔
-		self.checkDownloadBeforePlay()
 		# 跳到指定點時中斷試聽
 		self.auto_pause_time = -1
+		# 先載入音檔，還沒載入完成時會在載入後跳到指定時間
+		if not self.checkDownloadBeforePlay(question_part[0], autoplay = False):
+			return
 		
 		self.media_player.setPosition(question_part[0])
 		self.media_player.pause()
@@ -1414,10 +2009,11 @@ class QuestionEditor(QtWidgets.QMainWindow):
 		if not question_part:
 			return
 			
-		# 先下載並載入音檔
-		self.checkDownloadBeforePlay()
 		# 跳到指定點時中斷試聽
 		self.auto_pause_time = -1
+		# 先載入音檔，還沒載入完成時會在載入後跳到指定時間
+		if not self.checkDownloadBeforePlay(question_part[1], autoplay = False):
+			return
 		
 		self.media_player.setPosition(question_part[1])
 		self.media_player.pause()
@@ -1429,8 +2025,8 @@ class QuestionEditor(QtWidgets.QMainWindow):
 			self.play_button.setText("▶")
 	
 	def mediaStatusChanged(self, newState):
-		# 加載完自動播放指定位置
-		if newState == QMediaPlayer.MediaStatus.BufferedMedia:
+		# 加載完自動播放指定位置，串流只有 LoadedMedia 時也要能跳到指定位置
+		if newState in (QMediaPlayer.MediaStatus.LoadedMedia, QMediaPlayer.MediaStatus.BufferedMedia):
 			if self.next_media_start_time != None:
 				self.media_player.setPosition(self.next_media_start_time)
 				self.next_media_start_time = None
@@ -1454,8 +2050,11 @@ class QuestionEditor(QtWidgets.QMainWindow):
 			return
 		
 		vid = question["vid"]
-		# 更新 cache 音樂長度
-		self.youtube_cache[vid]["duration"] = duration
+		# 更新 cache 音樂長度，不影響影片資訊的使用順序
+		info = self.cache_index.get_record(vid, touch = False)
+		if info and info.get("duration") != duration:
+			info["duration"] = duration
+			self.cache_index.put_record(vid, info, touch = False)
 		
 		# 不特別限制使用者設定超過最大的時間，不然還要考慮切歌的時候會不會被上限修正影響到
 		# new_max_time = getQTime(duration)
@@ -1,18 +1,43 @@
 import discord
 import asyncio
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
-import os
+import os, time
+import argparse, multiprocessing
 
-# 需依賴 ffmpeg 程式 (目前僅支援 windows)
 from shutil import which
 import urllib.request
 import zipfile
-if which("ffmpeg") == None or which("ffprobe") == None:
+
+from cogs import song_guesser
+from cogs.metrics import metrics_options
+from cogs.loop_watchdog import loop_watchdog_options
+
+
+
+intents = discord.Intents.default()
+intents.message_content = True
+
+with open("BOT_TOKEN", "r") as f:
+	BOT_TOKEN = f.read()
+
+supervisor_options = {
+	'restart_delay': 5,			# 秒，程序結束後第一次重新啟動前的等待時間，連續失敗時每次加倍
+	'max_restart_delay': 300,	# 秒，重新啟動等待時間的上限
+	'stable_time': 60,			# 秒，執行超過此時間才結束的程序視為正常運作過，重新計算等待時間
+	'max_fast_failures': 5,		# 連續在 stable_time 內結束的次數，達到上限時停止所有程序
+}
+
+def ensure_ffmpeg():
+	# 需依賴 ffmpeg 程式 (目前僅支援 windows)
+	# 只在主程序執行一次，子程序與程序池不需要重複檢查或同時下載
+	if which("ffmpeg") != None and which("ffprobe") != None:
+		return
+		
 	last_percent = "0%"
 	print(f"ffmpeg not found, downloading... {last_percent}", end="", flush=True)
 	def update_progress(block_num, block_size, total_size):
-		global last_percent
+		nonlocal last_percent
 		percent = f"{int(block_num * block_size * 100 / total_size)}%"
 		print("\b" * len(last_percent), end="")
 		print(percent, end="")
@@ -22,7 +47,7 @@ if which("ffmpeg") == None or which("ffprobe") == None:
 		urllib.request.urlretrieve("https://www.gyan.dev/ffmpeg/builds/ffmpeg-release-essentials.zip", "ffmpeg.zip", update_progress)
 	except Exception as e:
 		print(f"\nError while downloading ffmpeg! ({e})")
-		exit(1)
+		raise SystemExit(1)
 		
 	print("\nffmpeg downloaded, extracting files...")
 	with zipfile.ZipFile("ffmpeg.zip", "r") as zip:
@@ -33,38 +58,97 @@ if which("ffmpeg") == None or which("ffprobe") == None:
 				
 	os.remove("ffmpeg.zip")
 	print("ffmpeg install finished, starting bot...")
-	
-from cogs import song_guesser
 
+def create_bot(shard_ids=None, shard_count=None):
+	if shard_ids is None:
+		bot = commands.Bot(command_prefix='.', intents=intents)
+	else:
+		bot = commands.AutoShardedBot(command_prefix='.', intents=intents, shard_ids=shard_ids, shard_count=shard_count)
+	
+	@bot.event
+	async def on_ready():
+		print(f'Logged in as {bot.user} (ID: {bot.user.id})')
+		if shard_ids is not None:
+			print(f'Shards: {shard_ids} / {shard_count}')
+		print('------')
+		
+	return bot
 
+async def main(shard_ids=None, shard_count=None):
+	bot = create_bot(shard_ids, shard_count)
+	await bot.load_extension('cogs.song_guesser')
+	await bot.start(BOT_TOKEN)
 
-intents = discord.Intents.default()
-intents.message_content = True
+def run_worker(worker_idx, shard_ids, shard_count, debug_loop):
+	# windows 上子程序不會執行 __main__ 區塊，設定需要由參數傳入
+	loop_watchdog_options["debug"] = debug_loop
+	# 每個程序的統計資料各自獨立，使用不同的連接埠提供
+	if metrics_options["port"]:
+		metrics_options["port"] += worker_idx
+	try:
+		asyncio.run(main(shard_ids, shard_count))
+	except KeyboardInterrupt:
+		pass
 
-bot = commands.Bot(command_prefix='.', intents=intents)
+def supervise(worker_count, shard_count, debug_loop=False):
+	# 將所有分片平均分給各個程序，程序意外結束時以逐漸拉長的間隔重新啟動
+	# 回傳結束代碼，程序一啟動就反覆結束 (例如 token 錯誤) 時放棄並回傳 1
+	shard_ranges = [ list(range(shard_count))[i::worker_count] for i in range(worker_count) ]
+	workers = [ None ] * worker_count
+	started = [ 0.0 ] * worker_count		# 每個程序最後一次啟動的時間
+	failures = [ 0 ] * worker_count		# 每個程序連續結束的次數
+	next_start = [ 0.0 ] * worker_count	# 每個程序可以重新啟動的時間
+	try:
+		while True:
+			now = time.monotonic()
+			for i, shard_ids in enumerate(shard_ranges):
+				worker = workers[i]
+				if worker is not None:
+					if worker.is_alive():
+						continue
+					if now - started[i] >= supervisor_options["stable_time"]:
+						failures[i] = 0
+					failures[i] += 1
+					if failures[i] >= supervisor_options["max_fast_failures"]:
+						print(f"Worker {i} exited with code {worker.exitcode} {failures[i]} times in a row, giving up")
+						return 1
+						
+					delay = min(supervisor_options["restart_delay"] * 2 ** (failures[i] - 1), supervisor_options["max_restart_delay"])
+					print(f"Worker {i} exited with code {worker.exitcode}, restarting in {delay} seconds...")
+					workers[i] = None
+					next_start[i] = now + delay
+					
+				if now < next_start[i]:
+					continue
+				worker = multiprocessing.Process(target=run_worker, args=(i, shard_ids, shard_count, debug_loop), name=f"SongGuesser-{i}")
+				worker.start()
+				workers[i] = worker
+				started[i] = now
+			time.sleep(1)
+	finally:
+		for worker in workers:
+			if worker is not None and worker.is_alive():
+				worker.terminate()
+		for worker in workers:
+			if worker is not None:
+				worker.join()
 
-with open("BOT_TOKEN", "r") as f:
-	BOT_TOKEN = f.read()
+# 音訊處理使用子程序，windows 上子程序會重新載入此檔案，必須避免重複啟動機器人
+if __name__ == "__main__":
+	multiprocessing.freeze_support()
 	
-@bot.event
-async def on_ready():
-	print(f'Logged in as {bot.user} (ID: {bot.user.id})')
-	print('------')
-	auto_leave_voice_channel.start()
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--workers", type=int, default=0, help="以多個程序執行機器人，每個程序負責一部分的分片")
+	parser.add_argument("--shards", type=int, default=0, help="分片總數，預設與程序數量相同")
+	parser.add_argument("--debug-loop", action="store_true", help="開啟 asyncio 的 debug 模式，記錄 cogs 內執行過久的 callback")
+	args = parser.parse_args()
+	loop_watchdog_options["debug"] = args.debug_loop
+	ensure_ffmpeg()
 	
-@tasks.loop(seconds=30)
-async def auto_leave_voice_channel():
-	song_guesser = bot.get_cog("SongGuesser")
-	await song_guesser.check_auto_stop()
-
-async def load():
-	await bot.load_extension('cogs.song_guesser')
-
-async def main():
-	await load()
-	await bot.start(BOT_TOKEN)
-
-try:
-	asyncio.run(main())
-except KeyboardInterrupt:
-	print("Bot disconnected!")
\ No newline at end of file
+	try:
+		if args.workers > 0:
+			raise SystemExit(supervise(args.workers, max(args.shards, args.workers), args.debug_loop))
+		else:
+			asyncio.run(main())
+	except KeyboardInterrupt:
+		print("Bot disconnected!")
\ No newline at end of file